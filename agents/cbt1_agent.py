@@ -1,16 +1,27 @@
-import os, json, multiprocessing, difflib 
-from typing import AsyncGenerator, Literal, List
-from pydantic import BaseModel
-from llama_cpp import Llama
+import os, json, multiprocessing, difflib
+from typing import AsyncGenerator, TYPE_CHECKING
+from agents.registry import get_shared_model
+from llm.backend import get_stage_backend
+from llm.kv_cache import kv_cache_kwargs
+from llm.ngram import repetition_params
+from shared.logger import logger, slog
+from shared.state import AgentState
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
 
 # ✅ CBT1 모델 캐시
 LLM_CBT1_INSTANCE = {}
 
-def load_cbt1_model(model_path: str) -> Llama:
+def load_cbt1_model(model_path: str) -> "Llama":
     global LLM_CBT1_INSTANCE
+    shared = get_shared_model("cbt1", model_path)  # ✅ 모델 호스트/LoRA 모드 사용 시 공유 핸들 반환
+    if shared is not None:
+        return shared
     if model_path not in LLM_CBT1_INSTANCE:
-        print(f"📦 CBT1 모델 로딩: {model_path}", flush=True)
+        logger.info("📦 CBT1 모델 로딩: %s", model_path)
         NUM_THREADS = max(1, multiprocessing.cpu_count() - 1)
+        from llama_cpp import Llama  # ✅ 실제 로딩 시점에만 임포트
         LLM_CBT1_INSTANCE[model_path] = Llama(
             model_path=model_path,
             n_ctx=1024,
@@ -26,19 +37,12 @@ def load_cbt1_model(model_path: str) -> Llama:
             low_vram=True,
             use_mlock=False,
             verbose=False,
+            **kv_cache_kwargs("cbt1"),
             chat_format="llama-3",
             stop=["<|im_end|>"]
         )
     return LLM_CBT1_INSTANCE[model_path]
 
-# ✅ 상태 모델
-class AgentState(BaseModel):
-    stage: Literal["cbt1", "cbt2"]
-    question: str
-    response: str
-    history: List[str]
-    turn: int
-
 def get_cbt1_prompt(enhanced=False) -> str:
     prompt = (
         "당신은 자동사고를 탐색하는 따뜻하고 이성적인 CBT 상담자입니다.\n"
@@ -59,7 +63,7 @@ async def stream_cbt1_reply(state: AgentState, model_path: str) -> AsyncGenerato
     user_input = state.question.strip()
     history = state.history or []
 
-    print(f"🧠 [CBT1 현재 턴: {state.turn}]")
+    slog("agent", "🧠 [CBT1 현재 턴: %d]", state.turn, stage="cbt1", session=state.session_id)
 
     if not user_input:
         fallback = "떠오른 생각이나 감정이 있다면 편하게 이야기해 주세요."
@@ -75,35 +79,33 @@ async def stream_cbt1_reply(state: AgentState, model_path: str) -> AsyncGenerato
         return
 
     try:
-        llm = load_cbt1_model(model_path)
-        enhanced = any(s == "cbt1" and d for s, d in getattr(state, "drift_trace", [])[-5:])
-        system_prompt = get_cbt1_prompt(enhanced)
-        messages = [{"role": "system", "content": system_prompt}]
-        for i in range(0, len(history), 2):
-            if i + 1 < len(history):
-                messages.append({"role": "user", "content": history[i]})
-                messages.append({"role": "assistant", "content": history[i + 1]})
-        messages.append({"role": "user", "content": user_input})
+        backend = get_stage_backend("cbt1", model_path, load_cbt1_model)
+        enhanced = any(s == "cbt1" and d for s, d in state.drift_trace.recent(5))
+        messages = state.chat_messages(get_cbt1_prompt(enhanced), user_input)
 
         full_response = ""
         first_token_sent = False
-        for chunk in llm.create_chat_completion(messages=messages, stream=True):
-            token = chunk["choices"][0]["delta"].get("content", "")
-            if token:
-                full_response += token
-                if not first_token_sent:
-                    yield b"\n"
-                    first_token_sent = True
-                yield token.encode("utf-8")
+        # ✅ 이전 응답/사용자 입력의 n-gram을 디코딩 중에 억제 (생성 후 문장 덧붙이기 대신)
+        avoid = repetition_params(backend, state.session_id, history, user_input)
+        for token in backend.stream_chat(messages, **avoid):
+            full_response += token
+            if not first_token_sent:
+                yield b"\n"
+                first_token_sent = True
+            yield token.encode("utf-8")
 
         reply = full_response.strip() or "좋아요. 조금 더 구체적으로 이야기해주실 수 있을까요?"
-        state.response = reply
 
-        for past in history[-10:]:
-            if isinstance(past, str):
-                if difflib.SequenceMatcher(None, reply[:40], past[:40]).ratio() > 0.8:
-                    reply += " 그랬군요, 그게 정말 사실일까요? 왜곡되지는 않았나요?"
-                    break
+        # ✅ logits processor를 못 붙인 백엔드(offload/transformers)는 기존 사후 검사 유지 (덧붙인 문장도 스트리밍)
+        if not avoid:
+            for past in history[-10:]:
+                if isinstance(past, str):
+                    if difflib.SequenceMatcher(None, reply[:40], past[:40]).ratio() > 0.8:
+                        extra = " 그랬군요, 그게 정말 사실일까요? 왜곡되지는 않았나요?"
+                        reply += extra
+                        yield extra.encode("utf-8")
+                        break
+        state.response = reply
 
         next_turn = state.turn + 1
         next_stage = "cbt2" if next_turn >= 5 else "cbt1"
@@ -121,7 +123,7 @@ async def stream_cbt1_reply(state: AgentState, model_path: str) -> AsyncGenerato
         }, ensure_ascii=False).encode("utf-8")
 
     except Exception as e:
-        print(f"⚠️ CBT1 오류: {e}", flush=True)
+        logger.warning("⚠️ CBT1 오류: %s", e, extra={"stage": "cbt1", "session": state.session_id})
         fallback = "죄송해요. 다시 말씀해 주시겠어요?"
         state.response = fallback
         yield fallback.encode("utf-8")
@@ -1,15 +1,26 @@
 import os, json, multiprocessing, difflib, re, asyncio
-from typing import AsyncGenerator, List
-from pydantic import BaseModel
-from llama_cpp import Llama
+from typing import AsyncGenerator, List, TYPE_CHECKING
+from agents.registry import get_shared_model
+from llm.backend import get_stage_backend
+from llm.kv_cache import kv_cache_kwargs
+from llm.ngram import repetition_params
+from llm.stopping import get_stage_stopper, pace, stream_until
+from shared.state import AgentState
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
 
 # ✅ 모델 캐시
 LLM_CBT2_INSTANCE = {}
 
-def load_cbt2_model(model_path: str) -> Llama:
+def load_cbt2_model(model_path: str) -> "Llama":
     global LLM_CBT2_INSTANCE
+    shared = get_shared_model("cbt2", model_path)  # ✅ 모델 호스트/LoRA 모드 사용 시 공유 핸들 반환
+    if shared is not None:
+        return shared
     if model_path not in LLM_CBT2_INSTANCE:
         NUM_THREADS = max(1, multiprocessing.cpu_count() - 1)
+        from llama_cpp import Llama  # ✅ 실제 로딩 시점에만 임포트
         LLM_CBT2_INSTANCE[model_path] = Llama(
             model_path=model_path,
             n_ctx=1024,
@@ -23,17 +34,12 @@ def load_cbt2_model(model_path: str) -> Llama:
             low_vram=True,
             use_mlock=False,
             verbose=False,
+            **kv_cache_kwargs("cbt2"),
             chat_format="llama-3",
             stop=["<|im_end|>", "---END_STAGE---"]
         )
     return LLM_CBT2_INSTANCE[model_path]
 
-class AgentState(BaseModel):
-    question: str
-    response: str
-    history: List[str]
-    turn: int
-
 def get_cbt2_prompt(enhanced=False) -> str:
     prompt = (
         "당신은 인지 재구조화를 도와주는 따뜻한 CBT 상담자입니다.\n"
@@ -49,7 +55,7 @@ def get_cbt2_prompt(enhanced=False) -> str:
         )
     return prompt
 
-# ✅ 중복 질문 필터링
+# ✅ 중복 질문 필터링 (logits processor를 붙일 수 없는 백엔드용 사후 검사)
 def is_similar_to_past_response(reply: str, history: List[str]) -> bool:
     recent_responses = [h for i, h in enumerate(history[-10:]) if i % 2 == 1]
     for past in recent_responses:
@@ -81,40 +87,42 @@ async def stream_cbt2_reply(state: AgentState, model_path: str) -> AsyncGenerato
         return
 
     try:
-        llm = load_cbt2_model(model_path)
-        enhanced = any(s == "cbt2" and d for s, d in getattr(state, "drift_trace", [])[-5:])
-        system_prompt = get_cbt2_prompt(enhanced)
-        messages = [{"role": "system", "content": system_prompt}]
-        for i in range(0, len(history), 2):
-            if i + 1 < len(history):
-                messages.append({"role": "user", "content": history[i]})
-                messages.append({"role": "assistant", "content": history[i + 1]})
-        messages.append({"role": "user", "content": user_input})
+        backend = get_stage_backend("cbt2", model_path, load_cbt2_model)
+        enhanced = any(s == "cbt2" and d for s, d in state.drift_trace.recent(5))
+        # 첫 턴(turn 0)은 이전 단계 대화 없이 시작
+        messages = state.chat_messages(get_cbt2_prompt(enhanced), user_input, last=None if state.turn > 0 else 0)
 
+        # ✅ 첫 문장이 끝나는 즉시 디코딩 중단 (버려질 토큰을 생성하지 않음)
+        stopper = get_stage_stopper("cbt2")
         full_response = ""
         first_token_sent = False
-        for chunk in llm.create_chat_completion(messages=messages, stream=True):
-            await asyncio.sleep(0.015)
-            token = chunk["choices"][0]["delta"].get("content", "")
-            if token:
-                full_response += token
-                if not first_token_sent:
-                    yield b"\n"
-                    first_token_sent = True
-                yield token.encode("utf-8")
+        # ✅ 이전 질문 반복/사용자 말 따라 하기는 디코딩 중에 n-gram 감점으로 억제
+        avoid = repetition_params(backend, state.session_id, history, user_input)
+        for token in stream_until(backend.stream_chat(messages, **avoid), stopper):
+            await pace(0.015)
+            full_response += token
+            if not first_token_sent:
+                yield b"\n"
+                first_token_sent = True
+            yield token.encode("utf-8")
 
         full_response = full_response.strip()
-        first_sentence = re.split(r"[.?!]", full_response)[0].strip()
+        first_sentence = stopper.text.strip()
         if not first_sentence.endswith("?"):
             first_sentence += "?"
 
         first_sentence = first_sentence.replace("preset_questions", "").replace("{", "").replace("}", "")
 
-        if is_similar_to_past_response(first_sentence, history) or contains_user_echo(first_sentence, user_input):
+        # ✅ offload/transformers 백엔드는 디코딩 중 억제가 없으므로 기존 검사로 질문을 덧붙임
+        if not avoid and (is_similar_to_past_response(first_sentence, history) or contains_user_echo(first_sentence, user_input)):
             first_sentence += " 이 생각은 어디서 비롯된 걸까요?"
 
         state.response = first_sentence
 
+        # ✅ 스트리밍된 텍스트와 trailer의 response가 같도록 나머지 부분만 이어서 전송
+        if first_sentence.startswith(full_response):
+            yield first_sentence[len(full_response):].encode("utf-8")
+
         next_turn = state.turn + 1
         next_stage = "cbt3" if next_turn >= 5 else "cbt2"
         updated_history = history + [user_input, first_sentence]
@@ -134,7 +142,7 @@ async def stream_cbt2_reply(state: AgentState, model_path: str) -> AsyncGenerato
         state.response = fallback
         for ch in fallback:
             yield ch.encode("utf-8")
-            await asyncio.sleep(0.02)
+            await pace(0.02)
         yield b"\n---END_STAGE---\n" + json.dumps({
             "next_stage": "cbt2",
             "turn": state.turn,
@@ -1,15 +1,26 @@
 import os, json, multiprocessing, re, asyncio
-from typing import AsyncGenerator, Literal, List
-from pydantic import BaseModel, Field
-from llama_cpp import Llama
+from typing import AsyncGenerator, TYPE_CHECKING
+from agents.registry import get_shared_model
+from llm.backend import get_stage_backend
+from llm.kv_cache import kv_cache_kwargs
+from llm.stopping import get_stage_stopper, pace, stream_until
+from shared.logger import logger
+from shared.state import AgentState
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
 
 LLM_CBT3_INSTANCE = {}
 
-def load_cbt3_model(model_path: str) -> Llama:
+def load_cbt3_model(model_path: str) -> "Llama":
     global LLM_CBT3_INSTANCE
+    shared = get_shared_model("cbt3", model_path)  # ✅ 모델 호스트/LoRA 모드 사용 시 공유 핸들 반환
+    if shared is not None:
+        return shared
     if model_path not in LLM_CBT3_INSTANCE:
-        print("🚀 CBT3 모델 최초 로딩 중...", flush=True)
+        logger.info("🚀 CBT3 모델 최초 로딩 중...")
         NUM_THREADS = max(1, multiprocessing.cpu_count() - 1)
+        from llama_cpp import Llama  # ✅ 실제 로딩 시점에만 임포트
         LLM_CBT3_INSTANCE[model_path] = Llama(
             model_path=model_path,
             n_ctx=1024,
@@ -25,20 +36,12 @@ def load_cbt3_model(model_path: str) -> Llama:
             low_vram=True,
             use_mlock=False,
             verbose=False,
+            **kv_cache_kwargs("cbt3"),
             chat_format="llama-3",
             stop=["<|im_end|>", "\n\n"]
         )
     return LLM_CBT3_INSTANCE[model_path]
 
-class AgentState(BaseModel):
-    stage: Literal["cbt3", "end"]
-    question: str
-    response: str
-    history: List[str]
-    turn: int
-    preset_questions: List[str] = Field(default_factory=list)
-    drift_trace: List = Field(default_factory=list)
-
 # ✅ 시스템 프롬프트
 
 def get_cbt3_prompt(enhanced=False) -> str:
@@ -58,38 +61,34 @@ def get_cbt3_prompt(enhanced=False) -> str:
 # ✅ CBT3 멀티턴 응답 생성기
 async def stream_cbt3_reply(state: AgentState, model_path: str) -> AsyncGenerator[bytes, None]:
     try:
-        llm = load_cbt3_model(model_path)
-        enhanced = any(s == "cbt3" and d for s, d in getattr(state, "drift_trace", [])[-5:])
-        prompt = get_cbt3_prompt(enhanced)
-
-        messages = [{"role": "system", "content": prompt}]
-
-        for i in range(0, len(state.history), 2):
-            if i + 1 < len(state.history):
-                messages.append({"role": "user", "content": state.history[i]})
-                messages.append({"role": "assistant", "content": state.history[i + 1]})
-
-        messages.append({"role": "user", "content": state.question})
+        backend = get_stage_backend("cbt3", model_path, load_cbt3_model)
+        enhanced = any(s == "cbt3" and d for s, d in state.drift_trace.recent(5))
+        messages = state.chat_messages(get_cbt3_prompt(enhanced))
 
+        # ✅ 질문이 완성되는 즉시 디코딩 중단
+        stopper = get_stage_stopper("cbt3")
         full_response = ""
         first_token_sent = False
 
-        for chunk in llm.create_chat_completion(messages=messages, stream=True):
-            await asyncio.sleep(0.015)
-            token = chunk["choices"][0]["delta"].get("content", "")
-            if token:
-                full_response += token
-                if not first_token_sent:
-                    yield b"\n"
-                    first_token_sent = True
-                yield token.encode("utf-8")
+        for token in stream_until(backend.stream_chat(messages), stopper):
+            await pace(0.015)
+            full_response += token
+            if not first_token_sent:
+                yield b"\n"
+                first_token_sent = True
+            yield token.encode("utf-8")
 
-        reply = full_response.strip()
-        if not reply.endswith("?"):
+        reply = stopper.text.strip()
+        if not reply.endswith(("?", "？")):
             reply = reply.split(".")[0].strip() + "?"
 
         state.response = reply
-        updated_history = state.history + [state.question, reply]
+
+        # ✅ 스트리밍된 텍스트와 trailer의 response가 같도록 나머지 부분만 이어서 전송
+        streamed = full_response.strip()
+        if reply.startswith(streamed) and len(reply) > len(streamed):
+            yield reply[len(streamed):].encode("utf-8")
+        updated_history = state.history_with(state.question, reply)
         next_turn = state.turn + 1
         next_stage = "end" if next_turn >= 5 else "cbt3"
 
@@ -97,7 +96,7 @@ async def stream_cbt3_reply(state: AgentState, model_path: str) -> AsyncGenerato
             end_msg = "\n\n🎯 실천 계획을 잘 정리해주셨어요. 이제 오늘 대화를 마무리할게요."
             for ch in end_msg:
                 yield ch.encode("utf-8")
-                await asyncio.sleep(0.015)
+                await pace(0.015)
 
         yield b"\n---END_STAGE---\n" + json.dumps({
             "next_stage": next_stage,
@@ -108,9 +107,9 @@ async def stream_cbt3_reply(state: AgentState, model_path: str) -> AsyncGenerato
         }, ensure_ascii=False).encode("utf-8")
 
     except Exception as e:
-        print(f"⚠️ CBT3 오류 발생: {e}", flush=True)
+        logger.warning("⚠️ CBT3 오류 발생: %s", e, extra={"stage": "cbt3", "session": state.session_id})
         fallback = "죄송해요. 지금은 잠시 오류가 발생했어요. 다시 이야기해 주시겠어요?"
         state.response = fallback
         for ch in fallback:
             yield ch.encode("utf-8")
-            await asyncio.sleep(0.02)
+            await pace(0.02)
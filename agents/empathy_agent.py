@@ -1,16 +1,26 @@
 import os, json
-from typing import AsyncGenerator, Optional
-from llama_cpp import Llama
-from agents.schema import AgentState
+from typing import AsyncGenerator, Optional, TYPE_CHECKING
+from agents.registry import get_shared_model
+from llm.backend import get_stage_backend
+from llm.kv_cache import kv_cache_kwargs
+from shared.logger import logger, slog
+from shared.state import AgentState
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
 
 LLM_INSTANCE = {}
 
 # ✅ 모델 로딩
-def load_llama_model(model_path: str, cache_key: str) -> Llama:
+def load_llama_model(model_path: str, cache_key: str) -> "Llama":
     global LLM_INSTANCE
+    shared = get_shared_model(cache_key, model_path)  # ✅ 모델 호스트/LoRA 모드 사용 시 공유 핸들 반환
+    if shared is not None:
+        return shared
     if cache_key not in LLM_INSTANCE:
         try:
-            print(f"🚀 모델 로딩 시작: {cache_key}", flush=True)
+            logger.info("🚀 모델 로딩 시작: %s", cache_key)
+            from llama_cpp import Llama  # ✅ 실제 로딩 시점에만 임포트
             LLM_INSTANCE[cache_key] = Llama(
                 model_path=model_path,
                 n_ctx=512,
@@ -24,12 +34,13 @@ def load_llama_model(model_path: str, cache_key: str) -> Llama:
                 low_vram=True,
                 use_mlock=False,
                 verbose=False,
+                **kv_cache_kwargs("empathy"),
                 chat_format="llama-3",
                 stop=["<|im_end|>"]
             )
-            print(f"✅ Llama 로딩 완료: {model_path}", flush=True)
+            logger.info("✅ Llama 로딩 완료: %s", model_path)
         except Exception as e:
-            print(f"❌ 모델 로딩 실패: {e}", flush=True)
+            logger.error("❌ 모델 로딩 실패: %s", e)
             raise RuntimeError("모델 로딩 중 문제가 발생했습니다.")
     return LLM_INSTANCE[cache_key]
 
@@ -52,7 +63,8 @@ async def stream_empathy_reply(
     state: Optional[AgentState] = None
 ) -> AsyncGenerator[bytes, None]:
     user_input = question.strip()
-    print(f"🟡 사용자 입력 수신: '{user_input}' (턴 {turn})", flush=True)
+    slog("agent", "🟡 사용자 입력 수신: '%s' (턴 %d)", user_input, turn, stage="empathy",
+         session=state.session_id if state else None)
 
     if turn == 0:
         greeting = "안녕하세요. 만나서 반가워요. 혹시 제가 뭐라고 불러드리면 좋을까요?"
@@ -83,29 +95,21 @@ async def stream_empathy_reply(
         return
 
     try:
-        llm = load_llama_model(model_path, "empathy")
-        messages = [
-            {"role": "system", "content": get_empathy_prompt()}
-        ]
-
-        if state and state.history:
-            for i in range(0, len(state.history), 2):
-                if i + 1 < len(state.history):
-                    messages.append({"role": "user", "content": state.history[i]})
-                    messages.append({"role": "assistant", "content": state.history[i + 1]})
-        messages.append({"role": "user", "content": user_input})
+        backend = get_stage_backend("empathy", model_path)
+        if state:
+            messages = state.chat_messages(get_empathy_prompt(), user_input)
+        else:
+            messages = [{"role": "system", "content": get_empathy_prompt()}, {"role": "user", "content": user_input}]
 
         full_response = ""
         first_token_sent = False
 
-        for chunk in llm.create_chat_completion(messages=messages, stream=True):
-            token = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
-            if token:
-                full_response += token
-                if not first_token_sent:
-                    yield b"\n"
-                    first_token_sent = True
-                yield token.encode("utf-8")
+        for token in backend.stream_chat(messages):
+            full_response += token
+            if not first_token_sent:
+                yield b"\n"
+                first_token_sent = True
+            yield token.encode("utf-8")
 
         reply = full_response.strip()
         if not reply or len(reply) < 2:
@@ -125,7 +129,7 @@ async def stream_empathy_reply(
         }, ensure_ascii=False).encode("utf-8")
 
     except Exception as e:
-        print(f"⚠️ stream_empathy_reply 예외 발생: {e}", flush=True)
+        logger.warning("⚠️ stream_empathy_reply 예외 발생: %s", e, extra={"stage": "empathy"})
         fallback = "죄송합니다. 잠시 오류가 있었어요. 다시 말씀해 주실 수 있을까요?"
         if state:
             state.response = fallback
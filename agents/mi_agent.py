@@ -1,16 +1,26 @@
 import os, json, multiprocessing
-from typing import AsyncGenerator, Literal, List, Tuple
-from pydantic import BaseModel
-from llama_cpp import Llama
+from typing import AsyncGenerator, TYPE_CHECKING
+from agents.registry import get_shared_model
+from llm.backend import get_stage_backend
+from llm.kv_cache import kv_cache_kwargs
+from shared.logger import logger
+from shared.state import AgentState
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
 
 LLM_MI_INSTANCE = {}
 
 # ✅ 모델 로딩 함수
-def load_mi_model(model_path: str) -> Llama:
+def load_mi_model(model_path: str) -> "Llama":
     global LLM_MI_INSTANCE
+    shared = get_shared_model("mi", model_path)  # ✅ 모델 호스트/LoRA 모드 사용 시 공유 핸들 반환
+    if shared is not None:
+        return shared
     if model_path not in LLM_MI_INSTANCE:
         try:
-            print("\U0001F680 MI 모델 로딩 중...", flush=True)
+            logger.info("\U0001F680 MI 모델 로딩 중...")
+            from llama_cpp import Llama  # ✅ 실제 로딩 시점에만 임포트
             LLM_MI_INSTANCE[model_path] = Llama(
                 model_path=model_path,
                 n_ctx=512,
@@ -27,22 +37,17 @@ def load_mi_model(model_path: str) -> Llama:
                 low_vram=True,
                 use_mlock=False,
                 verbose=False,
+                **kv_cache_kwargs("mi"),
                 chat_format="llama-3",
                 stop=["<|im_end|>", "\n\n"]
             )
-            print("✅ MI 모델 로드 완료", flush=True)
+            logger.info("✅ MI 모델 로드 완료")
         except Exception as e:
-            print(f"❌ 모델 로딩 실패: {e}", flush=True)
+            logger.error("❌ 모델 로딩 실패: %s", e)
             raise RuntimeError("MI 모델 로딩 실패")
     return LLM_MI_INSTANCE[model_path]
 
 # ✅ 상태 정의
-class AgentState(BaseModel):
-    question: str
-    response: str
-    history: List[str]
-    drift_trace: List[Tuple[str, bool]] = []
-
 # ✅ 시스템 프롬프트 생성기
 def get_mi_prompt(context="empathy", enhanced=False) -> str:
     if context == "empathy":
@@ -74,58 +79,51 @@ async def stream_mi_reply(state: AgentState, model_path: str) -> AsyncGenerator[
         yield b"\n---END_STAGE---\n" + json.dumps({
             "next_stage": "mi",
             "response": fallback,
-            "history": state.history + [user_input, fallback],
-            "drift_trace": state.drift_trace
+            "history": state.history_with(user_input, fallback),
+            "drift_trace": state.drift_trace.to_list()
         }, ensure_ascii=False).encode("utf-8")
         return
 
     try:
-        llm = load_mi_model(model_path)
+        backend = get_stage_backend("mi", model_path, load_mi_model)
 
         # ✅ 문맥 설정
-        context = "cbt" if any(s.startswith("cbt") for s, _ in state.drift_trace[-3:]) else "empathy"
-        enhanced = any(s == "mi" and drift for s, drift in state.drift_trace[-5:])
+        context = "cbt" if any(s.startswith("cbt") for s, _ in state.drift_trace.recent(3)) else "empathy"
+        enhanced = any(s == "mi" and drift for s, drift in state.drift_trace.recent(5))
 
-        # ✅ 멀티턴 메시지 구성
-        messages = [{"role": "system", "content": get_mi_prompt(context, enhanced)}]
-        history_pairs = list(zip(state.history[::2], state.history[1::2]))[-5:]
-        for user_msg, assistant_msg in history_pairs:
-            messages.append({"role": "user", "content": user_msg})
-            messages.append({"role": "assistant", "content": assistant_msg})
-        messages.append({"role": "user", "content": user_input})
+        # ✅ 멀티턴 메시지 구성 (최근 5턴)
+        messages = state.chat_messages(get_mi_prompt(context, enhanced), user_input, last=5)
 
         # ✅ 스트리밍 응답
         full_response, first_token_sent = "", False
-        for chunk in llm.create_chat_completion(messages=messages, stream=True):
-            token = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
-            if token:
-                full_response += token
-                if not first_token_sent:
-                    yield b"\n"
-                    first_token_sent = True
-                yield token.encode("utf-8")
+        for token in backend.stream_chat(messages):
+            full_response += token
+            if not first_token_sent:
+                yield b"\n"
+                first_token_sent = True
+            yield token.encode("utf-8")
 
         reply = full_response.strip() or "괜찮아요. 마음을 천천히 들려주셔도 괜찮습니다."
         state.response = reply
 
-        turn_count = len(state.history) // 2
+        turn_count = len(state.turns)
         next_stage = "cbt1" if turn_count + 1 >= 5 else "mi"
 
         yield b"\n---END_STAGE---\n" + json.dumps({
             "next_stage": next_stage,
             "response": reply,
-            "history": state.history + [user_input, reply],
-            "drift_trace": state.drift_trace
+            "history": state.history_with(user_input, reply),
+            "drift_trace": state.drift_trace.to_list()
         }, ensure_ascii=False).encode("utf-8")
 
     except Exception as e:
-        print(f"⚠️ 오류 발생: {e}", flush=True)
+        logger.warning("⚠️ 오류 발생: %s", e, extra={"stage": "mi", "session": state.session_id})
         fallback = "죄송합니다. 잠시 문제가 발생했어요. 다시 한 번 말씀해 주시겠어요?"
         state.response = fallback
         yield fallback.encode("utf-8")
         yield b"\n---END_STAGE---\n" + json.dumps({
             "next_stage": "mi",
             "response": fallback,
-            "history": state.history + [user_input, fallback],
-            "drift_trace": state.drift_trace
+            "history": state.history_with(user_input, fallback),
+            "drift_trace": state.drift_trace.to_list()
         }, ensure_ascii=False).encode("utf-8")
@@ -0,0 +1,103 @@
+# 📁 agents/registry.py
+import importlib, json, os, threading
+from typing import Optional
+
+# ✅ 단계별 모델 로더 위치 (모듈, 함수명)
+STAGE_LOADERS = {
+    "empathy": ("agents.empathy_agent", "load_llama_model"),
+    "mi": ("agents.mi_agent", "load_mi_model"),
+    "cbt1": ("agents.cbt1_agent", "load_cbt1_model"),
+    "cbt2": ("agents.cbt2_agent", "load_cbt2_model"),
+    "cbt3": ("agents.cbt3_agent", "load_cbt3_model"),
+}
+
+# ✅ 단계별 모델 캐시 (모듈, 캐시 변수명) — empathy는 모델 경로 대신 "empathy" 키 사용
+STAGE_CACHES = {
+    "empathy": ("agents.empathy_agent", "LLM_INSTANCE"),
+    "mi": ("agents.mi_agent", "LLM_MI_INSTANCE"),
+    "cbt1": ("agents.cbt1_agent", "LLM_CBT1_INSTANCE"),
+    "cbt2": ("agents.cbt2_agent", "LLM_CBT2_INSTANCE"),
+    "cbt3": ("agents.cbt3_agent", "LLM_CBT3_INSTANCE"),
+}
+
+# ✅ 단계별 시스템 프롬프트 생성 함수 (기본 인자로 호출)
+STAGE_PROMPTS = {
+    "empathy": ("agents.empathy_agent", "get_empathy_prompt"),
+    "mi": ("agents.mi_agent", "get_mi_prompt"),
+    "cbt1": ("agents.cbt1_agent", "get_cbt1_prompt"),
+    "cbt2": ("agents.cbt2_agent", "get_cbt2_prompt"),
+    "cbt3": ("agents.cbt3_agent", "get_cbt3_prompt"),
+}
+
+TRAILER_MARKER = b"\n---END_STAGE---\n"
+
+def get_stage_loader(stage: str):
+    if stage not in STAGE_LOADERS:
+        raise KeyError(f"알 수 없는 단계: {stage}")
+    module_name, func_name = STAGE_LOADERS[stage]
+    return getattr(importlib.import_module(module_name), func_name)
+
+def get_stage_prompt(stage: str) -> str:
+    module_name, func_name = STAGE_PROMPTS[stage]
+    return getattr(importlib.import_module(module_name), func_name)()
+
+# ✅ 같은 단계 모델을 여러 스레드가 동시에 로딩하지 않도록 단계별 잠금
+_LOAD_LOCKS = {stage: threading.RLock() for stage in STAGE_LOADERS}
+
+def get_load_lock(stage: str):
+    return _LOAD_LOCKS[stage]
+
+# ✅ 단계 이름만으로 해당 에이전트의 모델 로딩 (empathy는 캐시 키 사용)
+def load_stage_model(stage: str, model_path: str):
+    from llm.model_io import cold_load
+    loader = get_stage_loader(stage)
+    with _LOAD_LOCKS[stage], cold_load(model_path):  # ✅ 프리웜 중이면 완료 대기 후 로딩
+        if stage == "empathy":
+            return loader(model_path, "empathy")
+        return loader(model_path)
+
+# ✅ 단계별 에이전트 스트림 생성 (main.py, bench, jobs 공용)
+def stream_stage(stage: str, state, model_path: str):
+    if stage == "empathy":
+        from agents.empathy_agent import stream_empathy_reply
+        return stream_empathy_reply((state.question or "").strip(), model_path, state.turn, state)
+    if stage == "mi":
+        from agents.mi_agent import stream_mi_reply
+        return stream_mi_reply(state, model_path)
+    if stage == "cbt1":
+        from agents.cbt1_agent import stream_cbt1_reply
+        return stream_cbt1_reply(state, model_path)
+    if stage == "cbt2":
+        from agents.cbt2_agent import stream_cbt2_reply
+        return stream_cbt2_reply(state, model_path)
+    if stage == "cbt3":
+        from agents.cbt3_agent import stream_cbt3_reply
+        return stream_cbt3_reply(state, model_path)
+    raise KeyError(f"알 수 없는 단계: {stage}")
+
+def is_stage_loaded(stage: str, model_path: str) -> bool:
+    from llm.lora import BASE_MODEL_ENV, LORA_BASE_INSTANCE, LORA_STAGES, is_lora_mode
+    if is_lora_mode() and stage in LORA_STAGES:
+        # LoRA 모드: 에이전트 캐시 대신 공유 베이스 모델이 올라와 있는지로 판단
+        return os.getenv(BASE_MODEL_ENV) in LORA_BASE_INSTANCE
+    module_name, cache_name = STAGE_CACHES[stage]
+    cache = getattr(importlib.import_module(module_name), cache_name)
+    return ("empathy" if stage == "empathy" else model_path) in cache
+
+# ✅ 에이전트 스트림의 END_STAGE 청크에서 다음 단계 정보를 파싱
+def parse_trailer(chunk: bytes) -> Optional[dict]:
+    if not chunk.startswith(TRAILER_MARKER):
+        return None
+    try:
+        return json.loads(chunk[len(TRAILER_MARKER):].decode("utf-8"))
+    except ValueError:
+        return None
+
+# ✅ 모델 호스트(offload) 또는 LoRA 모드일 때 공유 모델 핸들 반환, 아니면 None
+def get_shared_model(stage: str, model_path: str):
+    from offload.client import get_remote_model
+    remote = get_remote_model(stage, model_path)
+    if remote is not None:
+        return remote
+    from llm.lora import get_lora_model
+    return get_lora_model(stage)
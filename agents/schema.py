@@ -1,9 +1,3 @@
 # 📁 agents/schema.py
-
-from pydantic import BaseModel
-from typing import Literal
-
-class AgentState(BaseModel):
-    stage: Literal["empathy", "mi", "cbt1", "cbt2", "cbt3", "end"]
-    question: str
-    response: str = ""  # stream_empathy_reply 내부에서 사용됨
+# ✅ 세션 상태는 shared/state.py에 단일 정의 (기존 임포트 경로 호환)
+from shared.state import AgentState
@@ -1,17 +1,9 @@
 # agents/user_state_agent.py
 
-from typing import Literal, List, Tuple
-from pydantic import BaseModel
+from typing import Tuple
 from drift.detector import get_drift_analysis  # ✅ 직접 감지 함수 사용
-
-# ✅ 상태 모델 정의
-class AgentState(BaseModel):
-    stage: Literal["empathy", "mi", "cbt1", "cbt2", "cbt3"]
-    question: str
-    response: str
-    history: List[str]
-    turn: int
-    drift_trace: List[Tuple[str, bool]] = []
+from shared.logger import slog
+from shared.state import AgentState  # ✅ 세션 상태 단일 정의
 
 # ✅ run_detect 재정의 (진짜 분석기 사용)
 def run_detect(state: AgentState) -> dict:
@@ -44,7 +36,7 @@ async def run_user_state_agent(state: AgentState, model_path: str = "", mode: st
 
     if result.get("drift", False):
         summary, rollback = evaluate_user_state_score_only(state)
-        print(f"[DRIFT-EVAL] {summary} → MI 전환 필요? {rollback}")
+        slog("drift", "[DRIFT-EVAL] %s → MI 전환 필요? %s", summary, rollback, stage=state.stage, session=state.session_id)
         return {
             "need_rollback": rollback,
             "summary": summary
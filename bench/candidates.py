@@ -0,0 +1,66 @@
+# 📁 bench/candidates.py
+# 다중 후보 생성 비용 비교: k번 순차 create_chat_completion vs llm.candidates의 공유 prefill + 배치 디코딩.
+# 같은 프롬프트/최대 토큰/샘플링 설정으로 두 방식의 총 시간과 생성 토큰 수를 재고 batched/sequential 비율을 보고합니다.
+# 실행: python -m bench.candidates [--model 경로] [--k 3] [--max-tokens 64]
+import argparse, json, sys, time
+
+from bench.kv_cache import PROMPTS, build_messages
+
+def run_sequential(llm, messages: list, k: int, max_tokens: int) -> dict:
+    tokens, start = 0, time.perf_counter()
+    for seed in range(k):
+        llm.reset()
+        result = llm.create_chat_completion(
+            messages=messages, max_tokens=max_tokens, temperature=0.8, top_p=0.95, top_k=40, seed=seed,
+        )
+        tokens += result["usage"]["completion_tokens"]
+    return {"ms": (time.perf_counter() - start) * 1000, "tokens": tokens}
+
+def run_batched(llm, stage: str, messages: list, k: int, max_tokens: int) -> dict:
+    from llm.candidates import generate_candidates
+    start = time.perf_counter()
+    result = generate_candidates(llm, stage, messages, k, max_tokens=max_tokens)
+    return {
+        "ms": (time.perf_counter() - start) * 1000, "prefill_ms": result["prefill_ms"],
+        "scores": [round(s, 3) for s in result["scores"]], "drift": bool(result["drift"]),
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="다중 후보 생성: 순차 vs 배치")
+    parser.add_argument("--model", default=None, help="GGUF 경로 (미지정 시 bench.tiny_gguf)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--n-ctx", type=int, default=1024)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    from llama_cpp import Llama
+    from bench.tiny_gguf import ensure_tiny_gguf
+    model_path = args.model or ensure_tiny_gguf()
+    llm = Llama(model_path=model_path, n_ctx=args.n_ctx, n_threads=args.threads, verbose=False, chat_format="llama-3")
+
+    rows, sequential_ms, batched_ms = [], 0.0, 0.0
+    for stage, text in PROMPTS:
+        messages = build_messages(stage, text)
+        run_batched(llm, stage, messages, args.k, args.max_tokens)  # 후보 컨텍스트 생성은 측정에서 제외
+        sequential = run_sequential(llm, messages, args.k, args.max_tokens)
+        batched = run_batched(llm, stage, messages, args.k, args.max_tokens)
+        sequential_ms += sequential["ms"]
+        batched_ms += batched["ms"]
+        rows.append({
+            "stage": stage, "sequential_ms": round(sequential["ms"], 1), "batched_ms": round(batched["ms"], 1),
+            "prefill_ms": round(batched["prefill_ms"], 1), "scores": batched["scores"], "drift": batched["drift"],
+        })
+    print(json.dumps({
+        "model": model_path,
+        "k": args.k,
+        "max_tokens": args.max_tokens,
+        "prompts": rows,
+        "sequential_ms": round(sequential_ms, 1),
+        "batched_ms": round(batched_ms, 1),
+        "ratio": round(batched_ms / sequential_ms, 3) if sequential_ms else None,
+    }, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
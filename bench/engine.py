@@ -0,0 +1,200 @@
+# 📁 bench/engine.py
+# 단계별 엔진 마이크로 벤치마크: 각 에이전트의 load_*_model 설정과 프롬프트 구성 그대로
+# 고정된 한국어 멀티턴 대화를 재생하며 TTFT, prompt-eval tokens/s, decode tokens/s를 측정합니다.
+# 실행: python -m bench.engine [--model 경로] [--baseline bench/engine_baseline.json] [--save-baseline]
+# 모델을 지정하지 않으면 bench.tiny_gguf로 만든 초소형 GGUF를 사용합니다 (어떤 CPU에서도 재현 가능).
+import argparse, asyncio, contextlib, json, os, platform, statistics, sys, time
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine_baseline.json")
+
+# ✅ 단계별 고정 대화 (사용자 발화, 상담자 응답) — 재생 시 응답은 기록된 값을 사용해 매번 같은 프롬프트가 되도록 함
+HISTORIES = {
+    "empathy": [
+        ("민지라고 불러 주세요.", "민지님, 반가워요. 오늘 하루는 어떻게 지내셨어요?"),
+        ("요즘 잠을 잘 못 자서 하루 종일 피곤해요.", "잠을 설치면 하루가 정말 길게 느껴지죠. 언제부터 그러셨어요?"),
+        ("회사 일이 많아지고 나서부터요.", "일이 늘면서 몸도 마음도 많이 지치셨겠어요."),
+    ],
+    "mi": [
+        ("운동을 해야 한다는 건 아는데 자꾸 미뤄요.", "운동이 필요하다고 느끼시면서도 시작이 쉽지 않으시군요."),
+        ("퇴근하면 아무것도 하기 싫어요.", "하루를 버티고 나면 에너지가 남아 있지 않으신 거네요."),
+        ("그래도 건강이 걱정되긴 해요.", "건강을 챙기고 싶은 마음도 분명히 있으시네요."),
+        ("주말에는 조금 걸어볼까 싶기도 해요.", "주말 산책이라면 부담이 덜하실 것 같아요. 어떤 점이 가장 끌리세요?"),
+    ],
+    "cbt1": [
+        ("회의에서 말을 더듬어서 다들 저를 한심하게 봤을 거예요.", "그 순간 가장 먼저 떠오른 생각은 무엇이었나요?"),
+        ("역시 나는 안 된다는 생각이요.", "그 생각이 들었을 때 어떤 감정이 가장 강했나요?"),
+        ("창피하고 불안했어요.", "예전에도 비슷한 상황에서 같은 생각이 든 적이 있나요?"),
+        ("발표할 때마다 그런 것 같아요.", "그 생각을 계속 믿는다면 앞으로 어떤 영향이 있을까요?"),
+    ],
+    "cbt2": [
+        ("다들 저를 한심하게 봤을 거예요.", "그렇게 생각하게 된 근거는 무엇인가요"),
+        ("아무도 제 눈을 안 쳐다봤어요.", "다른 이유로 시선을 피했을 가능성은 없을까요"),
+        ("다들 자료를 보고 있었던 것 같기도 해요.", "그렇다면 그 상황을 다르게 볼 수도 있겠네요"),
+    ],
+    "cbt3": [
+        ("다음 발표도 망칠 것 같아요.", "지난번과 비교해 이번에는 무엇을 다르게 준비할 수 있을까요?"),
+        ("연습을 한 번 더 해볼 수 있을 것 같아요.", "연습을 한다면 누구 앞에서 해보고 싶으세요?"),
+        ("친한 동료 앞에서요.", "동료에게 어떤 피드백을 부탁해 볼 수 있을까요?"),
+    ],
+}
+
+def perf_counters(llm) -> dict:
+    try:
+        import llama_cpp
+        data = llama_cpp.llama_perf_context(llm.ctx)
+        return {
+            "n_p_eval": data.n_p_eval, "t_p_eval_ms": data.t_p_eval_ms,
+            "n_eval": data.n_eval, "t_eval_ms": data.t_eval_ms,
+        }
+    except (AttributeError, ImportError):
+        return {}
+
+def reset_perf(llm):
+    try:
+        import llama_cpp
+        llama_cpp.llama_perf_context_reset(llm.ctx)
+    except (AttributeError, ImportError):
+        pass
+
+async def replay_turn(stage: str, state, model_path: str, llm) -> dict:
+    from agents.registry import parse_trailer, stream_stage
+    reset_perf(llm)
+    start = time.perf_counter()
+    ttft, chunks = None, 0
+    async for chunk in stream_stage(stage, state, model_path):
+        if parse_trailer(chunk) is not None:
+            break
+        # 에이전트는 첫 모델 토큰 직전에 b"\n"을 보냄 → 폴백 응답과 구분
+        if ttft is None and chunk == b"\n":
+            ttft = time.perf_counter() - start
+            continue
+        chunks += 1
+    total = time.perf_counter() - start
+
+    turn = {"ttft_ms": ttft * 1000 if ttft is not None else None, "total_ms": total * 1000, "chunks": chunks}
+    perf = perf_counters(llm)
+    if perf.get("t_p_eval_ms"):
+        turn["prompt_tokens"] = perf["n_p_eval"]
+        turn["prompt_tps"] = perf["n_p_eval"] / perf["t_p_eval_ms"] * 1000
+    if perf.get("t_eval_ms"):
+        turn["decode_tokens"] = perf["n_eval"]
+        turn["decode_tps"] = perf["n_eval"] / perf["t_eval_ms"] * 1000
+    elif ttft is not None and chunks > 1 and total > ttft:
+        # 성능 카운터가 없으면 클라이언트 측 청크 수로 근사
+        turn["decode_tps"] = (chunks - 1) / (total - ttft)
+    return turn
+
+def _median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+async def bench_stage(stage: str, model_path: str, repeats: int) -> dict:
+    from shared.state import AgentState
+    from agents.registry import load_stage_model
+
+    start = time.perf_counter()
+    llm = load_stage_model(stage, model_path)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    turns = []
+    for _ in range(repeats):
+        llm.reset()
+        history = []
+        for i, (user_text, reply) in enumerate(HISTORIES[stage]):
+            state = AgentState(
+                session_id="bench", stage=stage, question=user_text, history=list(history),
+                turn=i + 1 if stage == "empathy" else i,
+            )
+            turns.append(await replay_turn(stage, state, model_path, llm))
+            history += [user_text, reply]
+
+    failed = sum(t["ttft_ms"] is None for t in turns)
+    return {
+        "load_ms": load_ms,
+        "turns": len(turns),
+        "failed_turns": failed,
+        "ttft_ms": _median([t["ttft_ms"] for t in turns]),
+        "ttft_ms_max": max((t["ttft_ms"] for t in turns if t["ttft_ms"] is not None), default=None),
+        "prompt_tps": _median([t.get("prompt_tps") for t in turns]),
+        "decode_tps": _median([t.get("decode_tps") for t in turns]),
+        "total_ms": _median([t["total_ms"] for t in turns]),
+    }
+
+# ✅ 기준 결과와 비교: 낮을수록 좋은 지표 / 높을수록 좋은 지표
+LOWER_IS_BETTER = ("ttft_ms", "load_ms")
+HIGHER_IS_BETTER = ("prompt_tps", "decode_tps")
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for stage, current in results["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = base.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if worse:
+                regressions.append({"stage": stage, "metric": metric, "baseline": old, "current": new, "change": change})
+        if current["failed_turns"] > base.get("failed_turns", 0):
+            regressions.append({"stage": stage, "metric": "failed_turns", "baseline": base.get("failed_turns", 0),
+                                "current": current["failed_turns"], "change": None})
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="단계별 엔진 마이크로 벤치마크 (TTFT, prompt-eval/decode tokens/s)")
+    parser.add_argument("--model", help="GGUF 경로 (미지정 시 초소형 벤치마크 모델 생성)")
+    parser.add_argument("--stages", default=",".join(HISTORIES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="이번 결과를 기준 파일로 저장")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="허용 성능 저하 비율")
+    parser.add_argument("--output", help="결과 JSON 저장 경로")
+    args = parser.parse_args(argv)
+
+    # 공유 모델 모드가 켜져 있으면 로컬 로더가 측정되지 않으므로 비활성화
+    for env in ("TTM_OFFLOAD_SOCKET", "TTM_LORA_BASE_MODEL", "TTM_BACKEND"):
+        os.environ.pop(env, None)
+
+    if args.model:
+        model_path = args.model
+    else:
+        from bench.tiny_gguf import ensure_tiny_gguf
+        model_path = ensure_tiny_gguf()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    results = {
+        "model": os.path.basename(model_path),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()},
+        "repeats": args.repeats,
+        "stages": {},
+    }
+    # 에이전트 로그는 stderr로 보내고 stdout에는 JSON만 출력
+    with contextlib.redirect_stdout(sys.stderr):
+        for stage in stages:
+            results["stages"][stage] = asyncio.run(bench_stage(stage, model_path, args.repeats))
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("model") != results["model"]:
+            print(f"⚠️ 기준 모델이 다릅니다: {baseline.get('model')} ≠ {results['model']}", file=sys.stderr)
+        results["regressions"] = compare(results, baseline, args.tolerance)
+        status = 1 if results["regressions"] else 0
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
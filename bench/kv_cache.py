@@ -0,0 +1,132 @@
+# 📁 bench/kv_cache.py
+# KV 캐시 타입별 비교: 시퀀스당 KV 메모리, 디코딩 tokens/s, f16 캐시 대비 출력 차이(고정 프롬프트, greedy).
+# 실행: python -m bench.kv_cache --model /models/cbt1/merged-first-8.0B-chat-Q4_K_M.gguf --types f16,q8_0,q4_0
+import argparse, gc, json, sys, time
+
+from llm.kv_cache import GGML_TYPE_BYTES, ggml_type, kv_bytes_per_sequence, parse_kv_type
+
+# ✅ 고정 프롬프트 세트 (단계별 시스템 프롬프트 + 사용자 발화)
+PROMPTS = [
+    ("cbt1", "요즘 회사에서 실수할까 봐 계속 불안해요."),
+    ("cbt1", "친구가 답장을 안 하면 저를 싫어하는 것 같아요."),
+    ("cbt2", "발표를 망치면 다들 저를 무능하다고 생각할 거예요."),
+    ("cbt3", "시험에 떨어지면 제 인생은 끝날 것 같아요."),
+    ("mi", "운동을 해야 하는 건 아는데 자꾸 미루게 돼요."),
+    ("empathy", "오늘 하루가 너무 길고 지쳤어요."),
+]
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def build_messages(stage: str, text: str) -> list:
+    from agents.registry import get_stage_prompt
+    return [{"role": "system", "content": get_stage_prompt(stage)}, {"role": "user", "content": text}]
+
+def run_type(model_path: str, kv_type: str, n_ctx: int, max_tokens: int, n_threads: int) -> dict:
+    from llama_cpp import Llama
+    k, v = parse_kv_type(kv_type)
+    kwargs = {}
+    if k != "f16":
+        kwargs["type_k"] = ggml_type(k)
+    if v != "f16":
+        kwargs["type_v"] = ggml_type(v)
+        kwargs["flash_attn"] = True
+
+    gc.collect()
+    rss_before = rss_bytes()
+    llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False, chat_format="llama-3", **kwargs)
+    rss_loaded = rss_bytes()
+
+    outputs, tokens, elapsed = [], 0, 0.0
+    for stage, text in PROMPTS:
+        llm.reset()
+        start = time.perf_counter()
+        result = llm.create_chat_completion(
+            messages=build_messages(stage, text), max_tokens=max_tokens, temperature=0.0, top_k=1, seed=0,
+        )
+        elapsed += time.perf_counter() - start
+        outputs.append(result["choices"][0]["message"]["content"])
+        tokens += result["usage"]["completion_tokens"]
+    token_ids = [llm.tokenize(o.encode("utf-8"), add_bos=False) for o in outputs]
+
+    report = {
+        "kv_type": f"{k}:{v}",
+        "flash_attn": bool(kwargs.get("flash_attn", False)),
+        "kv_bytes_per_sequence": kv_bytes_per_sequence(llm.metadata, n_ctx, k, v),
+        "rss_delta_bytes": rss_loaded - rss_before,
+        "completion_tokens": tokens,
+        "tokens_per_sec": tokens / elapsed if elapsed else 0.0,
+    }
+    del llm
+    gc.collect()
+    return {"report": report, "outputs": outputs, "token_ids": token_ids}
+
+# ✅ 기준(f16) 대비 출력 차이: 완전 일치율, 토큰 일치율, 첫 불일치 위치
+def divergence(reference: dict, candidate: dict) -> dict:
+    exact, agree, total, first = 0, 0, 0, []
+    for ref_text, cand_text, ref_ids, cand_ids in zip(
+        reference["outputs"], candidate["outputs"], reference["token_ids"], candidate["token_ids"]
+    ):
+        exact += ref_text == cand_text
+        length = max(len(ref_ids), len(cand_ids))
+        same = sum(a == b for a, b in zip(ref_ids, cand_ids))
+        agree += same
+        total += length
+        pos = next((i for i, (a, b) in enumerate(zip(ref_ids, cand_ids)) if a != b), None)
+        if pos is None and len(ref_ids) != len(cand_ids):
+            pos = min(len(ref_ids), len(cand_ids))
+        first.append(pos)
+    return {
+        "exact_match_rate": exact / len(reference["outputs"]),
+        "token_agreement": agree / total if total else 1.0,
+        "first_divergence": first,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="KV 캐시 타입별 메모리/속도/출력 차이 비교")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--types", default="f16,q8_0,q4_0", help="비교할 타입 목록 (K:V 형식 가능, 첫 항목이 기준)")
+    parser.add_argument("--n-ctx", type=int, default=1024)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--output", help="결과 JSON 저장 경로")
+    args = parser.parse_args(argv)
+
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    for t in types:
+        parse_kv_type(t)
+
+    runs = [run_type(args.model, t, args.n_ctx, args.max_tokens, args.threads) for t in types]
+    reference = runs[0]
+    results = []
+    for run in runs:
+        report = dict(run["report"])
+        report.update(divergence(reference, run))
+        report["kv_memory_ratio"] = report["kv_bytes_per_sequence"] / reference["report"]["kv_bytes_per_sequence"]
+        results.append(report)
+
+    summary = {
+        "model": args.model,
+        "n_ctx": args.n_ctx,
+        "max_tokens": args.max_tokens,
+        "prompts": len(PROMPTS),
+        "reference": reference["report"]["kv_type"],
+        "bytes_per_element": {t: GGML_TYPE_BYTES[t] for t in sorted({p for t in types for p in parse_kv_type(t)})},
+        "results": results,
+    }
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
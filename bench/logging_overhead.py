@@ -0,0 +1,127 @@
+# 📁 bench/logging_overhead.py
+# 턴당 로깅 비용 비교 (요청을 처리하는 스레드 기준).
+#   legacy : 에이전트 print(flush=True) + get_drift_analysis의 f-string logger.info 3줄 + run_detect 1줄, 호출 스레드에서 바로 출력
+#   queued : shared.logger.slog (지연 포맷, 구조화 필드) → 큐 → 백그라운드 리스너 출력, 카테고리별 샘플링 적용
+# 출력 대상은 컨테이너 로그처럼 파이프(--sink pipe, 기본) 또는 /dev/null(--sink devnull)입니다.
+# queued 모드는 두 값을 보고합니다:
+#   per_turn_us : 리스너가 동시에 출력하는 상태 (GIL 경합 포함, 턴이 쉬지 않고 들어오는 최악의 경우)
+#   enqueue_us  : 리스너가 쉬는 동안 요청 스레드가 부담하는 비용 (턴 사이 여유 시간에 출력하는 일반적인 경우)
+# 실행: python -m bench.logging_overhead [--turns 20000] [--sample drift=0.1,agent=0.1] [--sink pipe|devnull]
+import argparse, contextlib, io, json, logging, logging.handlers, os, queue, subprocess, sys, time
+
+import shared.logger as shared_logger
+from shared.logger import LOG_FORMAT, LazyQueueHandler, StructuredFormatter, parse_sample_rates, slog
+
+STAGE, SESSION, TURN = "cbt1", "bench-session", 3
+USER_INPUT = "회의에서 실수할까 봐 계속 불안해요."
+SCORE, LEXICAL, STYLE, SEMANTIC = 0.412, 0.233, 0.1, 0.87
+REASONS = ["score>0.28"]
+
+def _isolated_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    log = logging.getLogger(f"bench.{name}")
+    log.handlers[:] = [handler]
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    return log
+
+def legacy_turn(log: logging.Logger):
+    print(f"🟡 사용자 입력 수신: '{USER_INPUT}' (턴 {TURN})", flush=True)
+    print(f"🧠 [CBT1 현재 턴: {TURN}]")
+    drifted = SCORE > 0.28
+    log.info(f"{'🟥 DRIFT 발생' if drifted else '🟩 DRIFT 없음'} | Stage={STAGE} | Score={SCORE:.3f}")
+    log.info(f" ↳ Features: Lexical={LEXICAL:.3f}, Style={STYLE:.3f}, Semantic={SEMANTIC:.3f}")
+    log.info(f" ↳ Reasons: {', '.join(REASONS) if REASONS else '없음'}")
+    log.info(f"📊 최근 3턴 드리프트 상태: {[True, False, True]} (총 {2}회)")
+
+def queued_turn():
+    slog("agent", "🟡 사용자 입력 수신: '%s' (턴 %d)", USER_INPUT, TURN, stage="empathy", session=SESSION)
+    slog("agent", "🧠 [CBT1 현재 턴: %d]", TURN, stage=STAGE, session=SESSION)
+    slog("drift", "%s", "🟥 DRIFT 발생" if SCORE > 0.28 else "🟩 DRIFT 없음", stage=STAGE, score=SCORE,
+         lexical=LEXICAL, style=STYLE, semantic=SEMANTIC, reasons=REASONS)
+    slog("drift", "📊 최근 3턴 드리프트 상태", stage=STAGE, session=SESSION, recent=[True, False, True], count=2)
+    slog("turn", "✅ 턴 완료", stage=STAGE, session=SESSION, turn=TURN, ttft_ms=812.4, total_ms=2311.9)
+
+def run_legacy(turns: int, sink) -> dict:
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log = _isolated_logger("legacy", handler)
+    with contextlib.redirect_stdout(sink):
+        start = time.perf_counter()
+        for _ in range(turns):
+            legacy_turn(log)
+        elapsed = time.perf_counter() - start
+    return {"per_turn_us": round(elapsed / turns * 1e6, 2), "drained_s": round(elapsed, 3)}
+
+def run_queued(turns: int, sink, sample: str) -> dict:
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(StructuredFormatter())
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    log = _isolated_logger("queued", LazyQueueHandler(log_queue))
+    saved = shared_logger.logger, dict(shared_logger.SAMPLE_RATES)
+    shared_logger.logger = log
+    shared_logger.SAMPLE_RATES.clear()
+    shared_logger.SAMPLE_RATES.update(parse_sample_rates(sample))
+    try:
+        # 1) 리스너가 쉬는 동안 넣기만 한 비용
+        start = time.perf_counter()
+        for _ in range(turns):
+            queued_turn()
+        enqueue = time.perf_counter() - start
+        listener.start()
+        listener.stop()
+        # 2) 리스너가 동시에 출력하는 상태
+        listener.start()
+        start = time.perf_counter()
+        for _ in range(turns):
+            queued_turn()
+        elapsed = time.perf_counter() - start
+        listener.stop()  # 남은 레코드를 모두 출력할 때까지 대기
+        drained = time.perf_counter() - start
+    finally:
+        shared_logger.logger = saved[0]
+        shared_logger.SAMPLE_RATES.clear()
+        shared_logger.SAMPLE_RATES.update(saved[1])
+    return {
+        "per_turn_us": round(elapsed / turns * 1e6, 2), "enqueue_us": round(enqueue / turns * 1e6, 2),
+        "drained_s": round(drained, 3), "sample": sample or "all",
+    }
+
+@contextlib.contextmanager
+def open_sink(kind: str):
+    if kind == "devnull":
+        with open(os.devnull, "w", encoding="utf-8") as sink:
+            yield sink
+        return
+    reader = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    sink = io.TextIOWrapper(reader.stdin, encoding="utf-8", line_buffering=True)
+    try:
+        yield sink
+    finally:
+        sink.close()
+        reader.wait()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="턴당 로깅 오버헤드 비교")
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--sample", default="drift=0.1,agent=0.1", help="queued 모드 샘플링 비율")
+    parser.add_argument("--sink", choices=("pipe", "devnull"), default="pipe")
+    args = parser.parse_args(argv)
+
+    with open_sink(args.sink) as sink:
+        legacy = run_legacy(args.turns, sink)
+        unsampled = run_queued(args.turns, sink, "")
+        sampled = run_queued(args.turns, sink, args.sample)
+    print(json.dumps({
+        "turns": args.turns,
+        "legacy": legacy,
+        "queued": unsampled,
+        "queued_sampled": sampled,
+        "speedup": round(legacy["per_turn_us"] / unsampled["per_turn_us"], 2),
+        "speedup_enqueue": round(legacy["per_turn_us"] / unsampled["enqueue_us"], 2),
+        "speedup_sampled": round(legacy["per_turn_us"] / sampled["per_turn_us"], 2),
+    }, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
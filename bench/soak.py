@@ -0,0 +1,286 @@
+# 📁 bench/soak.py
+# 장시간 소크 테스트: 합성 세션 수천 개를 단계 에이전트 + 드리프트 감지기 + 프리페처 + 이벤트 로그에 흘려 보내며
+# 완료 세션당 메모리 증가량을 추적합니다.
+#   - 모델: 기본은 결정적 가짜 모델(FakeLlama, 즉시 토큰 생성), --model tiny면 bench.tiny_gguf 초소형 GGUF (llama_cpp 필요)
+#   - 샘플: --sample-every 세션마다 RSS(/proc/self/status), tracemalloc 스냅샷, gc 객체 수(타입별), 알려진 캐시 크기
+#   - 귀속: 워밍업 직후 스냅샷 대비 증가량을 파일 경로 기준으로 서브시스템(agents/drift/llm/shared/jobs/...)별로 합산
+#   - 판정: 후반부(정상 상태) 구간별 세션당 증가량의 중앙값이 임계값을 넘으면 종료 코드 1
+# tracemalloc(--frames 4) 때문에 추적하지 않을 때보다 2~3배 느립니다 (가짜 모델 2000세션 ≈ 10분).
+# 실행: python -m bench.soak [--sessions 2000] [--model fake|tiny] [--max-bytes-per-session 4096] [--output report.json]
+import argparse, asyncio, collections, gc, json, os, random, statistics, sys, tempfile, time, tracemalloc
+
+from bench.engine import HISTORIES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HARNESS = os.path.abspath(__file__)
+SUBSYSTEMS = ("agents", "drift", "llm", "shared", "jobs", "offload", "bench")
+
+# ✅ 가짜 모델 응답에 쓰는 어휘 (드리프트 점수가 적당히 분포하도록 매번 다른 조합)
+WORDS = (
+    "그때", "어떤", "마음이", "드셨나요", "조금", "더", "이야기해", "주실", "수", "있을까요", "그", "생각을",
+    "뒷받침하는", "근거는", "무엇인가요", "다른", "관점에서", "보면", "어떨까요", "최근에", "비슷한", "상황이",
+    "있었나요", "스스로에게", "해", "주고", "싶은", "말은", "가장", "힘들었던", "순간은", "언제였나요",
+)
+
+class FakeLlama:
+    """llama_cpp.Llama.create_chat_completion 호환 가짜 모델 (stream=True면 청크 제너레이터)."""
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def _reply(self, max_tokens) -> list:
+        n = self.rng.randint(8, min(max_tokens or 24, 24))
+        words = [self.rng.choice(WORDS) for _ in range(n)]
+        return [(" " if i else "") + w for i, w in enumerate(words)] + ["?"]
+
+    def create_chat_completion(self, messages, stream: bool = False, max_tokens=None, **params):
+        self.calls += 1
+        tokens = self._reply(max_tokens)
+        if not stream:
+            return {"choices": [{"message": {"role": "assistant", "content": "".join(tokens)}}]}
+        return ({"choices": [{"delta": {"content": tok}}]} for tok in tokens)
+
+# ✅ 에이전트 모델 캐시에 가짜 모델을 넣어 실제 로더(llama_cpp)를 건너뜀
+def install_fake_models(model_paths: dict):
+    import importlib
+    from agents.registry import STAGE_CACHES
+    for i, (stage, (module_name, cache_name)) in enumerate(STAGE_CACHES.items()):
+        cache = getattr(importlib.import_module(module_name), cache_name)
+        cache["empathy" if stage == "empathy" else model_paths[stage]] = FakeLlama(seed=i)
+
+def resolve_model_paths(kind: str) -> dict:
+    from agents.registry import STAGE_LOADERS
+    # 공유 모델 경로(모델 호스트/LoRA)와 transformers 백엔드는 소크 대상에서 제외
+    for name in ("TTM_OFFLOAD_SOCKET", "TTM_LORA_BASE_MODEL", "TTM_BACKEND"):
+        os.environ.pop(name, None)
+    if kind == "tiny":
+        from bench.tiny_gguf import ensure_tiny_gguf
+        path = ensure_tiny_gguf()
+        return {stage: path for stage in STAGE_LOADERS}
+    paths = {stage: f"/soak/{stage}.gguf" for stage in STAGE_LOADERS}
+    install_fake_models(paths)
+    return paths
+
+# ✅ 합성 대화: 이름 → 단계별 기록 발화를 섞어서 max_turns개
+UTTERANCES = [user for turns in HISTORIES.values() for user, _ in turns]
+
+def synthetic_conversations(start: int, count: int, max_turns: int):
+    for i in range(start, start + count):
+        rng = random.Random(i)
+        turns = ["민지라고 불러 주세요."] + [rng.choice(UTTERANCES) for _ in range(max_turns - 1)]
+        yield {"id": f"soak-{i}", "turns": turns}
+
+def make_runner(model_paths: dict, concurrency: int, pacing: bool = False):
+    from jobs.batch import BatchRunner
+    from llm.prefetch import get_prefetcher
+    from shared.event_log import log_event
+
+    prefetcher = get_prefetcher()
+
+    # ✅ main.generate_turn과 같은 순서: 이전 응답 드리프트 감지(리셋 포함, BatchRunner) → 에이전트 → 프리페치 관찰 → 이벤트 로그
+    class SoakRunner(BatchRunner):
+        async def run_turn(self, conv_id: str, index: int, state) -> dict:
+            prefetcher.record_use(state.stage, self.model_paths[state.stage])
+            record = await super().run_turn(conv_id, index, state)
+            if record["reset"]:
+                log_event("reset_triggered", session_id=conv_id, stage=record["stage"],
+                          next_stage=record["next_stage"], turn=record["turn"])
+                return record
+            prefetcher.observe(conv_id, state.to_payload(), self.model_paths)
+            log_event("turn", session_id=conv_id, stage=record["stage"], turn=record["turn"], question=record["question"],
+                      response=record["response"], drift_score=record["drift_score"], drift=record["drift"])
+            return record
+
+    return SoakRunner(model_paths, concurrency, pacing)
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # /proc이 없으면 최대 RSS로 대체
+
+def subsystem_of(filename: str) -> str:
+    top = os.path.relpath(filename, ROOT).split(os.sep)[0]
+    return top if top in SUBSYSTEMS else "app"
+
+# ✅ 할당 위치 = 트레이스백에서 가장 안쪽의 저장소 프레임 (표준 라이브러리 내부 할당도 호출한 서브시스템으로 귀속)
+def locate(traceback) -> tuple:
+    for frame in reversed(traceback):
+        if frame.filename.startswith(ROOT + os.sep):
+            where = f"{os.path.relpath(frame.filename, ROOT)}:{frame.lineno}"
+            return ("harness" if frame.filename == HARNESS else subsystem_of(frame.filename)), where
+    frame = traceback[-1]
+    return "stdlib/site-packages", f"{frame.filename}:{frame.lineno}"
+
+def type_counts() -> collections.Counter:
+    return collections.Counter(type(o).__name__ for o in gc.get_objects())
+
+def watched_sizes() -> dict:
+    from llm.backend import BACKEND_INSTANCE
+    from llm.prefetch import get_prefetcher
+    from shared.event_log import get_event_log
+    sizes = {
+        "prefetch_sessions": len(get_prefetcher().sessions),
+        "backend_instances": len(BACKEND_INSTANCE),
+    }
+    event_log = get_event_log()
+    if event_log is not None and hasattr(event_log, "queue"):
+        sizes["event_log_queue"] = event_log.queue.qsize()
+    return sizes
+
+class MemorySampler:
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.samples = []
+        self.baseline = None
+
+    def take(self, sessions: int, elapsed: float) -> dict:
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        by_subsystem, by_where = collections.Counter(), collections.Counter()
+        for stat in snapshot.statistics("traceback"):
+            subsystem, where = locate(stat.traceback)
+            by_subsystem[subsystem] += stat.size
+            by_where[subsystem, where] += stat.size
+        del snapshot
+        counts = type_counts()
+        sample = {
+            "sessions": sessions,
+            "elapsed_s": round(elapsed, 2),
+            "rss_kb": rss_kb(),
+            # 소크 하네스 자신(샘플 기록, 합성 대화)이 잡은 메모리는 판정에서 제외
+            "traced_bytes": sum(size for name, size in by_subsystem.items() if name != "harness"),
+            "objects": sum(counts.values()),
+            "caches": watched_sizes(),
+        }
+        if self.baseline is None:
+            self.baseline = (by_subsystem, by_where, counts)
+        else:
+            sample["growth"] = self.attribute(by_subsystem, by_where, counts)
+        self.samples.append(sample)
+        return sample
+
+    # ✅ 기준 스냅샷 대비 증가량: 서브시스템별 합계, 상위 할당 위치, 늘어난 객체 타입
+    def attribute(self, by_subsystem, by_where, counts) -> dict:
+        base_subsystem, base_where, base_counts = self.baseline
+        subsystems = {name: by_subsystem[name] - base_subsystem[name] for name in by_subsystem | base_subsystem}
+        where = by_where.copy()
+        where.subtract(base_where)
+        types = counts.copy()
+        types.subtract(base_counts)
+        return {
+            "subsystems": dict(sorted(subsystems.items(), key=lambda item: -item[1])),
+            "top_allocators": [
+                {"subsystem": subsystem, "where": location, "bytes": size}
+                for (subsystem, location), size in where.most_common()
+                if subsystem != "harness" and size > 0
+            ][:self.top],
+            "object_types": {name: n for name, n in types.most_common(self.top) if n > 0},
+        }
+
+def per_session(samples: list, key: str) -> float:
+    first, last = samples[0], samples[-1]
+    sessions = last["sessions"] - first["sessions"]
+    return (last[key] - first[key]) / sessions if sessions else 0.0
+
+# ✅ 후반부 구간별 기울기의 중앙값: 한 번뿐인 계단(스레드/루프 생성 등)은 무시하고 꾸준한 누수만 남김
+def steady_per_session(samples: list, key: str) -> float:
+    tail = samples[len(samples) // 2:] if len(samples) > 2 else samples
+    slopes = [per_session([a, b], key) for a, b in zip(tail, tail[1:])]
+    return statistics.median(slopes) if slopes else 0.0
+
+async def soak(args) -> dict:
+    from shared.event_log import close_event_log
+    model_paths = resolve_model_paths(args.model)
+    runner = make_runner(model_paths, args.concurrency, args.pacing)
+    sampler = MemorySampler(args.top)
+
+    def sink(record: dict):
+        pass  # 결과는 보관하지 않음 (소크 자체가 메모리를 잡지 않도록)
+
+    # 워밍업: 모듈 임포트, 모델/백엔드 캐시, 로그 큐 등 한 번만 생기는 할당을 기준선 이전에 끝냄
+    await runner.run(synthetic_conversations(0, args.warmup, args.max_turns), sink)
+    tracemalloc.start(args.frames)
+    start, done = time.perf_counter(), 0
+    sampler.take(done, 0.0)
+    while done < args.sessions:
+        count = min(args.sample_every, args.sessions - done)
+        await runner.run(synthetic_conversations(args.warmup + done, count, args.max_turns), sink)
+        done += count
+        sample = sampler.take(done, time.perf_counter() - start)
+        print(f"🧪 {done}/{args.sessions} 세션 | RSS {sample['rss_kb'] / 1024:.1f}MB | "
+              f"traced {sample['traced_bytes'] / 1024:.0f}KB | 객체 {sample['objects']}", file=sys.stderr, flush=True)
+    tracemalloc.stop()
+    close_event_log()
+
+    samples = sampler.samples
+    result = {
+        "model": args.model,
+        "sessions": args.sessions,
+        "turns": runner.stats["turns"],
+        "errors": runner.stats["errors"],
+        "elapsed_s": samples[-1]["elapsed_s"],
+        "bytes_per_session": round(per_session(samples, "traced_bytes"), 1),
+        "bytes_per_session_tail": round(steady_per_session(samples, "traced_bytes"), 1),
+        "rss_kb_per_session": round(per_session(samples, "rss_kb"), 3),
+        "rss_kb_per_session_tail": round(steady_per_session(samples, "rss_kb"), 3),
+        "objects_per_session_tail": round(steady_per_session(samples, "objects"), 3),
+        "growth": samples[-1].get("growth", {}),
+        "samples": [{k: v for k, v in s.items() if k != "growth"} for s in samples],
+    }
+    failures = []
+    if result["bytes_per_session_tail"] > args.max_bytes_per_session:
+        failures.append(f"traced {result['bytes_per_session_tail']}B/session > {args.max_bytes_per_session}")
+    if args.max_rss_kb_per_session is not None and result["rss_kb_per_session_tail"] > args.max_rss_kb_per_session:
+        failures.append(f"rss {result['rss_kb_per_session_tail']}KB/session > {args.max_rss_kb_per_session}")
+    if runner.stats["errors"]:
+        failures.append(f"{runner.stats['errors']} errors")
+    result["failures"] = failures
+    return result
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="세션당 메모리 증가를 추적하는 장시간 소크 테스트")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--sample-every", type=int, default=200)
+    parser.add_argument("--max-turns", type=int, default=24, help="세션당 최대 턴 (end 단계에 도달하면 더 빨리 끝남)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--model", choices=("fake", "tiny"), default="fake")
+    parser.add_argument("--max-bytes-per-session", type=float, default=4096, help="후반부 tracemalloc 증가 허용치")
+    parser.add_argument("--max-rss-kb-per-session", type=float, default=None, help="후반부 RSS 증가 허용치 (기본: 검사 안 함)")
+    parser.add_argument("--frames", type=int, default=4, help="tracemalloc 트레이스백 깊이 (서브시스템 귀속용)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--pacing", action="store_true", help="cbt2/cbt3 타이핑 연출 지연 유지")
+    parser.add_argument("--event-log-dir", default=None, help="이벤트 로그 세그먼트 위치 (기본: 임시 디렉토리)")
+    parser.add_argument("--output", default=None, help="JSON 보고서 저장 경로")
+    args = parser.parse_args(argv)
+
+    import logging
+    from shared.logger import logger
+    logging.getLogger().setLevel(logging.WARNING)  # 턴마다 남는 INFO 로그는 소크 대상이 아님
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="ttm-soak-") as tmp:
+        os.environ["TTM_EVENT_LOG_DIR"] = args.event_log_dir or tmp
+        result = asyncio.run(soak(args))
+
+    report = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    print(report)
+    for failure in result["failures"]:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if result["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
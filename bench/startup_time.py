@@ -0,0 +1,99 @@
+# 📁 bench/startup_time.py
+# 서버 기동 시간 예산 검사: `import main` 임포트 시간과 프로세스 시작 → `/`, `/status` 응답까지의 시간을 측정합니다.
+# 실행: python -m bench.startup_time [--import-budget-ms 400] [--listen-budget-ms 1000]
+# 예산을 넘거나 무거운 모듈이 임포트 시점에 로딩되면 종료 코드 1로 실패합니다.
+import argparse, json, os, socket, subprocess, sys, time, urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ✅ 서빙 경로의 임포트 시점에 로딩되면 안 되는 무거운 모듈
+FORBIDDEN_AT_IMPORT = ("llama_cpp", "huggingface_hub", "sklearn", "torch", "transformers", "tqdm")
+
+def measure_import(module: str = "main") -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"`import {module}` 실패:\n{proc.stderr[-2000:]}")
+
+    # 형식: "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, self_us, cumulative_us, name = [p.strip() for p in line.replace("import time:", "|", 1).split("|")]
+        rows.append((name, int(self_us), int(cumulative_us)))
+
+    total_us = next((cum for name, _, cum in rows if name == module), sum(s for _, s, _ in rows))
+    imported = {name.strip() for name, _, _ in rows}
+    return {
+        "import_ms": total_us / 1000,
+        "heaviest": [
+            {"module": name.strip(), "cumulative_ms": cum / 1000}
+            for name, _, cum in sorted(rows, key=lambda r: r[2], reverse=True)[:10]
+        ],
+        "forbidden_loaded": sorted(
+            m for m in imported if m.split(".")[0] in FORBIDDEN_AT_IMPORT
+        ),
+    }
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def measure_listen(timeout: float = 30.0) -> dict:
+    port = _free_port()
+    env = dict(os.environ)
+    env.pop("HUGGINGFACE_TOKEN", None)  # 다운로드 없이 기동 경로만 측정
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    timings = {}
+    try:
+        for path in ("/", "/status"):
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn 프로세스가 기동 중 종료되었습니다")
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"{timeout}s 안에 {path} 응답 없음")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as resp:
+                        if resp.status == 200:
+                            timings[path] = (time.perf_counter() - start) * 1000
+                            break
+                except OSError:
+                    time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return {"listen_ms": max(timings.values()), "endpoints_ms": timings}
+
+def main():
+    parser = argparse.ArgumentParser(description="TTM 서버 기동 시간 예산 검사")
+    parser.add_argument("--import-budget-ms", type=float, default=float(os.getenv("TTM_IMPORT_BUDGET_MS", 400)))
+    parser.add_argument("--listen-budget-ms", type=float, default=float(os.getenv("TTM_LISTEN_BUDGET_MS", 1000)))
+    parser.add_argument("--skip-listen", action="store_true", help="uvicorn 기동 측정 생략")
+    args = parser.parse_args()
+
+    result = measure_import()
+    failures = []
+    if result["import_ms"] > args.import_budget_ms:
+        failures.append(f"import main {result['import_ms']:.0f}ms > 예산 {args.import_budget_ms:.0f}ms")
+    if result["forbidden_loaded"]:
+        failures.append(f"임포트 시점에 무거운 모듈 로딩: {', '.join(result['forbidden_loaded'])}")
+
+    if not args.skip_listen:
+        result.update(measure_listen())
+        if result["listen_ms"] > args.listen_budget_ms:
+            failures.append(f"프로세스 시작→응답 {result['listen_ms']:.0f}ms > 예산 {args.listen_budget_ms:.0f}ms")
+
+    result["failures"] = failures
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
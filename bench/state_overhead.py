@@ -0,0 +1,130 @@
+# 📁 bench/state_overhead.py
+# 요청당 세션 상태 처리 비용 비교: 기존 pydantic AgentState 검증 + 인덱스 루프 메시지 구성 + trailer 복사
+# vs shared.state.SessionState.from_payload + chat_messages + to_payload.
+# 실행: python -m bench.state_overhead [--turns 0,10,40] [--iterations 20000]
+import argparse, json, sys, time
+from typing import List, Optional, Tuple
+
+from shared.state import SessionState
+
+def build_payload(turns: int) -> dict:
+    history = []
+    for i in range(turns):
+        history += [f"사용자 발화 {i} 요즘 마음이 복잡해요", f"상담자 응답 {i} 어떤 점이 가장 힘드셨나요?"]
+    return {
+        "session_id": "bench-session",
+        "stage": "cbt1",
+        "question": "회의에서 실수할까 봐 계속 불안해요.",
+        "response": "그 생각이 들 때 어떤 감정이 가장 강했나요?",
+        "history": history,
+        "turn": 3,
+        "preset_questions": [],
+        "drift_trace": [["cbt1", i % 3 == 0] for i in range(turns)],
+        "intro_shown": True,
+    }
+
+def legacy_model():
+    from pydantic import BaseModel, Field
+
+    # 변경 전 main.py의 AgentState
+    class LegacyAgentState(BaseModel):
+        session_id: str
+        stage: str
+        question: Optional[str] = None
+        response: Optional[str] = None
+        history: List[str] = Field(default_factory=list)
+        turn: int = 0
+        preset_questions: List[str] = Field(default_factory=list)
+        drift_trace: List[Tuple[str, bool]] = Field(default_factory=list)
+        reset_triggered: bool = False
+        intro_shown: bool = False
+        retry_count: int = 0
+        pending_response: Optional[str] = None
+        awaiting_s_turn_decision: bool = False
+        awaiting_preparation_decision: bool = False
+        user_profile: Optional[dict] = None
+        user_type: Optional[str] = None
+        last_active_time: Optional[str] = None
+        drift: Optional[dict] = None
+
+    return LegacyAgentState
+
+def legacy_request(model, payload: dict) -> str:
+    state = model(**payload)
+    enhanced = any(s == "cbt1" and d for s, d in state.drift_trace[-5:])
+    messages = [{"role": "system", "content": "시스템" if enhanced else "시스템 프롬프트"}]
+    history = state.history
+    for i in range(0, len(history), 2):
+        if i + 1 < len(history):
+            messages.append({"role": "user", "content": history[i]})
+            messages.append({"role": "assistant", "content": history[i + 1]})
+    messages.append({"role": "user", "content": state.question})
+    return json.dumps({
+        "history": state.history + [state.question, state.response],
+        "drift_trace": state.drift_trace,
+    }, ensure_ascii=False)
+
+def canonical_request(payload: dict) -> str:
+    state = SessionState.from_payload(payload)
+    enhanced = any(s == "cbt1" and d for s, d in state.drift_trace.recent(5))
+    state.chat_messages("시스템" if enhanced else "시스템 프롬프트")
+    return json.dumps({
+        "history": state.history_with(state.question, state.response),
+        "drift_trace": state.drift_trace.to_list(),
+    }, ensure_ascii=False)
+
+# ✅ 반복 측정 중 가장 빠른 값 (다른 프로세스로 인한 잡음 제거)
+def measure(fn, iterations: int, repeats: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / iterations * 1e6
+
+# ✅ 단계별 비용: 상태 검증 / 메시지 구성 / trailer 직렬화
+def phases(payload: dict, legacy) -> dict:
+    state = SessionState.from_payload(payload)
+    result = {
+        "validate_us": lambda: SessionState.from_payload(payload),
+        "messages_us": lambda: state.chat_messages("시스템 프롬프트"),
+        "trailer_us": lambda: json.dumps({
+            "history": state.history_with(state.question, state.response),
+            "drift_trace": state.drift_trace.to_list(),
+        }, ensure_ascii=False),
+    }
+    if legacy is not None:
+        old = legacy(**payload)
+        result["legacy_validate_us"] = lambda: legacy(**payload)
+        result["legacy_trailer_us"] = lambda: json.dumps({
+            "history": old.history + [old.question, old.response],
+            "drift_trace": old.drift_trace,
+        }, ensure_ascii=False)
+    return result
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="요청당 세션 상태 검증/복사 비용 비교")
+    parser.add_argument("--turns", default="0,10,40")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    try:
+        legacy = legacy_model()
+    except ImportError:
+        legacy = None
+    results = []
+    for turns in [int(t) for t in args.turns.split(",")]:
+        payload = build_payload(turns)
+        row = {"turns": turns, "canonical_us": round(measure(lambda: canonical_request(payload), args.iterations), 2)}
+        if legacy is not None:
+            row["legacy_us"] = round(measure(lambda: legacy_request(legacy, payload), args.iterations), 2)
+            row["speedup"] = round(row["legacy_us"] / row["canonical_us"], 2)
+        for name, fn in phases(payload, legacy).items():
+            row[name] = round(measure(fn, args.iterations), 2)
+        results.append(row)
+    print(json.dumps({"iterations": args.iterations, "results": results}, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# 📁 bench/tiny_gguf.py
+# 벤치마크용 초소형 llama GGUF 생성기 (가중치는 고정 시드 난수 → 어떤 CPU에서도 같은 파일).
+# 어휘: 특수 토큰 + 바이트 폴백 256개 + 벤치마크 대화/시스템 프롬프트에 등장하는 문자.
+# 실행: python -m bench.tiny_gguf --output /tmp/ttm-bench/tiny-llama.gguf
+import argparse, os
+
+DEFAULT_PATH = os.path.join(os.getenv("TMPDIR", "/tmp"), "ttm-bench", "tiny-llama.gguf")
+
+# ✅ 모델 크기 (CPU에서 수 초 안에 한 단계 재생이 끝나는 수준)
+TINY_CONFIG = {
+    "n_embd": 64,
+    "n_layer": 2,
+    "n_head": 4,
+    "n_head_kv": 2,
+    "n_ff": 128,
+    "n_ctx_train": 2048,
+    "seed": 1234,
+}
+
+# llama.cpp SentencePiece 토큰 타입
+TOKEN_NORMAL, TOKEN_UNKNOWN, TOKEN_CONTROL, TOKEN_BYTE = 1, 2, 3, 6
+
+def build_vocab(texts) -> list:
+    tokens = [("<unk>", TOKEN_UNKNOWN), ("<s>", TOKEN_CONTROL), ("</s>", TOKEN_CONTROL)]
+    tokens += [(f"<0x{b:02X}>", TOKEN_BYTE) for b in range(256)]
+    chars = sorted({"▁"} | {ch for text in texts for ch in text.replace(" ", "▁") if not ch.isspace()})
+    tokens += [(ch, TOKEN_NORMAL) for ch in chars]
+    return tokens
+
+def corpus_texts() -> list:
+    from agents.registry import STAGE_PROMPTS, get_stage_prompt
+    from bench.engine import HISTORIES
+    texts = [get_stage_prompt(stage) for stage in STAGE_PROMPTS]
+    texts += [turn for script in HISTORIES.values() for pair in script for turn in pair]
+    # llama-3 채팅 템플릿 문자열도 글자 단위 토큰으로 처리
+    texts.append("<|begin_of_text|><|start_header_id|>system user assistant<|end_header_id|><|eot_id|>")
+    return texts
+
+def write_tiny_gguf(path: str = DEFAULT_PATH, config: dict = None) -> str:
+    import gguf
+    import numpy as np
+
+    cfg = {**TINY_CONFIG, **(config or {})}
+    vocab = build_vocab(corpus_texts())
+    n_vocab, n_embd, n_ff = len(vocab), cfg["n_embd"], cfg["n_ff"]
+    n_embd_kv = n_embd // cfg["n_head"] * cfg["n_head_kv"]
+    rng = np.random.default_rng(cfg["seed"])
+
+    def weight(*shape):
+        return (rng.standard_normal(shape) * 0.02).astype(np.float32)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer = gguf.GGUFWriter(path, "llama")
+    writer.add_name("ttm-bench-tiny-llama")
+    writer.add_context_length(cfg["n_ctx_train"])
+    writer.add_embedding_length(n_embd)
+    writer.add_block_count(cfg["n_layer"])
+    writer.add_feed_forward_length(n_ff)
+    writer.add_head_count(cfg["n_head"])
+    writer.add_head_count_kv(cfg["n_head_kv"])
+    writer.add_rope_dimension_count(n_embd // cfg["n_head"])
+    writer.add_layer_norm_rms_eps(1e-5)
+    writer.add_file_type(0)  # ALL_F32
+
+    writer.add_tokenizer_model("llama")
+    writer.add_token_list([t for t, _ in vocab])
+    writer.add_token_scores([0.0 if kind != TOKEN_NORMAL else -float(i) for i, (_, kind) in enumerate(vocab)])
+    writer.add_token_types([kind for _, kind in vocab])
+    writer.add_unk_token_id(0)
+    writer.add_bos_token_id(1)
+    writer.add_eos_token_id(2)
+
+    # numpy shape은 (출력, 입력) 순서 → GGUF에는 역순으로 기록됨
+    writer.add_tensor("token_embd.weight", weight(n_vocab, n_embd))
+    for i in range(cfg["n_layer"]):
+        writer.add_tensor(f"blk.{i}.attn_norm.weight", np.ones(n_embd, dtype=np.float32))
+        writer.add_tensor(f"blk.{i}.attn_q.weight", weight(n_embd, n_embd))
+        writer.add_tensor(f"blk.{i}.attn_k.weight", weight(n_embd_kv, n_embd))
+        writer.add_tensor(f"blk.{i}.attn_v.weight", weight(n_embd_kv, n_embd))
+        writer.add_tensor(f"blk.{i}.attn_output.weight", weight(n_embd, n_embd))
+        writer.add_tensor(f"blk.{i}.ffn_norm.weight", np.ones(n_embd, dtype=np.float32))
+        writer.add_tensor(f"blk.{i}.ffn_gate.weight", weight(n_ff, n_embd))
+        writer.add_tensor(f"blk.{i}.ffn_up.weight", weight(n_ff, n_embd))
+        writer.add_tensor(f"blk.{i}.ffn_down.weight", weight(n_embd, n_ff))
+    writer.add_tensor("output_norm.weight", np.ones(n_embd, dtype=np.float32))
+    writer.add_tensor("output.weight", weight(n_vocab, n_embd))
+
+    writer.write_header_to_file()
+    writer.write_kv_data_to_file()
+    writer.write_tensors_to_file()
+    writer.close()
+    return path
+
+def ensure_tiny_gguf(path: str = DEFAULT_PATH, rebuild: bool = False) -> str:
+    if rebuild or not os.path.exists(path):
+        print(f"🧪 벤치마크용 GGUF 생성: {path}", flush=True)
+        write_tiny_gguf(path)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="벤치마크용 초소형 llama GGUF 생성")
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    args = parser.parse_args(argv)
+    print(write_tiny_gguf(args.output))
+
+if __name__ == "__main__":
+    main()
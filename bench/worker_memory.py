@@ -0,0 +1,142 @@
+# 📁 bench/worker_memory.py
+# 워커별 RSS/PSS 측정: 여러 워커가 GGUF 가중치 페이지를 공유하는지 확인합니다.
+# PSS는 공유 페이지를 공유한 프로세스 수로 나눈 값이므로, 가중치가 공유되면 워커 PSS 합계가 RSS 합계보다 훨씬 작습니다.
+# 실행:
+#   python -m bench.worker_memory --pid <gunicorn 마스터 PID>             # 실행 중인 서버 측정
+#   python -m bench.worker_memory --demo --model /models/cbt1/...gguf --workers 4 [--mode preload|private]
+# --demo는 마스터가 모델을 매핑한 뒤 워커를 fork하고, 각 워커가 fork 이후 모델을 엽니다
+# (llama_cpp가 있으면 Llama 컨텍스트 생성, 없으면 파일을 매핑해 모든 페이지를 읽음).
+# --mode private는 비교용으로 각 워커가 가중치를 자기 메모리에 복사합니다 (use_mmap=False와 같은 상황).
+import argparse, json, mmap, os, signal, sys, time
+
+from llm.shared_weights import map_models
+
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+def _kb_to_mb(kb: int) -> float:
+    return round(kb / 1024, 1)
+
+def read_rollup(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in FIELDS:
+                values[name] = int(rest.split()[0])
+    return values
+
+# ✅ 특정 파일(기본: .gguf) 매핑만 합산
+def mapped_file_usage(pid: int, suffix: str = ".gguf") -> dict:
+    totals, current = dict.fromkeys(FIELDS, 0), False
+    with open(f"/proc/{pid}/smaps") as f:
+        for line in f:
+            head = line.split()
+            if not head:
+                continue
+            if "-" in head[0] and len(head) >= 5:  # 매핑 헤더 줄
+                current = len(head) >= 6 and head[-1].endswith(suffix)
+            elif current and head[0].rstrip(":") in FIELDS:
+                totals[head[0].rstrip(":")] += int(head[1])
+    return totals
+
+def children(pid: int) -> list:
+    result = []
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                result += [int(c) for c in f.read().split()]
+        except OSError:
+            continue
+    return sorted(set(result))
+
+def measure(pid: int, role: str, suffix: str) -> dict:
+    rollup, weights = read_rollup(pid), mapped_file_usage(pid, suffix)
+    return {
+        "pid": pid, "role": role,
+        "rss_mb": _kb_to_mb(rollup.get("Rss", 0)),
+        "pss_mb": _kb_to_mb(rollup.get("Pss", 0)),
+        "shared_mb": _kb_to_mb(rollup.get("Shared_Clean", 0) + rollup.get("Shared_Dirty", 0)),
+        "private_mb": _kb_to_mb(rollup.get("Private_Clean", 0) + rollup.get("Private_Dirty", 0)),
+        "weights_rss_mb": _kb_to_mb(weights["Rss"]),
+        "weights_pss_mb": _kb_to_mb(weights["Pss"]),
+    }
+
+def report(master: int, workers: list, suffix: str) -> dict:
+    rows = [measure(master, "master", suffix)] + [measure(w, "worker", suffix) for w in workers]
+    return {
+        "processes": rows,
+        "total_rss_mb": round(sum(r["rss_mb"] for r in rows), 1),
+        "total_pss_mb": round(sum(r["pss_mb"] for r in rows), 1),  # 실제 물리 메모리 사용량에 가까운 값
+        "weights_total_pss_mb": round(sum(r["weights_pss_mb"] for r in rows), 1),
+    }
+
+# ✅ fork 이후 워커에서 모델 열기
+def _open_model(path: str, mode: str):
+    if mode == "private":
+        with open(path, "rb") as f:
+            return f.read()  # 워커마다 가중치 사본
+    try:
+        from llama_cpp import Llama
+        return Llama(model_path=path, n_ctx=256, n_threads=1, use_mmap=True, use_mlock=False, verbose=False)
+    except ImportError:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        for offset in range(0, len(mm), mmap.PAGESIZE):
+            mm[offset]
+        return mm
+
+def run_demo(path: str, workers: int, mode: str, settle: float) -> dict:
+    if mode == "preload":
+        map_models({"model": path})
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                model = _open_model(path, mode)  # noqa: F841 (측정이 끝날 때까지 유지)
+                signal.pause()
+            finally:
+                os._exit(0)
+        pids.append(pid)
+    time.sleep(settle)
+    try:
+        result = report(os.getpid(), pids, os.path.basename(path))
+    finally:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+    result.update({"mode": mode, "workers": workers, "model_mb": round(os.path.getsize(path) / 1024 / 1024, 1)})
+    return result
+
+def make_dummy_model(path: str, size_mb: int) -> str:
+    if not os.path.exists(path) or os.path.getsize(path) != size_mb * 1024 * 1024:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(size_mb):
+                f.write(chunk)
+    return path
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="워커별 RSS/PSS 및 가중치 페이지 공유 측정")
+    parser.add_argument("--pid", type=int, help="gunicorn 마스터 PID")
+    parser.add_argument("--demo", action="store_true")
+    parser.add_argument("--model", help="GGUF 경로 (--demo, 없으면 더미 파일 생성)")
+    parser.add_argument("--size-mb", type=int, default=512, help="더미 모델 크기")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=("preload", "private"), default="preload")
+    parser.add_argument("--settle", type=float, default=5.0, help="워커 로딩 대기 시간(초)")
+    args = parser.parse_args(argv)
+
+    if args.pid:
+        result = report(args.pid, children(args.pid), ".gguf")
+    elif args.demo:
+        path = args.model or make_dummy_model("/tmp/ttm-bench/dummy-weights.gguf", args.size_mb)
+        result = run_demo(path, args.workers, args.mode, args.settle)
+    else:
+        parser.error("--pid 또는 --demo가 필요합니다")
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,10 @@
-import re
+import re, zlib
 from drift.drift_features import *
 from drift.drift_config import *
-from shared.logger import logger
+from shared.logger import logger, slog
 
-def get_drift_analysis(stage: str, reply: str, previous_reply: str = None, previous_stage: str = None) -> dict:
+# ✅ 점수만 계산 (로그 없음) — 후보 응답 재정렬(llm.candidates)에서도 사용
+def score_reply(reply: str, previous_reply: str = None) -> dict:
     meaningless = is_meaningless(reply)
     semantic_similarity = fraction_similarity(reply, previous_reply) if previous_reply else 0.0
     semantic_score = 1.0 - semantic_similarity
@@ -31,10 +32,6 @@ def get_drift_analysis(stage: str, reply: str, previous_reply: str = None, previ
     if meaningless:
         reasons.append("meaningless_input")
 
-    logger.info(f"{'🟥 DRIFT 발생' if drifted else '🟩 DRIFT 없음'} | Stage={stage} | Score={score:.3f}")
-    logger.info(f" ↳ Features: Lexical={lexical:.3f}, Style={style:.3f}, Semantic={semantic:.3f}")
-    logger.info(f" ↳ Reasons: {', '.join(reasons) if reasons else '없음'}")
-
     return {
         "drift": drifted,
         "reasons": reasons,
@@ -42,16 +39,26 @@ def get_drift_analysis(stage: str, reply: str, previous_reply: str = None, previ
         "features": features
     }
 
+def get_drift_analysis(stage: str, reply: str, previous_reply: str = None, previous_stage: str = None) -> dict:
+    analysis = score_reply(reply, previous_reply)
+    features = analysis["features"]
+
+    # ✅ 한 줄 구조화 로그 (샘플링 대상, 포맷은 로그 스레드에서)
+    slog("drift", "%s", "🟥 DRIFT 발생" if analysis["drift"] else "🟩 DRIFT 없음", stage=stage, score=analysis["score"],
+         lexical=features["lexical_redundancy"], style=features["style_shit"], semantic=features["semantic_repetition"],
+         reasons=analysis["reasons"] or "없음")
+
+    return analysis
+
 def pure_run_detect(state) -> dict:
     previous_reply = state.history[-2] if len(state.history) >= 2 else None
-    previous_stage = (
-        state.drift_trace[-1][0]
-        if state.drift_trace and isinstance(state.drift_trace[-1], (list, tuple)) and len(state.drift_trace[-1]) == 2
-        else None
-    )
+    last = state.drift_trace.last()
+    previous_stage = last[0] if last else None
     return get_drift_analysis(state.stage, state.response, previous_reply, previous_stage)
 
-def run_detect(state) -> dict:
+# ✅ analysis: 이전 턴 trailer에서 받은 분석 결과(get_precomputed_analysis) — 있으면 재계산만 생략하고
+#    drift_trace 기록/최근 3턴 판단/리셋/안내 문구는 똑같이 수행
+def run_detect(state, analysis: dict = None) -> dict:
     try:
         if not state.response:
             logger.warning("⚠️ 응답이 비어있음 → 드리프트 감지 생략")
@@ -61,38 +68,40 @@ def run_detect(state) -> dict:
                 "response": "",
                 "history": state.history,
                 "preset_questions": state.preset_questions,
-                "drift_trace": state.drift_trace,
+                "drift_trace": state.drift_trace.to_list(),
                 "user_profile": state.user_profile or {},
                 "reset_triggered": False,
                 "intro_shown": state.intro_shown,
                 "reasons": [],
             }
 
-        analysis = pure_run_detect(state)
+        if analysis is None:
+            analysis = pure_run_detect(state)
         score = analysis["score"]
         drifted = analysis["drift"]
         reasons = analysis.get("reasons", [])
 
         state.drift_trace.append((state.stage, drifted))
-        state.drift_trace = state.drift_trace[-3:]
-        drift_count = sum(d for _, d in state.drift_trace)
+        recent = state.drift_trace.recent(3)  # 링 버퍼에서 최근 3턴만 판단에 사용
+        drift_count = sum(d for _, d in recent)
 
-        logger.info(f"📊 최근 3턴 드리프트 상태: {[d for _, d in state.drift_trace]} (총 {drift_count}회)")
+        slog("drift", "📊 최근 3턴 드리프트 상태", stage=state.stage, session=state.session_id,
+             recent=[d for _, d in recent], count=drift_count)
 
         reset_triggered = False
         if drift_count >= 3:
-            logger.info("🚨 최근 3턴 중 3회 드리프트 감지 → MI 단계로 전환")
+            logger.info("🚨 최근 3턴 중 3회 드리프트 감지 → MI 단계로 전환", extra={"stage": state.stage, "session": state.session_id})
             state.stage = "mi"
             state.turn = 0
             state.drift_trace.clear()
-            state.history.clear()
+            state.history = []
             state.response = (
                 "지금 상담을 다시 시작해볼게요. "
                 "천천히 괜찮으시다면 지금 어떤 점이 가장 고민되시는지 들려주세요."
             )
             reset_triggered = True
         elif drifted:
-            logger.info("⚠️ 드리프트 감지됨 → 안내 문구 추가")
+            slog("drift", "⚠️ 드리프트 감지됨 → 안내 문구 추가", stage=state.stage, session=state.session_id)
             state.response = str(state.response).strip() + "\n\n천천히 침착하게 다시 생각해서 대답해볼까요?"
 
         return {
@@ -101,16 +110,17 @@ def run_detect(state) -> dict:
             "response": str(state.response),
             "history": state.history,
             "preset_questions": getattr(state, "preset_questions", []),
-            "drift_trace": state.drift_trace,
+            "drift_trace": state.drift_trace.to_list(),
             "user_profile": getattr(state, "user_profile", {}),
             "reset_triggered": reset_triggered,
             "intro_shown": getattr(state, "intro_shown", False),
+            "drift": drifted,
             "reasons": reasons,
             "score": score,
         }
 
     except Exception as e:
-        logger.error(f"❌ Drift detection failed: {e}")
+        logger.error("❌ Drift detection failed: %s", e)
         return {
             "next_stage": "mi",
             "turn": 0,
@@ -124,3 +134,19 @@ def run_detect(state) -> dict:
             "reasons": ["exception"],
             "score": 0.0,
         }
+
+# ✅ 응답 생성 직후 한 번만 계산해 trailer로 전달 → 다음 턴 요청 경로에서 재계산하지 않음
+def reply_digest(reply: str) -> str:
+    return format(zlib.crc32((reply or "").encode("utf-8")), "08x")
+
+def analyze_turn_reply(stage: str, reply: str, user_input: str = "") -> dict:
+    # 다음 턴의 history[-2]는 이번 턴의 사용자 입력이므로 동일한 비교 기준을 사용
+    analysis = get_drift_analysis(stage, reply, previous_reply=user_input or None)
+    analysis["reply_digest"] = reply_digest(reply)
+    return analysis
+
+def get_precomputed_analysis(state):
+    cached = getattr(state, "drift", None)
+    if cached and state.response and cached.get("reply_digest") == reply_digest(state.response):
+        return cached
+    return None
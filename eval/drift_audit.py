@@ -0,0 +1,220 @@
+# 📁 eval/drift_audit.py
+# 대용량 JSONL 대화 로그 드리프트 감사.
+# 파일을 바이트 구간(샤드)으로 나눠 프로세스 풀에서 각자 스트리밍으로 읽고 get_drift_analysis를 호출합니다.
+# 샤드마다 단계별 집계(혼동 행렬, 점수 합/제곱합/최소/최대, 고정 구간 히스토그램)만 돌려주므로
+# 파일 크기와 관계없이 메모리 사용량이 일정합니다.
+# 실행: python -m eval.drift_audit logs/*.jsonl [--workers 32] [--shard-mb 64] [--output audit.json]
+#
+# 각 줄에서 읽는 필드 (앞에 있는 이름 우선):
+#   응답: reply, response, text / 이전 응답: previous_reply, previous_text / 단계: stage (없으면 unknown)
+#   정답(선택): should_transition, label, expected → 있으면 precision/recall 계산
+import argparse, glob, json, logging, math, os, sys, time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+HIST_BINS = 80
+HIST_MAX = 2.0
+
+REPLY_FIELDS = ("reply", "response", "text")
+PREVIOUS_FIELDS = ("previous_reply", "previous_text")
+LABEL_FIELDS = ("should_transition", "label", "expected")
+
+def _first(record: dict, fields):
+    for name in fields:
+        value = record.get(name)
+        if value is not None:
+            return value
+    return None
+
+class StageStats:
+    __slots__ = ("n", "drift", "labeled", "tp", "fp", "fn", "tn", "score_sum", "score_sq", "score_min", "score_max", "hist")
+
+    def __init__(self):
+        self.n = self.drift = self.labeled = 0
+        self.tp = self.fp = self.fn = self.tn = 0
+        self.score_sum = self.score_sq = 0.0
+        self.score_min, self.score_max = math.inf, -math.inf
+        self.hist = [0] * (HIST_BINS + 1)  # 마지막 칸은 HIST_MAX 이상
+
+    def add(self, score: float, predicted: bool, expected):
+        self.n += 1
+        self.drift += predicted
+        self.score_sum += score
+        self.score_sq += score * score
+        self.score_min = min(self.score_min, score)
+        self.score_max = max(self.score_max, score)
+        self.hist[min(HIST_BINS, max(0, int(score / HIST_MAX * HIST_BINS)))] += 1
+        if expected is not None:
+            self.labeled += 1
+            if predicted and expected:
+                self.tp += 1
+            elif predicted:
+                self.fp += 1
+            elif expected:
+                self.fn += 1
+            else:
+                self.tn += 1
+
+    def merge(self, other: "StageStats"):
+        for name in ("n", "drift", "labeled", "tp", "fp", "fn", "tn", "score_sum", "score_sq"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.score_min = min(self.score_min, other.score_min)
+        self.score_max = max(self.score_max, other.score_max)
+        self.hist = [a + b for a, b in zip(self.hist, other.hist)]
+
+    def percentile(self, q: float) -> float:
+        target, seen = q * self.n, 0
+        for i, count in enumerate(self.hist):
+            seen += count
+            if count and seen >= target:
+                return min(HIST_MAX, (i + 1) * HIST_MAX / HIST_BINS)
+        return self.score_max
+
+    def to_dict(self) -> dict:
+        if not self.n:
+            return {"n": 0}
+        mean = self.score_sum / self.n
+        result = {
+            "n": self.n,
+            "drift_rate": round(self.drift / self.n, 4),
+            "score_mean": round(mean, 4),
+            "score_std": round(math.sqrt(max(0.0, self.score_sq / self.n - mean * mean)), 4),
+            "score_min": round(self.score_min, 4),
+            "score_max": round(self.score_max, 4),
+            "score_p50": round(self.percentile(0.5), 4),
+            "score_p90": round(self.percentile(0.9), 4),
+            "score_p99": round(self.percentile(0.99), 4),
+            "histogram": {"bins": HIST_BINS, "max": HIST_MAX, "counts": self.hist},
+        }
+        if self.labeled:
+            precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+            recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            result.update({
+                "labeled": self.labeled,
+                "confusion": {"tp": self.tp, "fp": self.fp, "fn": self.fn, "tn": self.tn},
+                "precision": round(precision, 3),
+                "recall": round(recall, 3),
+                "f1_score": round(f1, 3),
+            })
+        return result
+
+# ✅ 줄 경계에 맞춘 바이트 구간 분할 (한 줄은 시작 위치가 속한 샤드에서 처리)
+def plan_shards(paths, shard_bytes: int):
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), shard_bytes):
+            yield path, start, min(size, start + shard_bytes)
+
+def _init_worker():
+    # 턴마다 남는 INFO 로그는 수천만 건 규모에서 병목이 되므로 워커에서는 끔
+    logging.getLogger().setLevel(logging.WARNING)
+    from shared.logger import logger
+    logger.setLevel(logging.WARNING)
+
+def audit_shard(path: str, start: int, end: int) -> tuple:
+    from drift.detector import get_drift_analysis
+    stats, errors = {}, 0
+    with open(path, "rb") as f:
+        if start > 0:
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())  # 이전 샤드에 속한 줄의 나머지 건너뛰기
+        else:
+            pos = 0
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                reply = _first(record, REPLY_FIELDS)
+                if not reply:
+                    continue
+                stage = record.get("stage") or "unknown"
+                result = get_drift_analysis(stage, reply, _first(record, PREVIOUS_FIELDS) or None)
+                expected = _first(record, LABEL_FIELDS)
+                stats.setdefault(stage, StageStats()).add(
+                    float(result.get("score", 0.0)), bool(result.get("drift", False)),
+                    None if expected is None else bool(expected),
+                )
+            except Exception:
+                errors += 1
+    return stats, errors
+
+def expand_paths(patterns) -> list:
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths += sorted(glob.glob(os.path.join(pattern, "*.jsonl")))
+        else:
+            paths += sorted(glob.glob(pattern)) or [pattern]
+    return paths
+
+def run_audit(paths, workers: int = None, shard_mb: float = 64, progress_every: float = 10.0) -> dict:
+    from shared.logger import logger
+    workers = workers or os.cpu_count() or 1
+    shard_bytes = max(1, int(shard_mb * 1024 * 1024))
+    totals, overall, errors, shards_done = {}, StageStats(), 0, 0
+    total_bytes = sum(os.path.getsize(p) for p in paths)
+    start, last_report = time.perf_counter(), time.perf_counter()
+
+    shards = plan_shards(paths, shard_bytes)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        pending = set()
+        # 진행 중인 샤드 수를 제한해 결과 대기열도 일정한 크기로 유지
+        for shard in shards:
+            pending.add(pool.submit(audit_shard, *shard))
+            if len(pending) < workers * 2:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stats, shard_errors = future.result()
+                errors += shard_errors
+                shards_done += 1
+                for stage, s in stats.items():
+                    totals.setdefault(stage, StageStats()).merge(s)
+                    overall.merge(s)
+            if time.perf_counter() - last_report >= progress_every:
+                last_report = time.perf_counter()
+                logger.info(f"📈 드리프트 감사 진행: 샤드 {shards_done}개, 턴 {overall.n:,}개")
+        for future in pending:
+            stats, shard_errors = future.result()
+            errors += shard_errors
+            shards_done += 1
+            for stage, s in stats.items():
+                totals.setdefault(stage, StageStats()).merge(s)
+                overall.merge(s)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(paths),
+        "bytes": total_bytes,
+        "shards": shards_done,
+        "workers": workers,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(overall.n / elapsed, 1) if elapsed else 0.0,
+        "overall": overall.to_dict(),
+        "stages": {stage: s.to_dict() for stage, s in sorted(totals.items())},
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="대용량 JSONL 대화 로그 드리프트 감사")
+    parser.add_argument("paths", nargs="+", help="JSONL 파일, glob 또는 디렉터리 (이벤트 로그 세그먼트 포함)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-mb", type=float, default=64)
+    parser.add_argument("--output", help="결과 JSON 저장 경로")
+    args = parser.parse_args(argv)
+
+    summary = run_audit(expand_paths(args.paths), args.workers, args.shard_mb)
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,15 @@
 import json
 import time
-from sklearn.metrics import precision_score, recall_score, f1_score
+import asyncio
 from agents.user_state_agent import AgentState
 from drift.detector import pure_run_detect  # ✅ 평가용 감지기
 from shared.logger import logger
 
+# ✅ 서버 이벤트 루프를 막지 않도록 스레드에서 평가 실행
 async def evaluate_drift_detection():
+    return await asyncio.to_thread(run_drift_evaluation)
+
+def run_drift_evaluation():
     try:
         with open('eval/evaluation.json', 'r', encoding='utf-8') as f:
             examples = json.load(f)
@@ -52,6 +56,8 @@ async def evaluate_drift_detection():
         logger.warning("⚠️ 평가에 사용할 유효한 예시가 없습니다.")
         return None
 
+    from sklearn.metrics import precision_score, recall_score, f1_score  # ✅ 평가 시점에만 임포트
+
     precision = precision_score(y_true, y_pred, zero_division=0)
     recall = recall_score(y_true, y_pred, zero_division=0)
     f1 = f1_score(y_true, y_pred, zero_division=0)
@@ -0,0 +1,38 @@
+# 📁 gunicorn.conf.py
+# preload → fork 멀티 워커 실행:
+#   TTM_MODEL_PATHS="empathy=/models/empathy/...gguf,mi=...,cbt1=...,cbt2=...,cbt3=...,detect=..." \
+#   gunicorn -c gunicorn.conf.py main:app
+# 마스터가 앱을 임포트하고 GGUF 파일을 페이지 캐시에 올린 뒤 워커를 fork합니다 (마스터는 모델을 로딩하지 않음).
+# 워커는 fork 이후 각자 Llama(use_mmap)를 만들며, 같은 파일을 매핑하므로 가중치 페이지는 페이지 캐시 한 벌을 공유합니다.
+import os
+
+# ✅ preload_app: 마스터가 앱(shared.logger)을 임포트한 뒤 fork하므로 로그는 호출 스레드에서 바로 출력
+#    (비동기 리스너는 fork 이후 워커마다 다시 시작되지만, 기본값은 스레드 없는 동기 출력으로 둠)
+os.environ.setdefault("TTM_LOG_ASYNC", "0")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("TTM_WORKER_TIMEOUT", 600))  # 워커 시작 시 컨텍스트 생성 시간 포함
+graceful_timeout = 60
+
+# ✅ 워커를 fork하기 전 (마스터): 모델 경로 확정 후 페이지 캐시 워밍
+#    양자화 보정은 캐시된 측정값만 사용 (마스터에서 측정 서브프로세스를 띄우지 않음 → 미리 python -m llm.calibration 실행)
+def on_starting(server):
+    from llm.shared_weights import map_models, preloaded_model_paths
+    paths = preloaded_model_paths()
+    if not paths:
+        from llm.calibration import calibrate_model_paths
+        from llm.model_files import local_model_paths
+        paths = calibrate_model_paths({s: p for s, p in local_model_paths().items() if os.path.exists(p)}, measure=False)
+        os.environ["TTM_MODEL_PATHS"] = ",".join(f"{s}={p}" for s, p in paths.items())
+    if not paths:
+        server.log.warning("⚠️ 매핑할 모델 파일이 없습니다. 워커가 각자 다운로드/로딩합니다.")
+        return
+    map_models(paths)
+
+# ✅ fork 이후 (워커): TTM_WORKER_PRELOAD 단계의 컨텍스트를 미리 생성
+def post_worker_init(worker):
+    from llm.shared_weights import init_worker_contexts, preloaded_model_paths
+    init_worker_contexts(preloaded_model_paths())
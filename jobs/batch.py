@@ -0,0 +1,239 @@
+# 📁 jobs/batch.py
+# 오프라인 평가용 배치 대화 실행기.
+# JSONL의 각 줄은 하나의 대화 스크립트: {"id": "c1", "turns": ["안녕하세요", ...], "state": {...선택}}
+# 서버와 같은 턴 순서를 따릅니다: 이전 응답 드리프트 감지(drift.detector.run_detect, 최근 3턴 리셋 포함) → 단계 에이전트.
+# 모델(단계)마다 잠금 하나로 직렬화하면서 서로 다른 단계의 세션은 병렬로 처리합니다.
+# 배치 디코딩은 하지 않습니다: 한 모델 안에서는 턴을 한 번에 하나씩 디코딩하므로 처리량의 상한은 단계 모델 수만큼의
+# 동시 디코딩이며, 모든 대화가 empathy에서 시작하는 초반에는 사실상 순차 실행입니다.
+# 이득은 HTTP 왕복과 에이전트의 토큰 간 타이핑 지연(STREAM_PACING) 제거, 단계 간 병렬성입니다.
+# 서버의 /jobs는 이 모듈을 별도 프로세스로 실행합니다 (jobs.manager) — 같은 프로세스의 모델 인스턴스를 실시간 턴과 공유하면 안 됨.
+# 결과(응답, 단계 전이, 드리프트 점수, 시간)는 턴이 끝날 때마다 JSONL로 기록됩니다.
+# 실행: python -m jobs.batch --input conversations.jsonl --output results.jsonl [--model cbt1=/models/...gguf]
+import argparse, asyncio, json, os, sys, time
+from typing import Dict, Iterable, Optional
+
+from shared.logger import logger
+
+def read_conversations(path: str) -> Iterable[dict]:
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                conv = json.loads(line)
+                conv.setdefault("id", f"conv-{i}")
+                yield conv
+
+# ✅ 워커 스레드에서 에이전트 스트림 하나를 끝까지 소비 (llama.cpp 디코딩이 이벤트 루프를 막지 않도록)
+def _run_turn_sync(stage: str, state, model_path: str, pacing: bool = False) -> dict:
+    from agents.registry import parse_trailer, stream_stage
+    from llm.stopping import STREAM_PACING
+
+    async def consume():
+        STREAM_PACING.set(pacing)  # 기본은 읽는 사람이 없으므로 타이핑 지연 없이 바로 다음 토큰
+        start = time.perf_counter()
+        ttft, trailer, text = None, None, []
+        async for chunk in stream_stage(stage, state, model_path):
+            parsed = parse_trailer(chunk)
+            if parsed is not None:
+                trailer = parsed
+                break
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            text.append(chunk)
+        return {
+            "trailer": trailer or {},
+            "streamed": b"".join(text).decode("utf-8", errors="ignore").strip(),
+            "ttft_ms": ttft * 1000 if ttft is not None else None,
+            "total_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    return asyncio.run(consume())
+
+# ✅ 에이전트 trailer를 클라이언트처럼 다음 요청 상태에 반영
+def apply_trailer(state, trailer: dict, drift: Optional[dict]):
+    state.apply_trailer(trailer)
+    state.drift = drift
+
+class BatchRunner:
+    def __init__(self, model_paths: Dict[str, str], concurrency: int = 32, pacing: bool = False):
+        from agents.registry import STAGE_LOADERS
+        self.model_paths = model_paths
+        self.concurrency = concurrency
+        self.pacing = pacing
+        self.stage_locks = {stage: asyncio.Lock() for stage in STAGE_LOADERS}
+        self.stats = {"conversations": 0, "turns": 0, "errors": 0, "transitions": 0, "resets": 0}
+
+    # ✅ main.generate_turn과 같은 판단: 이전 응답의 드리프트를 기록하고, 최근 3턴 모두 드리프트면 MI로 리셋
+    #    (리셋 턴은 모델을 호출하지 않고 리셋 안내 문구가 응답이 됨)
+    async def detect_reset(self, conv_id: str, index: int, state) -> Optional[dict]:
+        from drift.detector import get_precomputed_analysis, run_detect
+        if not state.response:
+            return None
+        stage, question = state.stage, (state.question or "").strip()
+        detected = await asyncio.to_thread(run_detect, state, get_precomputed_analysis(state))
+        if not detected.get("reset_triggered"):
+            return None
+        apply_trailer(state, {**detected, "reset_triggered": False}, None)
+        return {
+            "type": "turn",
+            "conversation_id": conv_id,
+            "index": index,
+            "stage": stage,
+            "next_stage": detected["next_stage"],
+            "turn": state.turn,
+            "question": question,
+            "response": detected["response"],
+            "drift_score": detected.get("score"),
+            "drift": bool(detected.get("drift")),
+            "reasons": detected.get("reasons", []),
+            "reset": True,
+            "queued_ms": 0.0,
+            "ttft_ms": None,
+            "total_ms": 0.0,
+        }
+
+    async def run_turn(self, conv_id: str, index: int, state) -> dict:
+        from drift.detector import analyze_turn_reply
+        reset = await self.detect_reset(conv_id, index, state)
+        if reset is not None:
+            return reset
+        stage = state.stage
+        question = (state.question or "").strip()
+        waited = time.perf_counter()
+        # 같은 모델 인스턴스는 한 번에 한 턴만 디코딩 (다른 단계 모델은 병렬)
+        async with self.stage_locks[stage]:
+            queued_ms = (time.perf_counter() - waited) * 1000
+            result = await asyncio.to_thread(_run_turn_sync, stage, state, self.model_paths[stage], self.pacing)
+
+        trailer = result["trailer"]
+        reply = trailer.get("response") or state.response or ""
+        drift = await asyncio.to_thread(analyze_turn_reply, stage, reply, question) if reply else None
+        record = {
+            "type": "turn",
+            "conversation_id": conv_id,
+            "index": index,
+            "stage": stage,
+            "next_stage": trailer.get("next_stage", stage),
+            "turn": state.turn,
+            "question": question,
+            "response": reply,
+            "drift_score": drift and drift.get("score"),
+            "drift": bool(drift and drift.get("drift")),
+            "reasons": drift.get("reasons", []) if drift else [],
+            "reset": False,
+            "queued_ms": queued_ms,
+            "ttft_ms": result["ttft_ms"],
+            "total_ms": result["total_ms"],
+        }
+        apply_trailer(state, trailer, drift)
+        return record
+
+    async def run_conversation(self, conv: dict, sink):
+        from shared.state import AgentState
+        conv_id = str(conv["id"])
+        initial = {"session_id": conv_id, "stage": "empathy", **conv.get("state", {})}
+        initial.setdefault("preset_questions", [])
+        initial.setdefault("drift_trace", [])
+        state = AgentState.from_payload(initial)
+        transitions, start = [], time.perf_counter()
+        for index, question in enumerate(conv.get("turns", [])):
+            if state.stage not in self.model_paths:
+                break  # "end" 단계 또는 모델 없음
+            state.question = question
+            try:
+                record = await self.run_turn(conv_id, index, state)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.exception(f"❌ 배치 턴 실패: {conv_id}#{index}")
+                sink({"type": "error", "conversation_id": conv_id, "index": index, "error": str(e)})
+                break
+            self.stats["turns"] += 1
+            self.stats["resets"] += record["reset"]
+            if record["next_stage"] != record["stage"]:
+                transitions.append([index, record["stage"], record["next_stage"]])
+                self.stats["transitions"] += 1
+            sink(record)
+        self.stats["conversations"] += 1
+        sink({
+            "type": "conversation",
+            "conversation_id": conv_id,
+            "final_stage": state.stage,
+            "turns": len(conv.get("turns", [])),
+            "transitions": transitions,
+            "total_ms": (time.perf_counter() - start) * 1000,
+        })
+
+    # ✅ 동시에 concurrency개 대화를 진행 (대화 내부의 턴은 순서대로)
+    async def run(self, conversations: Iterable[dict], sink) -> dict:
+        start = time.perf_counter()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                conv = await queue.get()
+                try:
+                    if conv is None:
+                        return
+                    await self.run_conversation(conv, sink)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        for conv in conversations:
+            await queue.put(conv)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - start
+        return {**self.stats, "elapsed_s": elapsed, "turns_per_s": self.stats["turns"] / elapsed if elapsed else 0.0}
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8")
+        self.count = 0
+
+    def __call__(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+async def run_job(input_path: str, output_path: str, model_paths: Dict[str, str], concurrency: int = 32) -> dict:
+    sink = JsonlSink(output_path)
+    try:
+        runner = BatchRunner(model_paths, concurrency)
+        summary = await runner.run(read_conversations(input_path), sink)
+        sink({"type": "summary", **summary})
+        return summary
+    finally:
+        sink.close()
+
+def parse_model_args(values) -> Dict[str, str]:
+    paths = {}
+    for value in values or []:
+        stage, _, path = value.partition("=")
+        paths[stage] = path
+    return paths
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="스크립트 대화 JSONL을 단계 에이전트로 일괄 실행")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--model", action="append", help="stage=path (기본값: /models 아래 다운로드 경로)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    from llm.lora import lora_model_paths
+    from llm.model_files import local_model_paths
+    model_paths = {**local_model_paths(), **lora_model_paths(), **parse_model_args(args.model)}
+    missing = [s for s, p in model_paths.items() if not os.path.exists(p)]
+    if missing:
+        print(f"⚠️ 모델 파일 없음: {', '.join(missing)}", file=sys.stderr)
+
+    summary = asyncio.run(run_job(args.input, args.output, model_paths, args.concurrency))
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if not summary["errors"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
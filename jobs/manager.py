@@ -0,0 +1,80 @@
+# 📁 jobs/manager.py
+# `/jobs` 엔드포인트용 배치 작업 관리: 입력 JSONL을 작업 디렉터리에 저장하고 백그라운드에서 실행합니다.
+# 작업은 별도 프로세스(python -m jobs.batch)에서 자체 모델 인스턴스로 실행합니다.
+# 서버의 Llama 컨텍스트는 실시간 /chat 턴이 이벤트 루프에서 디코딩 중이므로 작업 스레드와 공유할 수 없습니다.
+# (가중치는 mmap된 GGUF의 페이지 캐시를 공유하므로 추가 메모리는 주로 KV 캐시입니다.)
+import asyncio, json, os, sys, time, uuid
+from typing import Dict, Optional
+
+from shared.logger import logger
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+JOB_DIR = os.getenv("TTM_JOB_DIR", "/tmp/ttm-jobs")
+MAX_CONCURRENCY = int(os.getenv("TTM_JOB_MAX_CONCURRENCY", 64))  # 작업 하나에서 동시에 진행하는 대화 수 상한
+MAX_RUNNING_JOBS = int(os.getenv("TTM_JOB_MAX_RUNNING", 1))  # 작업 프로세스마다 단계 모델을 따로 올리므로 기본 1개
+
+class Job:
+    def __init__(self, job_id: str, directory: str):
+        self.id = job_id
+        self.input_path = os.path.join(directory, "input.jsonl")
+        self.output_path = os.path.join(directory, "results.jsonl")
+        self.status = "queued"
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.summary: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.process: Optional[asyncio.subprocess.Process] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "status": self.status, "created": self.created, "finished": self.finished,
+            "summary": self.summary, "error": self.error,
+        }
+
+JOBS: Dict[str, Job] = {}
+
+# ✅ 작업 프로세스 실행 → 마지막 stdout 줄(요약 JSON) 반환, 턴 오류가 있어도 요약이 있으면 완료로 처리
+async def run_job_process(job: Job, model_paths: Dict[str, str], concurrency: int) -> dict:
+    args = [sys.executable, "-m", "jobs.batch", "--input", job.input_path, "--output", job.output_path,
+            "--concurrency", str(concurrency)]
+    for stage, path in model_paths.items():
+        args += ["--model", f"{stage}={path}"]
+    job.process = await asyncio.create_subprocess_exec(*args, cwd=ROOT_DIR, stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await job.process.communicate()  # 로그(stderr)는 서버 로그로 그대로 출력
+    lines = stdout.decode("utf-8", errors="ignore").strip().splitlines()
+    try:
+        return json.loads(lines[-1])
+    except (IndexError, ValueError):
+        raise RuntimeError(f"배치 작업 프로세스 실패 (종료 코드 {job.process.returncode})")
+
+def running_jobs() -> int:
+    return sum(job.status in ("queued", "running") for job in JOBS.values())
+
+def submit_job(body: bytes, model_paths: Dict[str, str], concurrency: int = 32) -> Job:
+    concurrency = max(1, min(concurrency, MAX_CONCURRENCY))
+    job_id = uuid.uuid4().hex[:12]
+    directory = os.path.join(JOB_DIR, job_id)
+    os.makedirs(directory, exist_ok=True)
+    job = Job(job_id, directory)
+    with open(job.input_path, "wb") as f:
+        f.write(body)
+    JOBS[job_id] = job
+
+    async def run():
+        job.status = "running"
+        try:
+            job.summary = await run_job_process(job, dict(model_paths), concurrency)
+            job.status = "done"
+        except Exception as e:
+            logger.exception(f"❌ 배치 작업 실패: {job_id}")
+            job.status, job.error = "failed", str(e)
+        finally:
+            job.finished = time.time()
+
+    job.task = asyncio.create_task(run())
+    return job
+
+def get_job(job_id: str) -> Optional[Job]:
+    return JOBS.get(job_id)
@@ -1,24 +1,18 @@
 # 📁 llm/agent.py
-from llm.loader import load_pipeline
+from llm.backend import get_stage_backend
 from shared.state import AgentState
 
 def run_llm_agent(state: AgentState, model_path: str, system_prompt: str, max_new_tokens: int = 100) -> AgentState:
-    pipe = load_pipeline(model_path)
-    
-    prompt = f"""
-<|user|>
-{state['question']}
-<|system|>
-{system_prompt}
-<|assistant|>
-""".strip()
+    # ✅ HF 체크포인트 경로를 사용하므로 transformers 백엔드 고정 (모델은 한 번만 로딩 후 재사용)
+    backend = get_stage_backend(state.stage, model_path, name="transformers")
 
-    output = pipe(prompt, max_new_tokens=max_new_tokens, do_sample=True, temperature=0.7)[0]["generated_text"]
-    response = output.replace(prompt, "").strip()
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": state.question},
+    ]
+    response = "".join(backend.stream_chat(messages, max_tokens=max_new_tokens, temperature=0.7)).strip()
 
-    return {
-        **state,
-        "response": response,
-        "turn": state.get("turn", 0) + 1,
-        "history": state["history"] + [state["stage"]]
-    }
+    state.response = response
+    state.turn += 1
+    state.history = state.history + [state.stage]
+    return state
@@ -0,0 +1,277 @@
+# 📁 llm/backend.py
+# 추론 백엔드 공통 인터페이스. 모든 단계 에이전트는 이 인터페이스를 통해 토큰을 스트리밍합니다.
+import asyncio, contextlib, os, queue, threading, weakref
+from typing import Callable, Iterator, List, Optional
+
+BACKEND_ENV = "TTM_BACKEND"
+
+class InferenceBackend:
+    name = "base"
+
+    def __init__(self, stage: str, model_path: str):
+        self.stage = stage
+        self.model_path = model_path
+
+    def load(self):
+        raise NotImplementedError
+
+    def tokenize(self, text: str) -> List[int]:
+        raise NotImplementedError
+
+    def stream_chat(self, messages: List[dict], **params) -> Iterator[str]:
+        raise NotImplementedError
+
+    def embed(self, text: str) -> List[float]:
+        raise NotImplementedError
+
+    def save_state(self):
+        raise NotImplementedError
+
+    def load_state(self, state):
+        raise NotImplementedError
+
+# ✅ llama.cpp 백엔드 (각 에이전트의 load_*_model 결과를 그대로 사용 → offload/LoRA 모드도 동일하게 동작)
+class LlamaCppBackend(InferenceBackend):
+    name = "llama_cpp"
+
+    def __init__(self, stage: str, model_path: str, loader: Optional[Callable] = None):
+        super().__init__(stage, model_path)
+        self.loader = loader
+        self.llm = None
+
+    def load(self):
+        from agents.registry import STAGE_LOADERS, get_load_lock, load_stage_model
+        from llm.model_io import cold_load
+        if self.loader is None:
+            self.llm = load_stage_model(self.stage, self.model_path)
+        elif self.stage in STAGE_LOADERS:
+            # 백그라운드 프리페치와 같은 모델을 동시에 로딩하지 않도록 단계 잠금 공유
+            with get_load_lock(self.stage), cold_load(self.model_path):
+                self.llm = self.loader(self.model_path)
+        else:
+            with cold_load(self.model_path):
+                self.llm = self.loader(self.model_path)
+        return self.llm
+
+    def _require(self, attr: str):
+        llm = self.load()
+        if not hasattr(llm, attr):
+            raise NotImplementedError(f"{type(llm).__name__}는 {attr}를 지원하지 않습니다")
+        return getattr(llm, attr)
+
+    def tokenize(self, text: str) -> List[int]:
+        return self._require("tokenize")(text.encode("utf-8"), add_bos=False, special=True)
+
+    def stream_chat(self, messages: List[dict], **params) -> Iterator[str]:
+        from llm.candidates import best_candidate, candidate_count
+        from llm.degrade import TOKEN_CAP, cap_tokens
+        llm = self.load()
+        # ✅ 다중 후보 모드: k개를 배치로 생성해 드리프트 점수 최저 후보를 전송 (과부하 강등 중에는 사용 안 함)
+        #    후보가 모두 끝난 뒤 한꺼번에 내보내므로 TTFT가 전체 생성 시간만큼 늘어남 (llm/candidates.py 참고)
+        k = candidate_count(self.stage)
+        if k > 1 and TOKEN_CAP.get() is None:
+            pieces = best_candidate(llm, self.stage, messages, k, **params)
+            if pieces is not None:
+                yield from pieces
+                return
+        chunks = llm.create_chat_completion(messages=messages, stream=True, **cap_tokens(params))
+        try:
+            for chunk in chunks:
+                token = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                if token:
+                    yield token
+        finally:
+            # ✅ 호출 측에서 스트림을 닫으면 디코딩도 즉시 중단
+            chunks.close()
+
+    def embed(self, text: str) -> List[float]:
+        return self._require("embed")(text)
+
+    def save_state(self):
+        return self._require("save_state")()
+
+    def load_state(self, state):
+        return self._require("load_state")(state)
+
+# ✅ transformers CPU 백엔드 (모델/토크나이저는 llm.loader에서 한 번만 로딩)
+class TransformersBackend(InferenceBackend):
+    name = "transformers"
+
+    def __init__(self, stage: str, model_path: str, precision: Optional[str] = None):
+        super().__init__(stage, model_path)
+        self.precision = precision or os.getenv("TTM_HF_PRECISION", "bf16")
+        self.tokenizer = None
+        self.model = None
+        self._state = None
+
+    def load(self):
+        if self.model is None:
+            from llm.loader import load_model
+            self.tokenizer, self.model = load_model(self.model_path, self.precision)
+        return self.model
+
+    def tokenize(self, text: str) -> List[int]:
+        self.load()
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def stream_chat(self, messages: List[dict], **params) -> Iterator[str]:
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+        from llm.degrade import cap_tokens
+
+        class _Cancelled(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return cancelled.is_set()
+
+        cancelled = threading.Event()
+        params = cap_tokens(params)
+        self.load()
+        input_ids = self.tokenizer.apply_chat_template(messages, add_generation_prompt=True, return_tensors="pt")
+        # timeout: 생성 스레드가 멈춰도 요청이 무한히 기다리지 않도록 (토큰 사이 최대 대기 초)
+        timeout = float(os.getenv("TTM_HF_STREAM_TIMEOUT", 120))
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout)
+        temperature = params.get("temperature", 0.7)
+        gen_kwargs = dict(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=params.get("max_tokens") or 128,
+            do_sample=temperature > 0,
+            temperature=temperature or None,
+            top_p=params.get("top_p", 0.9),
+            repetition_penalty=params.get("repeat_penalty", 1.1),
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([_Cancelled()]),
+        )
+        if self._state is not None:
+            gen_kwargs["past_key_values"] = self._copy_cache(self._state)
+
+        errors = []
+        worker = threading.Thread(target=self._generate, args=(gen_kwargs, errors), daemon=True)
+        worker.start()
+        try:
+            try:
+                for text in streamer:
+                    if text:
+                        yield text
+            except queue.Empty:
+                raise TimeoutError(f"{self.stage} 생성이 {timeout:g}초 동안 토큰을 내지 않았습니다")
+            if errors:
+                raise errors[0]  # 생성 스레드의 예외(OOM, 잘못된 인자 등)를 호출 측으로 전달
+        finally:
+            cancelled.set()
+            worker.join(timeout)
+
+    def _generate(self, gen_kwargs: dict, errors: list):
+        import torch
+        try:
+            with torch.inference_mode():
+                self.model.generate(**gen_kwargs)
+        except Exception as e:
+            errors.append(e)
+            gen_kwargs["streamer"].end()  # 소비 측 반복을 끝냄 (정상 종료 시에는 generate가 호출)
+
+    def embed(self, text: str) -> List[float]:
+        import torch
+        self.load()
+        inputs = self.tokenizer(text, return_tensors="pt")
+        with torch.inference_mode():
+            hidden = self.model(**inputs, output_hidden_states=True).hidden_states[-1]
+        return hidden.mean(dim=1)[0].float().tolist()
+
+    # ✅ 시스템 프롬프트 등 공통 접두사의 KV 캐시를 저장/복원
+    def save_state(self, prefix_messages: Optional[List[dict]] = None):
+        import torch
+        self.load()
+        if prefix_messages is None:
+            return self._state
+        input_ids = self.tokenizer.apply_chat_template(prefix_messages, return_tensors="pt")
+        with torch.inference_mode():
+            self._state = self.model(input_ids, use_cache=True).past_key_values
+        return self._state
+
+    def load_state(self, state):
+        self._state = state
+
+    @staticmethod
+    def _copy_cache(cache):
+        import copy
+        return copy.deepcopy(cache)
+
+BACKENDS = {
+    LlamaCppBackend.name: LlamaCppBackend,
+    TransformersBackend.name: TransformersBackend,
+}
+
+def get_backend_name(stage: str) -> str:
+    return os.getenv(f"{BACKEND_ENV}_{stage.upper()}") or os.getenv(BACKEND_ENV, LlamaCppBackend.name)
+
+# ✅ 단계별 백엔드 캐시
+BACKEND_INSTANCE = {}
+
+def get_stage_backend(stage: str, model_path: str, loader: Optional[Callable] = None, name: Optional[str] = None) -> InferenceBackend:
+    name = name or get_backend_name(stage)
+    # ✅ 과부하 시 작은 대체 모델로 전환 (llm.degrade가 요청 컨텍스트에 지정)
+    from llm.degrade import MODEL_OVERRIDE, load_fallback_model
+    override = MODEL_OVERRIDE.get()
+    if override and name == LlamaCppBackend.name:
+        model_path, loader = override, load_fallback_model
+    if name not in BACKENDS:
+        raise ValueError(f"지원하지 않는 추론 백엔드: {name}")
+    if name == TransformersBackend.name and (model_path or "").lower().endswith(".gguf"):
+        # transformers는 GGUF를 읽지 못하므로 기본 GGUF 경로일 때만 HF 체크포인트 디렉토리로 대체 (명시한 경로가 우선)
+        model_path = os.getenv(f"TTM_HF_MODEL_{stage.upper()}") or model_path
+    key = (name, stage, model_path)
+    if key not in BACKEND_INSTANCE:
+        if name == LlamaCppBackend.name:
+            BACKEND_INSTANCE[key] = LlamaCppBackend(stage, model_path, loader)
+        else:
+            BACKEND_INSTANCE[key] = BACKENDS[name](stage, model_path)
+    return BACKEND_INSTANCE[key]
+
+# ✅ 모델(컨텍스트)별 생성 잠금: 한 llama.cpp 컨텍스트는 한 번에 한 시퀀스만 디코딩할 수 있음
+# 실시간 턴(main.generate_turn, 이벤트 루프)과 백그라운드 스레드(프리페치 등)가 같은 잠금을 사용합니다.
+GENERATION_LOCKS = {}
+_GENERATION_GUARD = threading.Lock()
+
+def generation_key(stage: str, model_path: str) -> tuple:
+    from llm.degrade import MODEL_OVERRIDE
+    override = MODEL_OVERRIDE.get()
+    if override and get_backend_name(stage) == LlamaCppBackend.name:
+        return ("fallback", override)  # 대체 모델은 여러 단계가 공유
+    from llm.lora import BASE_MODEL_ENV, LORA_STAGES, is_lora_mode
+    if is_lora_mode() and stage in LORA_STAGES:
+        return ("lora", os.getenv(BASE_MODEL_ENV))  # LoRA 단계는 베이스 컨텍스트 하나를 공유 (offload 서버의 lock_key와 동일)
+    return (stage, model_path)
+
+def generation_lock(key: tuple) -> threading.Lock:
+    with _GENERATION_GUARD:
+        if key not in GENERATION_LOCKS:
+            GENERATION_LOCKS[key] = threading.Lock()
+        return GENERATION_LOCKS[key]
+
+# ✅ 이벤트 루프 쪽 대기열: 같은 모델을 기다리는 턴은 asyncio.Lock에서 도착 순서대로 대기 (루프별로 따로 둠)
+_LOOP_LOCKS = weakref.WeakKeyDictionary()
+
+def _loop_lock(key: tuple) -> asyncio.Lock:
+    locks = _LOOP_LOCKS.setdefault(asyncio.get_running_loop(), {})
+    if key not in locks:
+        locks[key] = asyncio.Lock()
+    return locks[key]
+
+# ✅ 이벤트 루프용: 대기열 맨 앞의 턴 하나만 작업 스레드에서 스레드 잠금을 블로킹으로 기다림 (폴링 없음)
+#    취소되면 스레드가 잠금을 잡는 즉시 풀어 주므로 잠금이 새지 않음
+@contextlib.asynccontextmanager
+async def hold_generation(key: tuple):
+    lock = generation_lock(key)
+    async with _loop_lock(key):
+        if not lock.acquire(blocking=False):
+            acquiring = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                acquiring.add_done_callback(lambda f: f.cancelled() or f.exception() or lock.release())
+                raise
+        try:
+            yield
+        finally:
+            lock.release()
@@ -0,0 +1,271 @@
+# 📁 llm/calibration.py
+# 호스트별 양자화 변형 선택 (기동 시 1회 보정, 결과는 디스크에 캐시).
+# 단계 모델 디렉토리의 GGUF 변형(Q4_K_M, Q5_K_M, Q8_0 ...)마다 별도 프로세스에서 로딩 시간, 첫 토큰 지연,
+# decode tokens/s, RSS를 측정하고, 지연 목표를 만족하는 변형 중 가장 큰(정밀한) 것을 고른 뒤
+# 전체 메모리 예산을 넘으면 가장 큰 단계부터 한 단계씩 작은 변형으로 내립니다.
+# 측정값은 CPU 모델/명령어 집합/메모리/llama_cpp 버전과 파일 크기·수정 시각이 같으면 재사용되므로
+# 두 번째 기동부터는 측정 없이 선택만 다시 계산합니다.
+#   TTM_CALIBRATE=0                 : 보정 생략 (기본 경로 그대로)
+#   TTM_CALIBRATION_CACHE           : 캐시 파일 (기본 /models/.calibration.json)
+#   TTM_CALIBRATION_MEMORY_MB       : 단계 모델 전체 메모리 예산 (기본: 사용 가능 메모리의 90%)
+#   TTM_CALIBRATION_MIN_TPS         : 최소 decode tokens/s (기본 4)
+#   TTM_SLO_TTFT_MS                 : 첫 토큰 지연 목표 (llm.degrade와 공용, 기본 3000)
+#   TTM_QUANT_VARIANTS_<STAGE>      : 후보 GGUF 경로 목록 (쉼표 구분, 기본: 기본 경로와 같은 디렉토리의 *.gguf)
+# 실행: python -m llm.calibration [--force] [--model cbt1=/models/cbt1/...gguf]
+import argparse, glob, hashlib, json, os, platform, re, subprocess, sys, time
+from typing import Dict, List, Optional
+
+from shared.logger import logger
+
+CACHE_VERSION = 1
+CPU_FLAGS = ("avx", "avx2", "fma", "f16c", "avx512f", "avx512bw", "avx512_vnni", "avx_vnni", "amx_int8", "neon", "asimd")
+QUANT_PATTERN = re.compile(r"(?:IQ\d_[A-Z]+|Q\d_K(?:_[SML])?|Q\d_\d|BF16|F16|F32)", re.IGNORECASE)
+CALIBRATION_PROMPT = "요즘 회의에서 실수할까 봐 계속 불안하고 잠도 잘 못 자요."
+
+def _status_kb(field: str) -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+# ✅ 측정 결과를 다른 호스트와 구분하는 기준 (CPU/명령어 집합/메모리/llama_cpp 버전)
+def host_fingerprint() -> dict:
+    cpu, flags = None, set()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                key = key.strip()
+                if key in ("model name", "Model") and cpu is None:
+                    cpu = value.strip()
+                elif key in ("flags", "Features") and not flags:
+                    flags = set(value.split())
+    except OSError:
+        pass
+    try:
+        from importlib.metadata import version
+        llama_version = version("llama_cpp_python")
+    except Exception:
+        llama_version = None
+    mem_gb = None
+    try:
+        mem_gb = round(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3)
+    except (ValueError, OSError, AttributeError):
+        pass
+    return {
+        "cpu": cpu or platform.processor() or platform.machine(),
+        "flags": sorted(flags & set(CPU_FLAGS)),
+        "cores": os.cpu_count(),
+        "mem_gb": mem_gb,
+        "llama_cpp": llama_version,
+    }
+
+def host_key(host: dict) -> str:
+    return hashlib.sha1(json.dumps(host, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def quant_label(path: str) -> str:
+    match = QUANT_PATTERN.search(os.path.basename(path))
+    return match.group(0).upper() if match else "unknown"
+
+def _file_id(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+# ✅ 단계별 후보 변형: 환경 변수로 지정하거나 기본 경로와 같은 디렉토리의 GGUF 전부
+def discover_variants(stage: str, default_path: str) -> List[str]:
+    value = os.getenv(f"TTM_QUANT_VARIANTS_{stage.upper()}")
+    if value:
+        paths = [p.strip() for p in value.split(",") if p.strip()]
+    else:
+        paths = glob.glob(os.path.join(os.path.dirname(default_path), "*.gguf"))
+        paths = [p for p in paths if not re.search(r"mmproj|lora|adapter", os.path.basename(p), re.IGNORECASE)]
+    paths = [p for p in dict.fromkeys(paths + [default_path]) if os.path.exists(p)]
+    return sorted(paths, key=os.path.getsize, reverse=True)  # 큰 파일(정밀한 양자화) 먼저
+
+def targets() -> dict:
+    budget = os.getenv("TTM_CALIBRATION_MEMORY_MB")
+    if budget is None:
+        from llm.prefetch import available_memory_bytes
+        available = available_memory_bytes()
+        budget = available * 0.9 / 1024 / 1024 if available else None
+    return {
+        "memory_mb": float(budget) if budget is not None else None,
+        "min_tps": float(os.getenv("TTM_CALIBRATION_MIN_TPS", 4)),
+        "ttft_ms": float(os.getenv("TTM_SLO_TTFT_MS", 3000)),
+    }
+
+# ✅ 자식 프로세스에서 실행: 단계 로더 설정 그대로 로딩 → 고정 프롬프트 한 번 생성
+def measure_variant(stage: str, path: str, max_tokens: int = 32) -> dict:
+    from agents.registry import get_stage_prompt, load_stage_model
+    rss_before = _status_kb("VmRSS")
+    start = time.perf_counter()
+    llm = load_stage_model(stage, path)
+    load_s = time.perf_counter() - start
+    messages = [{"role": "system", "content": get_stage_prompt(stage)}, {"role": "user", "content": CALIBRATION_PROMPT}]
+    llm.create_chat_completion(messages=messages, max_tokens=1)  # 스레드풀/버퍼 워밍업
+    if hasattr(llm, "reset"):
+        llm.reset()  # 접두사 KV 재사용 없이 첫 요청과 같은 조건으로 측정
+    start, first, tokens = time.perf_counter(), None, 0
+    for chunk in llm.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=0.0, stream=True):
+        if chunk.get("choices", [{}])[0].get("delta", {}).get("content"):
+            tokens += 1
+            if first is None:
+                first = time.perf_counter()
+    end = time.perf_counter()
+    return {
+        "load_s": round(load_s, 3),
+        "ttft_ms": round((first - start) * 1000, 1) if first is not None else None,
+        "decode_tps": round((tokens - 1) / (end - first), 2) if first is not None and tokens > 1 and end > first else None,
+        "rss_mb": round((_status_kb("VmHWM") - rss_before) / 1024, 1),
+    }
+
+def _measure_in_subprocess(stage: str, path: str, timeout: float) -> dict:
+    # 변형마다 새 프로세스 → 이전 변형의 매핑/힙이 RSS에 섞이지 않고, 측정이 끝나면 메모리가 바로 반환됨
+    cmd = [sys.executable, "-m", "llm.calibration", "--measure", stage, path]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    except subprocess.TimeoutExpired:
+        return {"error": f"timeout>{timeout:.0f}s"}
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["failed"])[-1][:200]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def load_cache(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") == CACHE_VERSION:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {}
+
+def save_cache(path: str, cache: dict):
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"⚠️ 보정 결과 저장 실패: {e}")
+
+def _fits_latency(m: dict, target: dict) -> bool:
+    return (
+        m.get("decode_tps") is not None and m["decode_tps"] >= target["min_tps"]
+        and m.get("ttft_ms") is not None and m["ttft_ms"] <= target["ttft_ms"]
+    )
+
+def _memory_mb(m: dict) -> float:
+    return m.get("rss_mb") or m["size"] / 1024 / 1024  # 측정이 없으면 파일 크기(mmap 가중치)로 추정
+
+# ✅ 지연 목표를 만족하는 가장 정밀한 변형 → 메모리 예산 초과 시 가장 큰 단계부터 한 단계씩 축소
+def select_variants(variants: Dict[str, List[dict]], target: dict) -> Dict[str, dict]:
+    options = {}
+    for stage, measured in variants.items():
+        ok = [m for m in measured if _fits_latency(m, target)]
+        if not ok and len(measured) > 1:
+            ok = [max(measured, key=lambda m: m.get("decode_tps") or 0.0)]
+            logger.warning(f"⚠️ {stage}: 지연 목표를 만족하는 변형이 없어 가장 빠른 {ok[0]['label']} 선택")
+        options[stage] = ok or measured
+    choice = {stage: 0 for stage in options}
+    budget = target.get("memory_mb")
+    while budget is not None:
+        total = sum(_memory_mb(options[s][i]) for s, i in choice.items())
+        if total <= budget:
+            break
+        shrinkable = [s for s, i in choice.items() if i + 1 < len(options[s])]
+        if not shrinkable:
+            logger.warning(f"⚠️ 가장 작은 변형으로도 메모리 예산 초과: {total:.0f}MB > {budget:.0f}MB")
+            break
+        stage = max(shrinkable, key=lambda s: _memory_mb(options[s][choice[s]]))
+        choice[stage] += 1
+    return {stage: options[stage][i] for stage, i in choice.items()}
+
+# ✅ measure=False: 캐시된 측정값으로만 선택 (측정되지 않은 변형은 후보에서 제외, 캐시 파일도 건드리지 않음)
+def calibrate_model_paths(paths: Dict[str, str], force: bool = False, cache_path: Optional[str] = None,
+                          measure: bool = True) -> Dict[str, str]:
+    if os.getenv("TTM_CALIBRATE", "1") == "0":
+        return paths
+    from agents.registry import STAGE_LOADERS
+    cache_path = cache_path or os.getenv("TTM_CALIBRATION_CACHE", "/models/.calibration.json")
+    host = host_fingerprint()
+    key = host_key(host)
+    cache = {} if force else load_cache(cache_path)
+    previous = cache.get("measurements", {}) if cache.get("host_key") == key else {}
+    timeout = float(os.getenv("TTM_CALIBRATION_TIMEOUT", 900))
+
+    measurements, variants, measured_now = {}, {}, 0
+    for stage, default_path in paths.items():
+        if stage not in STAGE_LOADERS or not os.path.exists(default_path):
+            continue
+        candidates = discover_variants(stage, default_path)
+        variants[stage] = []
+        for path in candidates:
+            file_id = _file_id(path)
+            m = previous.get(path)
+            if not m or m.get("error") or m.get("size") != file_id["size"] or m.get("mtime") != file_id["mtime"]:
+                m = {"label": quant_label(path), **file_id}
+                if len(candidates) > 1 and not measure:
+                    m["error"] = "not_measured"
+                elif len(candidates) > 1:  # 후보가 하나뿐이면 고를 것이 없으므로 측정 생략
+                    logger.info(f"⚖️ {stage} {m['label']} 보정 측정 중: {os.path.basename(path)}")
+                    m.update(_measure_in_subprocess(stage, path, timeout))
+                    measured_now += 1
+            measurements[path] = m
+            if not m.get("error"):
+                variants[stage].append({"path": path, **m})
+        if not variants[stage]:
+            logger.warning(f"⚠️ {stage}: 보정 측정 실패 → 기본 변형 유지 ({os.path.basename(default_path)})")
+            del variants[stage]
+
+    target = targets()
+    selected = select_variants(variants, target)
+    result = dict(paths)
+    for stage, m in selected.items():
+        result[stage] = m["path"]
+        if m["path"] != paths[stage]:
+            logger.info(f"⚖️ {stage}: {quant_label(paths[stage])} → {m['label']} "
+                        f"(decode {m.get('decode_tps')} tok/s, ttft {m.get('ttft_ms')}ms, rss {m.get('rss_mb')}MB)")
+
+    if not measure:
+        return result
+    save_cache(cache_path, {
+        "version": CACHE_VERSION,
+        "host_key": key,
+        "host": host,
+        "ts": time.time(),
+        "targets": target,
+        "measurements": measurements,
+        "selection": {stage: m["path"] for stage, m in selected.items()},
+    })
+    logger.info(f"⚖️ 양자화 보정 완료: 측정 {measured_now}개, 캐시 재사용 {len(measurements) - measured_now}개")
+    return result
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="호스트별 양자화 변형 보정")
+    parser.add_argument("--measure", nargs=2, metavar=("STAGE", "PATH"), help="(내부용) 변형 하나 측정 후 JSON 출력")
+    parser.add_argument("--model", action="append", help="stage=path (기본값: /models 아래 다운로드 경로)")
+    parser.add_argument("--force", action="store_true", help="캐시된 측정값 무시")
+    parser.add_argument("--cache", default=None)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        stage, path = args.measure
+        print(json.dumps(measure_variant(stage, path, int(os.getenv("TTM_CALIBRATION_TOKENS", 32)))))
+        return 0
+
+    from jobs.batch import parse_model_args
+    from llm.model_files import local_model_paths
+    paths = {**local_model_paths(), **parse_model_args(args.model)}
+    selected = calibrate_model_paths(paths, force=args.force, cache_path=args.cache)
+    print(json.dumps(selected, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
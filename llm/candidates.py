@@ -0,0 +1,254 @@
+# 📁 llm/candidates.py
+# 다중 후보 생성 + 드리프트 점수 재정렬 (선택 기능).
+# 프롬프트를 한 번만 prefill해 k개 시퀀스가 KV 캐시를 공유하고, 이후 디코딩 스텝마다 k개 토큰을 한 배치로 처리합니다
+# (llama.cpp 저수준 API: llama_batch의 seq_id 여러 개 + llama_decode). 완성된 후보를 drift.detector.score_reply로
+# 채점해 드리프트 없이 점수가 가장 낮은 응답을 스트리밍하므로, 나쁜 응답이 사용자에게 간 뒤에 감지/리셋하는 대신 미리 거릅니다.
+# 채점에서 의미 반복 항은 빼고(어휘 중복 + 말투만) 비교합니다 — 사용자 입력과 비슷할수록 점수가 낮아져 따라 하기를 고르게 되므로.
+# 후보용 컨텍스트는 단계 모델의 가중치(llama_model)를 그대로 쓰고 KV 캐시만 따로 가집니다. 단계 모델이 닫힐 때 함께 해제되며,
+# 동시에 유지하는 수는 TTM_CANDIDATES_CONTEXTS(기본 2, 최근 사용 순)로 제한합니다.
+#   TTM_CANDIDATES=3 / TTM_CANDIDATES_<STAGE>=3 : 후보 수 (기본 1 = 사용 안 함)
+#   TTM_CANDIDATES_MAX_TOKENS                 : 후보당 최대 토큰 (요청에 max_tokens가 없을 때, 기본 96)
+#   TTM_CANDIDATES_TEMPERATURE / _TOP_P / _TOP_K : 후보 다양성을 위한 샘플링 설정 (기본 0.8 / 0.95 / 40)
+# 첫 토큰은 모든 후보가 끝난 뒤에 나가므로 TTFT 대신 응답 품질을 택하는 모드입니다:
+# TTFT ≈ prefill + (가장 긴 후보의 토큰 수 × k개 배치 디코딩 한 스텝), 즉 단일 스트리밍의 전체 응답 시간보다 깁니다.
+import codecs, os, threading, time, weakref
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from shared.logger import elapsed_ms, logger, slog
+
+PREFILL_BATCH = 512
+
+def candidate_count(stage: str) -> int:
+    return max(1, int(os.getenv(f"TTM_CANDIDATES_{stage.upper()}") or os.getenv("TTM_CANDIDATES", 1)))
+
+def _env(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+# ✅ 단계 모델별 후보 컨텍스트 (n_seq_max = k, KV 캐시 크기 = 프롬프트 + k × 최대 토큰)
+class CandidateContext:
+    def __init__(self, llm, n_seq: int, n_ctx: int):
+        import llama_cpp
+        params = llama_cpp.llama_context_default_params()
+        base = llm.context_params
+        params.n_ctx = n_ctx
+        params.n_batch = params.n_ubatch = max(PREFILL_BATCH, n_seq)
+        params.n_seq_max = n_seq
+        params.n_threads, params.n_threads_batch = base.n_threads, base.n_threads_batch
+        # llm.kv_cache 설정(type_k/type_v, flash attention)을 그대로 따름
+        params.type_k, params.type_v, params.flash_attn = base.type_k, base.type_v, base.flash_attn
+        new_context = getattr(llama_cpp, "llama_init_from_model", None) or llama_cpp.llama_new_context_with_model
+        self.ctx = new_context(llm.model, params)
+        if not self.ctx:
+            raise RuntimeError("후보 컨텍스트 생성 실패")
+        self.n_seq, self.n_ctx = n_seq, n_ctx
+        self.batch = llama_cpp.llama_batch_init(params.n_batch, 0, n_seq)
+        self.lock = threading.Lock()
+
+    def close(self):
+        import llama_cpp
+        llama_cpp.llama_batch_free(self.batch)
+        llama_cpp.llama_free(self.ctx)
+
+CANDIDATE_CONTEXTS: "OrderedDict[int, CandidateContext]" = OrderedDict()
+_BOUND = set()  # 모델 닫힘에 해제 콜백을 등록한 키 (id(llm))
+_CONTEXT_LOCK = threading.Lock()
+
+def _close_context(key: int):
+    with _CONTEXT_LOCK:
+        context = CANDIDATE_CONTEXTS.pop(key, None)
+        _BOUND.discard(key)
+    if context is not None:
+        with context.lock:
+            context.close()
+
+# ✅ 후보 컨텍스트 수명을 모델에 묶음: Llama.close()는 ExitStack을 역순으로 닫으므로 여기 등록한 콜백이
+#    llama_model 해제보다 먼저 실행됨 (id 재사용으로 닫힌 모델의 컨텍스트를 다시 쓰는 일도 없음)
+def _bind_lifetime(llm, key: int):
+    if key in _BOUND:
+        return
+    _BOUND.add(key)
+    stack = getattr(llm, "_stack", None)
+    if stack is not None:
+        stack.callback(_close_context, key)
+    else:
+        weakref.finalize(llm, _close_context, key)
+
+def get_candidate_context(llm, n_seq: int, n_ctx: int) -> CandidateContext:
+    key = id(llm)
+    with _CONTEXT_LOCK:
+        context = CANDIDATE_CONTEXTS.get(key)
+        if context is None or context.n_seq < n_seq or context.n_ctx < n_ctx:
+            if context is not None:
+                with context.lock:
+                    context.close()
+            context = CANDIDATE_CONTEXTS[key] = CandidateContext(llm, n_seq, n_ctx)
+            _bind_lifetime(llm, key)
+        CANDIDATE_CONTEXTS.move_to_end(key)
+        # 오래 쓰지 않은 단계의 후보 KV 캐시부터 해제 (단계 모델마다 KV 캐시가 한 벌씩 더 생기므로)
+        while len(CANDIDATE_CONTEXTS) > max(1, int(os.getenv("TTM_CANDIDATES_CONTEXTS", 2))):
+            _, stale = CANDIDATE_CONTEXTS.popitem(last=False)
+            with stale.lock:
+                stale.close()
+        return context
+
+def format_prompt(llm, messages: List[dict]):
+    from llama_cpp import llama_chat_format
+    formatter = getattr(llama_chat_format, f"format_{(llm.chat_format or '').replace('-', '')}", None)
+    return formatter(messages=messages) if formatter else None
+
+def _fill(batch, items):
+    # items: [(token, pos, seq_ids, want_logits)]
+    batch.n_tokens = len(items)
+    for i, (token, pos, seq_ids, want_logits) in enumerate(items):
+        batch.token[i] = token
+        batch.pos[i] = pos
+        batch.n_seq_id[i] = len(seq_ids)
+        for j, seq in enumerate(seq_ids):
+            batch.seq_id[i][j] = seq
+        batch.logits[i] = want_logits
+
+class _Candidate:
+    __slots__ = ("seq", "tokens", "pieces", "decoder", "text", "stopper", "done", "rng")
+
+    def __init__(self, seq: int, stopper, rng):
+        self.seq, self.tokens, self.pieces, self.text = seq, [], [], ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self.stopper, self.done, self.rng = stopper, False, rng
+
+    def reply(self) -> str:
+        return (self.stopper.text if self.stopper else self.text).strip()
+
+def _sample(np, logits, rng, temperature: float, top_k: int, top_p: float) -> int:
+    if temperature <= 0:
+        return int(np.argmax(logits))
+    top = np.argpartition(logits, -top_k)[-top_k:] if top_k < len(logits) else np.arange(len(logits))
+    top = top[np.argsort(-logits[top])]
+    probs = np.exp((logits[top] - logits[top[0]]) / temperature)
+    probs /= probs.sum()
+    keep = int(np.searchsorted(np.cumsum(probs), top_p)) + 1
+    probs = probs[:keep] / probs[:keep].sum()
+    return int(top[rng.choice(keep, p=probs)])
+
+# ✅ k개 후보를 한 번의 prefill + 배치 디코딩으로 생성 → 드리프트 점수 최저 후보의 토큰 조각 반환
+def generate_candidates(llm, stage: str, messages: List[dict], k: int, max_tokens: Optional[int] = None,
+                        temperature: Optional[float] = None, top_p: Optional[float] = None,
+                        logits_processor=None, stopper_factory: Optional[Callable] = None) -> Optional[dict]:
+    import numpy as np
+    import llama_cpp
+    formatted = format_prompt(llm, messages)
+    if formatted is None:
+        return None
+    started = time.perf_counter()
+    max_tokens = max_tokens or int(_env("TTM_CANDIDATES_MAX_TOKENS", 96))
+    temperature = _env("TTM_CANDIDATES_TEMPERATURE", 0.8) if temperature is None else temperature
+    top_p = _env("TTM_CANDIDATES_TOP_P", 0.95) if top_p is None else top_p
+    top_k = int(_env("TTM_CANDIDATES_TOP_K", 40))
+    stops = [formatted.stop] if isinstance(formatted.stop, str) else list(formatted.stop or [])
+
+    prompt = llm.tokenize(formatted.prompt.encode("utf-8"), add_bos=not formatted.added_special, special=True)
+    n_prompt = len(prompt)
+    n_ctx = max(n_prompt, llm.n_ctx()) + k * max_tokens + 8
+    context = get_candidate_context(llm, k, n_ctx)
+    vocab = llama_cpp.llama_model_get_vocab(llm.model)
+    n_vocab = llm.n_vocab()
+    seqs = list(range(k))
+    candidates = [
+        _Candidate(i, stopper_factory() if stopper_factory else None, np.random.default_rng(int(started * 1e6) + i))
+        for i in seqs
+    ]
+
+    with context.lock:
+        clear = getattr(llama_cpp, "llama_kv_self_clear", None) or llama_cpp.llama_kv_cache_clear
+        clear(context.ctx)
+        # 1) 공유 prefill: 프롬프트 토큰 하나를 k개 시퀀스 모두에 배정 → KV 셀 한 벌을 공유
+        for start in range(0, n_prompt, PREFILL_BATCH):
+            chunk = prompt[start:start + PREFILL_BATCH]
+            _fill(context.batch, [
+                (tok, start + i, seqs, start + i == n_prompt - 1) for i, tok in enumerate(chunk)
+            ])
+            if llama_cpp.llama_decode(context.ctx, context.batch) != 0:
+                raise RuntimeError("후보 prefill 실패")
+        prefill_ms = elapsed_ms(started)
+        rows = {c.seq: len(chunk) - 1 for c in candidates}  # 첫 토큰은 모두 마지막 프롬프트 위치의 logits에서 샘플링
+
+        # 2) 배치 디코딩: 스텝마다 살아 있는 후보의 토큰을 한 배치로
+        for step in range(max_tokens):
+            items = []
+            for c in candidates:
+                if c.done:
+                    continue
+                logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(context.ctx, rows[c.seq]), shape=(n_vocab,)).copy()
+                if logits_processor is not None:
+                    logits = logits_processor(prompt + c.tokens, logits)
+                token = _sample(np, logits, c.rng, temperature, top_k, top_p)
+                if llama_cpp.llama_vocab_is_eog(vocab, token):
+                    c.done = True
+                    continue
+                c.tokens.append(token)
+                piece = c.decoder.decode(llm.detokenize([token]))
+                c.text += piece
+                if any(stop in c.text for stop in stops):
+                    c.text = min((c.text.split(stop)[0] for stop in stops), key=len)
+                    c.done = True
+                    continue
+                c.pieces.append(piece)
+                if c.stopper is not None:
+                    c.stopper.feed(piece)
+                    c.done = c.stopper.done
+                if not c.done and step + 1 < max_tokens:
+                    items.append((token, n_prompt + step, [c.seq], True))
+            if not items:
+                break
+            _fill(context.batch, items)
+            if llama_cpp.llama_decode(context.ctx, context.batch) != 0:
+                raise RuntimeError("후보 디코딩 실패")
+            rows = {seq_ids[0]: i for i, (_, _, seq_ids, _) in enumerate(items)}
+
+    from drift.detector import score_reply
+    scored = []
+    for c in candidates:
+        reply = c.reply()
+        # 비교 대상 없이 채점 → 의미 반복 항이 모든 후보에 같은 값이 되어 어휘 중복/말투로만 순위가 갈림
+        analysis = score_reply(reply) if reply else {"drift": True, "score": float("inf")}
+        scored.append((bool(analysis["drift"]), analysis["score"], c))
+    drifted, score, best = min(scored, key=lambda item: (item[0], item[1]))
+    total_ms = elapsed_ms(started)
+    slog("candidates", "🎯 후보 %d개 중 선택", k, stage=stage, prefill_ms=prefill_ms, total_ms=total_ms,
+         tokens=sum(len(c.tokens) for c in candidates), scores=[round(s, 3) for _, s, _ in scored], chosen=best.seq)
+    return {
+        "pieces": best.pieces,
+        "text": best.text,
+        "score": score,
+        "drift": drifted,
+        "scores": [s for _, s, _ in scored],
+        "prefill_ms": prefill_ms,
+        "total_ms": total_ms,
+    }
+
+# ✅ LlamaCppBackend.stream_chat에서 호출: 지원되지 않으면(원격/LoRA/알 수 없는 chat_format) None → 기존 스트리밍
+def best_candidate(llm, stage: str, messages: List[dict], k: int, **params) -> Optional[List[str]]:
+    try:
+        from llama_cpp import Llama
+    except ImportError:
+        return None
+    if not isinstance(llm, Llama):
+        return None
+    from llm.stopping import get_stage_stopper
+    processors = params.get("logits_processor") or []
+
+    def processor(input_ids, scores):
+        for p in processors:
+            scores = p(input_ids, scores)
+        return scores
+
+    try:
+        result = generate_candidates(
+            llm, stage, messages, k, max_tokens=params.get("max_tokens"), temperature=params.get("temperature"),
+            top_p=params.get("top_p"), logits_processor=processor if processors else None,
+            stopper_factory=(lambda: get_stage_stopper(stage)) if get_stage_stopper(stage) else None,
+        )
+    except Exception:
+        logger.exception(f"❌ {stage} 후보 생성 실패 → 단일 스트리밍으로 대체")
+        return None
+    return result["pieces"] if result else None
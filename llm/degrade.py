@@ -0,0 +1,173 @@
+# 📁 llm/degrade.py
+# 부하 기반 품질 단계 조정 (graceful degradation).
+# 진행 중인 요청 수(큐 깊이)와 단계별 첫 토큰 지연(EWMA)을 SLO와 비교해 단계마다 품질 레벨을 정합니다.
+#   0 full            : 기본 모델, 기본 토큰 예산
+#   1 reduce_tokens   : 기본 모델, 토큰 예산 축소
+#   2 fallback_model  : 작은 모델(TinyLlama 또는 TTM_FALLBACK_MODEL) + 토큰 예산 축소
+#   3 canned          : 모델 호출 없이 단계별 고정 질문
+# 레벨은 압력이 커지면 바로 올리고, 내려갈 때는 cooldown마다 한 단계씩만 내립니다 (진동 방지).
+# 결정은 요청 컨텍스트(contextvar)로 백엔드에 전달되고, trailer의 "degraded"와 /status의 "degrade"에 기록됩니다.
+import os, threading, time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from shared.logger import logger
+
+LEVELS = ("full", "reduce_tokens", "fallback_model", "canned")
+
+# ✅ 요청 단위 적용 값 (백엔드가 읽음)
+TOKEN_CAP: ContextVar[Optional[int]] = ContextVar("ttm_token_cap", default=None)
+MODEL_OVERRIDE: ContextVar[Optional[str]] = ContextVar("ttm_model_override", default=None)
+
+# ✅ 부하가 심할 때 모델 대신 내보내는 단계별 질문 (다음 턴에 그대로 이어갈 수 있는 내용)
+CANNED_REPLIES = {
+    "empathy": "이야기해 주셔서 고마워요. 지금 가장 크게 느껴지는 마음을 조금 더 들려주실 수 있을까요?",
+    "mi": "그 상황이 바뀐다면 어떤 점이 가장 달라졌으면 좋겠는지 궁금해요.",
+    "cbt1": "그 순간 머릿속에 가장 먼저 떠오른 생각은 무엇이었나요?",
+    "cbt2": "그 생각을 뒷받침하는 근거와 그렇지 않은 근거를 하나씩 떠올려 볼 수 있을까요?",
+    "cbt3": "다음에 비슷한 상황이 오면 스스로에게 어떤 말을 해 주고 싶으신가요?",
+}
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+class Decision:
+    __slots__ = ("stage", "level", "max_tokens", "model_path", "reason")
+
+    def __init__(self, stage: str, level: int, max_tokens: Optional[int] = None,
+                 model_path: Optional[str] = None, reason: str = ""):
+        self.stage = stage
+        self.level = level
+        self.max_tokens = max_tokens
+        self.model_path = model_path
+        self.reason = reason
+
+    @property
+    def action(self) -> str:
+        return LEVELS[self.level]
+
+    def to_dict(self) -> Optional[dict]:
+        if not self.level:
+            return None
+        return {
+            "level": self.level, "action": self.action, "max_tokens": self.max_tokens,
+            "model": os.path.basename(self.model_path) if self.model_path else None, "reason": self.reason,
+        }
+
+    # ✅ 현재 요청 컨텍스트에 적용 (스트림 캐시 태스크/to_thread에도 그대로 전달됨)
+    def apply(self):
+        TOKEN_CAP.set(self.max_tokens)
+        MODEL_OVERRIDE.set(self.model_path)
+
+class DegradationPolicy:
+    def __init__(self):
+        self.enabled = os.getenv("TTM_DEGRADE", "0") == "1"
+        self.ttft_slo_ms = _env_float("TTM_SLO_TTFT_MS", 3000)
+        self.queue_levels = [int(x) for x in os.getenv("TTM_DEGRADE_QUEUE", "8,16,32").split(",")]
+        self.max_tokens = int(os.getenv("TTM_DEGRADE_MAX_TOKENS", 48))
+        self.cooldown = _env_float("TTM_DEGRADE_COOLDOWN", 30)
+        self.alpha = _env_float("TTM_DEGRADE_EWMA_ALPHA", 0.3)
+        self.ttft_ewma: Dict[str, float] = {}
+        self.observed: Dict[str, float] = {}
+        self.levels: Dict[str, int] = {}
+        self.changed: Dict[str, float] = {}
+        self.stats = {action: 0 for action in LEVELS}
+        self.transitions = []  # 최근 레벨 변경 기록 (감사용)
+        self._lock = threading.Lock()
+
+    # ✅ 요청이 끝날 때 첫 토큰 지연 기록
+    def observe(self, stage: str, ttft_ms: float):
+        with self._lock:
+            prev = self.ttft_ewma.get(stage)
+            self.ttft_ewma[stage] = ttft_ms if prev is None else prev + self.alpha * (ttft_ms - prev)
+            self.observed[stage] = time.monotonic()
+
+    def _target_level(self, stage: str, queue_depth: int) -> tuple:
+        queue_level = sum(queue_depth >= t for t in self.queue_levels)
+        ttft = self.ttft_ewma.get(stage, 0.0)
+        if time.monotonic() - self.observed.get(stage, 0) > self.cooldown:
+            ttft = 0.0  # 고정 질문으로 응답하는 동안은 새 측정이 없으므로 오래된 지연은 무시
+        latency_level = sum(ttft >= self.ttft_slo_ms * m for m in (1, 2, 4))
+        if queue_level >= latency_level:
+            return queue_level, f"queue={queue_depth}"
+        return latency_level, f"ttft_ewma={ttft:.0f}ms"
+
+    def decide(self, stage: str, queue_depth: int, model_paths: Dict[str, str]) -> Decision:
+        if not self.enabled:
+            return Decision(stage, 0)
+        now = time.monotonic()
+        with self._lock:
+            target, reason = self._target_level(stage, queue_depth)
+            current = self.levels.get(stage, 0)
+            if target > current:
+                level = target
+            elif target < current and now - self.changed.get(stage, 0) >= self.cooldown:
+                level = current - 1  # 회복은 한 단계씩
+            else:
+                level = current
+            if level != current:
+                self.levels[stage], self.changed[stage] = level, now
+                self.transitions = (self.transitions + [{
+                    "ts": time.time(), "stage": stage, "from": LEVELS[current], "to": LEVELS[level], "reason": reason,
+                }])[-50:]
+                logger.info(f"🎚️ {stage} 품질 레벨 {LEVELS[current]} → {LEVELS[level]} ({reason})")
+            fallback = fallback_model_path(stage, model_paths)
+            if level == 2 and not fallback:
+                level = 1  # 작은 모델이 없으면 토큰 예산 축소까지만
+            self.stats[LEVELS[level]] += 1
+        if level == 0:
+            return Decision(stage, 0)
+        return Decision(stage, level, self.max_tokens, fallback if level == 2 else None, reason)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "levels": {s: LEVELS[l] for s, l in self.levels.items()},
+                "ttft_ewma_ms": {s: round(v, 1) for s, v in self.ttft_ewma.items()},
+                "decisions": dict(self.stats),
+                "transitions": list(self.transitions[-10:]),
+            }
+
+def fallback_model_path(stage: str, model_paths: Dict[str, str]) -> Optional[str]:
+    path = os.getenv(f"TTM_FALLBACK_MODEL_{stage.upper()}") or os.getenv("TTM_FALLBACK_MODEL") or model_paths.get("detect")
+    return path if path and os.path.exists(path) else None
+
+# ✅ 작은 대체 모델 캐시 (TinyLlama Chat은 zephyr 형식)
+FALLBACK_INSTANCE = {}
+_FALLBACK_LOCK = threading.Lock()
+
+def load_fallback_model(model_path: str):
+    with _FALLBACK_LOCK:
+        if model_path not in FALLBACK_INSTANCE:
+            from llama_cpp import Llama
+            from llm.kv_cache import kv_cache_kwargs
+            logger.info(f"📦 대체 모델 로딩: {model_path}")
+            FALLBACK_INSTANCE[model_path] = Llama(
+                model_path=model_path,
+                n_ctx=1024,
+                n_threads=max(1, (os.cpu_count() or 2) - 1),
+                n_gpu_layers=0,
+                use_mlock=False,
+                verbose=False,
+                **kv_cache_kwargs("fallback"),
+                chat_format=os.getenv("TTM_FALLBACK_CHAT_FORMAT", "zephyr"),
+            )
+        return FALLBACK_INSTANCE[model_path]
+
+def cap_tokens(params: dict) -> dict:
+    cap = TOKEN_CAP.get()
+    if cap is not None:
+        params["max_tokens"] = min(params.get("max_tokens") or cap, cap)
+    return params
+
+def canned_reply(stage: str) -> str:
+    return CANNED_REPLIES.get(stage, CANNED_REPLIES["empathy"])
+
+_policy: Optional[DegradationPolicy] = None
+
+def get_degradation_policy() -> DegradationPolicy:
+    global _policy
+    if _policy is None:
+        _policy = DegradationPolicy()
+    return _policy
@@ -0,0 +1,55 @@
+# 📁 llm/kv_cache.py
+# 단계별 KV 캐시 타입 설정 (llama.cpp type_k / type_v, flash attention).
+# 예: TTM_KV_TYPE=q8_0, TTM_KV_TYPE_CBT1=q4_0, TTM_KV_TYPE_MI=q8_0:q4_0 (K:V), TTM_FLASH_ATTN=1
+import os
+
+# ggml_type 값 (llama_cpp 상수가 없을 때 사용)
+GGML_TYPES = {"f32": 0, "f16": 1, "q4_0": 2, "q4_1": 3, "q5_0": 6, "q5_1": 7, "q8_0": 8}
+
+# 원소당 바이트 (블록 양자화 포함) — 메모리 추정용
+GGML_TYPE_BYTES = {"f32": 4.0, "f16": 2.0, "q4_0": 18 / 32, "q4_1": 20 / 32, "q5_0": 22 / 32, "q5_1": 24 / 32, "q8_0": 34 / 32}
+
+def _stage_env(name: str, stage: str):
+    return os.getenv(f"{name}_{stage.upper()}") or os.getenv(name)
+
+def parse_kv_type(value: str):
+    k, _, v = value.strip().lower().partition(":")
+    v = v or k
+    for t in (k, v):
+        if t not in GGML_TYPES:
+            raise ValueError(f"지원하지 않는 KV 캐시 타입: {t}")
+    return k, v
+
+def ggml_type(name: str) -> int:
+    try:
+        import llama_cpp
+        return getattr(llama_cpp, f"GGML_TYPE_{name.upper()}")
+    except (ImportError, AttributeError):
+        return GGML_TYPES[name]
+
+def kv_cache_kwargs(stage: str) -> dict:
+    kwargs = {}
+    kv_type = _stage_env("TTM_KV_TYPE", stage)
+    if kv_type:
+        k, v = parse_kv_type(kv_type)
+        if k != "f16":
+            kwargs["type_k"] = ggml_type(k)
+        if v != "f16":
+            kwargs["type_v"] = ggml_type(v)
+            # llama.cpp는 V 캐시 양자화 시 flash attention이 필요
+            kwargs["flash_attn"] = True
+    flash = _stage_env("TTM_FLASH_ATTN", stage)
+    if flash is not None:
+        kwargs["flash_attn"] = flash.lower() in ("1", "true", "yes")
+    return kwargs
+
+# ✅ 시퀀스(컨텍스트) 하나당 KV 캐시 메모리 추정
+def kv_bytes_per_sequence(metadata: dict, n_ctx: int, type_k: str = "f16", type_v: str = "f16") -> int:
+    arch = metadata.get("general.architecture", "llama")
+    n_layer = int(metadata[f"{arch}.block_count"])
+    n_embd = int(metadata[f"{arch}.embedding_length"])
+    n_head = int(metadata[f"{arch}.attention.head_count"])
+    n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+    n_embd_gqa = n_embd // n_head * n_head_kv
+    per_token = n_layer * n_embd_gqa * (GGML_TYPE_BYTES[type_k] + GGML_TYPE_BYTES[type_v])
+    return int(per_token * n_ctx)
@@ -1,12 +1,48 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+import threading
 
+from shared.logger import logger
+
+# ✅ HF 모델/토크나이저 캐시 (호출마다 다시 로딩하지 않도록)
+HF_MODEL_INSTANCE = {}
+HF_PIPELINE_INSTANCE = {}
+_LOAD_LOCK = threading.Lock()
+
+def load_model(model_path: str, precision: str = "bf16"):
+    key = (model_path, precision)
+    with _LOAD_LOCK:
+        if key not in HF_MODEL_INSTANCE:
+            import torch
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+
+            logger.info("📦 HF 모델 로딩 (%s): %s", precision, model_path)
+            tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+            model = AutoModelForCausalLM.from_pretrained(
+                model_path,
+                torch_dtype=torch.bfloat16 if precision == "bf16" else torch.float32,
+                local_files_only=True,
+                trust_remote_code=True
+            )
+            if precision == "int8":
+                # CPU 동적 양자화: Linear 가중치만 int8로 변환
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            model.eval()
+            HF_MODEL_INSTANCE[key] = (tokenizer, model)
+        return HF_MODEL_INSTANCE[key]
+
+# ✅ 기존 API 유지 (서버 경로에서는 쓰지 않음) — load_model과 같은 잠금으로 동시 호출 시 한 번만 로딩
 def load_pipeline(model_path: str, dtype="auto"):
-    tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_path,
-        device_map="auto",
-        torch_dtype=dtype,
-        local_files_only=True,
-        trust_remote_code=True
-    )
-    return pipeline("text-generation", model=model, tokenizer=tokenizer, device_map="auto")
+    key = (model_path, str(dtype))
+    with _LOAD_LOCK:
+        if key not in HF_PIPELINE_INSTANCE:
+            from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+
+            tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+            model = AutoModelForCausalLM.from_pretrained(
+                model_path,
+                device_map="auto",
+                torch_dtype=dtype,
+                local_files_only=True,
+                trust_remote_code=True
+            )
+            HF_PIPELINE_INSTANCE[key] = pipeline("text-generation", model=model, tokenizer=tokenizer, device_map="auto")
+        return HF_PIPELINE_INSTANCE[key]
@@ -0,0 +1,129 @@
+# 📁 llm/lora.py
+# 단일 베이스 모델 + 단계별 LoRA 어댑터 서빙 모드.
+# 베이스 GGUF를 한 번만 올리고, 요청마다 해당 단계의 어댑터만 교체/스케일 조정합니다.
+import os, multiprocessing, threading
+
+from llm.kv_cache import kv_cache_kwargs
+from shared.logger import logger
+
+LORA_STAGES = ("empathy", "mi", "cbt1", "cbt2", "cbt3")
+BASE_MODEL_ENV = "TTM_LORA_BASE_MODEL"
+ADAPTER_DIR_ENV = "TTM_LORA_ADAPTER_DIR"
+
+def is_lora_mode() -> bool:
+    return bool(os.getenv(BASE_MODEL_ENV))
+
+def get_adapter_path(stage: str) -> str:
+    explicit = os.getenv(f"TTM_LORA_ADAPTER_{stage.upper()}")
+    if explicit:
+        return explicit
+    return os.path.join(os.getenv(ADAPTER_DIR_ENV, "/models/lora"), f"{stage}.gguf")
+
+def get_adapter_scale(stage: str) -> float:
+    return float(os.getenv(f"TTM_LORA_SCALE_{stage.upper()}", "1.0"))
+
+# ✅ main.startup_tasks에서 병합 모델 대신 사용할 경로
+def lora_model_paths() -> dict:
+    if not is_lora_mode():
+        return {}
+    paths = {stage: get_adapter_path(stage) for stage in LORA_STAGES}
+    paths["lora_base"] = os.getenv(BASE_MODEL_ENV)
+    return paths
+
+def _lora_api(*names):
+    import llama_cpp
+    for name in names:
+        fn = getattr(llama_cpp, name, None)
+        if fn is not None:
+            return fn
+    raise RuntimeError(f"llama_cpp에서 LoRA API를 찾을 수 없습니다: {names}")
+
+class LoraBaseModel:
+    def __init__(self, base_path: str, n_ctx: int = 1024):
+        from llama_cpp import Llama
+        logger.info("📦 LoRA 베이스 모델 로딩: %s", base_path)
+        self.base_path = base_path
+        self.llm = Llama(
+            model_path=base_path,
+            n_ctx=n_ctx,
+            n_threads=max(1, multiprocessing.cpu_count() - 1),
+            n_batch=8,
+            n_gpu_layers=0,
+            use_mlock=False,
+            verbose=False,
+            chat_format="llama-3",
+            **kv_cache_kwargs("lora"),
+        )
+        self.adapters = {}
+        self.active = None
+        self.lock = threading.RLock()
+
+    def _get_adapter(self, adapter_path: str):
+        if adapter_path not in self.adapters:
+            init = _lora_api("llama_adapter_lora_init", "llama_lora_adapter_init")
+            adapter = init(self.llm._model.model, adapter_path.encode("utf-8"))
+            if not adapter:
+                raise RuntimeError(f"LoRA 어댑터 로딩 실패: {adapter_path}")
+            logger.info("🧩 LoRA 어댑터 로딩: %s", adapter_path)
+            self.adapters[adapter_path] = adapter
+        return self.adapters[adapter_path]
+
+    # ✅ 어댑터 교체는 가중치 재로딩 없이 컨텍스트에 붙였다 떼는 작업만 수행
+    # 호출 측은 이어지는 생성이 끝날 때까지 self.lock을 잡고 있어야 함 (LoraStageModel.create_chat_completion)
+    def activate(self, adapter_path: str, scale: float = 1.0):
+        with self.lock:
+            if self.active == (adapter_path, scale):
+                return
+            clear = _lora_api("llama_clear_adapter_lora", "llama_lora_adapter_clear")
+            apply = _lora_api("llama_set_adapter_lora", "llama_lora_adapter_set")
+            ctx = self.llm._ctx.ctx
+            clear(ctx)
+            if adapter_path:
+                apply(ctx, self._get_adapter(adapter_path), scale)
+            # 어댑터가 바뀌면 이전 KV 캐시는 재사용할 수 없음
+            self.llm.reset()
+            self.active = (adapter_path, scale)
+
+class LoraStageModel:
+    def __init__(self, base: LoraBaseModel, stage: str):
+        self.base = base
+        self.stage = stage
+        self.adapter_path = get_adapter_path(stage)
+        self.scale = get_adapter_scale(stage)
+        self.lock_key = ("lora", base.base_path)
+
+    def set_scale(self, scale: float):
+        self.scale = scale
+
+    # ✅ 어댑터 활성화부터 생성(스트림이면 닫힐 때까지)까지 베이스 잠금 유지
+    #    → 다른 단계/스레드가 디코딩 도중 어댑터를 바꾸거나 KV 캐시를 초기화하지 못함
+    def create_chat_completion(self, messages, stream: bool = False, **params):
+        if stream:
+            return self._stream(messages, **params)
+        with self.base.lock:
+            self.base.activate(self.adapter_path, self.scale)
+            return self.base.llm.create_chat_completion(messages=messages, **params)
+
+    def _stream(self, messages, **params):
+        with self.base.lock:
+            self.base.activate(self.adapter_path, self.scale)
+            chunks = self.base.llm.create_chat_completion(messages=messages, stream=True, **params)
+            try:
+                yield from chunks
+            finally:
+                chunks.close()
+
+# ✅ 베이스 모델은 프로세스당 하나, 단계 핸들은 단계별로 캐시
+LORA_BASE_INSTANCE = {}
+LORA_STAGE_INSTANCE = {}
+
+def get_lora_model(stage: str):
+    if not is_lora_mode() or stage not in LORA_STAGES:
+        return None
+    base_path = os.getenv(BASE_MODEL_ENV)
+    if base_path not in LORA_BASE_INSTANCE:
+        LORA_BASE_INSTANCE[base_path] = LoraBaseModel(base_path)
+    key = (base_path, stage)
+    if key not in LORA_STAGE_INSTANCE:
+        LORA_STAGE_INSTANCE[key] = LoraStageModel(LORA_BASE_INSTANCE[base_path], stage)
+    return LORA_STAGE_INSTANCE[key]
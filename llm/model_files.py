@@ -0,0 +1,24 @@
+# 📁 llm/model_files.py
+# 단계 모델의 HF 저장소, 로컬 디렉터리, GGUF 파일명 — 다운로드(main.prepare_models), 배치 작업(jobs.batch),
+# 양자화 보정 CLI(llm.calibration), gunicorn 마스터가 모두 이 표를 사용합니다.
+import os
+from typing import Dict, Iterable, Optional
+
+MODEL_FILES = {
+    "detect": ("hieupt/TinyLlama-1.1B-Chat-v1.0-Q4_K_M-GGUF", "/models/detect", "tinyllama-1.1b-chat-v1.0-q4_k_m.gguf"),
+    "empathy": ("youngbongbong/empathymodel", "/models/empathy", "merged-empathy-8.0B-chat-Q4_K_M.gguf"),
+    "mi": ("youngbongbong/mimodel", "/models/mi", "merged-mi-chat-q4_k_m.gguf"),
+    "cbt1": ("youngbongbong/cbt1model", "/models/cbt1", "merged-first-8.0B-chat-Q4_K_M.gguf"),
+    "cbt2": ("youngbongbong/cbt2model", "/models/cbt2", "merged-mid-8.0B-chat-Q4_K_M.gguf"),
+    "cbt3": ("youngbongbong/cbt3model", "/models/cbt3", "merged-cbt3-8.0B-chat-Q4_K_M.gguf"),
+}
+STAGE_MODELS = ("empathy", "mi", "cbt1", "cbt2", "cbt3")
+
+# ✅ 다운로드된 디렉터리 안의 GGUF 경로
+def model_file(stage: str, directory: Optional[str] = None) -> str:
+    _, local_dir, filename = MODEL_FILES[stage]
+    return os.path.join(directory or local_dir, filename)
+
+# ✅ 기본 다운로드 위치(/models 아래)의 경로
+def local_model_paths(stages: Iterable[str] = STAGE_MODELS) -> Dict[str, str]:
+    return {stage: model_file(stage) for stage in stages}
@@ -0,0 +1,284 @@
+# 📁 llm/model_io.py
+# GGUF 콜드 스타트 I/O 가속: 모델 경로가 확정되는 즉시 백그라운드에서 파일을 순차로 읽어 페이지 캐시에 올립니다.
+# 새 노드(네트워크 디스크)에서 첫 Llama(model_path=...)는 mmap된 텐서를 접근 순서대로 페이지 폴트로 읽어 느리므로,
+# posix_fadvise(SEQUENTIAL/WILLNEED) 후 큰 청크로 순차 읽기를 해 두면 로딩이 디스크 순차 대역폭에 가까워집니다.
+# 같은 패스에서 선택적으로 sha256을 계산해 무결성을 확인합니다 (기대값: HF 다운로드 메타데이터 또는 <파일>.sha256).
+#   TTM_PREWARM=0            : 비활성화
+#   TTM_PREWARM_VERIFY=1     : 읽는 동안 sha256 검증
+#   TTM_PREWARM_STAGES       : 미리 올릴 단계 수 (대화 순서 기준, 기본 2 = empathy, mi / "all"이면 전부)
+#   TTM_PREWARM_BUDGET_MB    : 미리 올릴 총량 상한 (기본 없음, 넘는 파일은 건너뜀 → 앞서 올린 페이지가 밀려나지 않게)
+#   TTM_PREWARM_CHUNK_MB     : 순차 읽기 청크 크기 (기본 8)
+# 호스트당 한 번만 읽습니다: preload → fork 모드의 워커는 마스터가 이미 매핑한 파일을 건너뛰고,
+# 여러 프로세스가 같은 파일을 프리웜하려 하면 파일 잠금(flock)을 먼저 잡은 쪽만 읽고 나머지는 끝날 때까지 기다립니다.
+# 단계 모델 로딩(agents.registry.load_stage_model, LlamaCppBackend.load)은 해당 파일의 프리웜이 진행 중이면 끝날 때까지 기다렸다가
+# (대기열에만 있으면 바로 그 파일부터 읽음) 로딩하고, 첫 로딩 시간을 함께 기록합니다. 결과는 /status의 prewarm에서 확인합니다.
+import contextlib, hashlib, os, struct, tempfile, threading, time, zlib
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+from shared.logger import logger
+
+GGUF_MAGIC = b"GGUF"
+GGUF_DEFAULT_ALIGNMENT = 32
+STAGE_ORDER = ["empathy", "mi", "cbt1", "cbt2", "cbt3"]  # 대화에서 먼저 쓰이는 단계부터
+
+# GGUF 메타데이터 값 타입 → struct 형식 (8=string, 9=array는 따로 처리)
+_SCALARS = {0: "B", 1: "b", 2: "H", 3: "h", 4: "I", 5: "i", 6: "f", 7: "?", 10: "Q", 11: "q", 12: "d"}
+
+class GGUFReader:
+    def __init__(self, f):
+        self.f = f
+
+    def unpack(self, fmt: str):
+        size = struct.calcsize("<" + fmt)
+        data = self.f.read(size)
+        if len(data) != size:
+            raise ValueError("GGUF 헤더가 잘렸습니다")
+        return struct.unpack("<" + fmt, data)[0]
+
+    def string(self) -> bytes:
+        return self.f.read(self.unpack("Q"))
+
+    def value(self, kind: int):
+        if kind == 8:
+            return self.string()
+        if kind == 9:
+            item_kind, count = self.unpack("I"), self.unpack("Q")
+            if item_kind in _SCALARS:  # 큰 숫자 배열(토큰 점수 등)은 값 없이 건너뜀
+                self.f.seek(struct.calcsize("<" + _SCALARS[item_kind]) * count, os.SEEK_CUR)
+                return None
+            return [self.value(item_kind) for _ in range(count)]
+        return self.unpack(_SCALARS[kind])
+
+# ✅ GGUF 헤더 파싱: 텐서 데이터 영역 시작 위치, 텐서 수, 마지막 텐서 오프셋 (잘린 파일 감지용)
+def gguf_layout(path: str) -> dict:
+    with open(path, "rb") as f:
+        if f.read(4) != GGUF_MAGIC:
+            raise ValueError(f"GGUF 파일이 아닙니다: {path}")
+        reader = GGUFReader(f)
+        version = reader.unpack("I")
+        n_tensors, n_kv = reader.unpack("Q"), reader.unpack("Q")
+        alignment = GGUF_DEFAULT_ALIGNMENT
+        for _ in range(n_kv):
+            key = reader.string()
+            value = reader.value(reader.unpack("I"))
+            if key == b"general.alignment":
+                alignment = int(value)
+        last_offset = 0
+        for _ in range(n_tensors):
+            reader.string()
+            n_dims = reader.unpack("I")
+            f.seek(8 * n_dims + 4, os.SEEK_CUR)  # dims(u64 × n_dims) + ggml type(u32)
+            last_offset = max(last_offset, reader.unpack("Q"))
+        header_end = f.tell()
+    data_offset = (header_end + alignment - 1) // alignment * alignment
+    size = os.path.getsize(path)
+    return {
+        "version": version, "tensors": n_tensors, "metadata_keys": n_kv, "data_offset": data_offset,
+        "data_bytes": size - data_offset, "size": size, "truncated": data_offset + last_offset >= size,
+    }
+
+# ✅ 기대 sha256: <파일>.sha256 → huggingface_hub local_dir 다운로드 메타데이터(LFS etag = sha256)
+def expected_sha256(path: str) -> Optional[str]:
+    candidates = [path + ".sha256"]
+    directory, name = os.path.split(path)
+    candidates.append(os.path.join(directory, ".cache", "huggingface", "download", name + ".metadata"))
+    for candidate in candidates:
+        try:
+            with open(candidate) as f:
+                lines = f.read().split()
+        except OSError:
+            continue
+        for token in lines:
+            token = token.strip('"').lower()
+            if len(token) == 64 and all(c in "0123456789abcdef" for c in token):
+                return token
+    return None
+
+def _fadvise(fd: int, offset: int, length: int, advice_name: str):
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+# ✅ 파일 하나를 순차로 읽어 페이지 캐시에 올림 (verify=True면 같은 패스에서 sha256)
+def prewarm_file(path: str, verify: bool = False, chunk_mb: Optional[int] = None) -> dict:
+    chunk = (chunk_mb or int(os.getenv("TTM_PREWARM_CHUNK_MB", 8))) * 1024 * 1024
+    stats = {"path": path}
+    try:
+        stats.update(gguf_layout(path))
+    except (OSError, ValueError) as e:
+        stats["layout_error"] = str(e)
+    digest = hashlib.sha256() if verify else None
+    buf = bytearray(chunk)
+    view = memoryview(buf)
+    read = 0
+    start = time.perf_counter()
+    with open(path, "rb", buffering=0) as f:
+        fd = f.fileno()
+        size = os.fstat(fd).st_size
+        # 커널 readahead 창을 키우고(SEQUENTIAL) 텐서 영역 전체를 비동기로 요청(WILLNEED)
+        _fadvise(fd, 0, size, "POSIX_FADV_SEQUENTIAL")
+        _fadvise(fd, stats.get("data_offset", 0), 0, "POSIX_FADV_WILLNEED")
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            read += n
+            if digest is not None:
+                digest.update(view[:n])
+        _fadvise(fd, 0, size, "POSIX_FADV_NORMAL")  # llama.cpp의 이후 접근 패턴은 기본 정책으로
+    seconds = time.perf_counter() - start
+    stats.update({
+        "mb": round(read / 1024 / 1024, 1), "seconds": round(seconds, 2),
+        "mb_per_s": round(read / 1024 / 1024 / seconds, 1) if seconds else None,
+    })
+    if digest is not None:
+        stats["sha256"] = digest.hexdigest()
+        expected = expected_sha256(path)
+        stats["verified"] = None if expected is None else expected == stats["sha256"]
+    return stats
+
+def _budget_bytes() -> Optional[int]:
+    value = os.getenv("TTM_PREWARM_BUDGET_MB")
+    return int(float(value) * 1024 * 1024) if value else None
+
+# ✅ 호스트 단위 프리웜 잠금: 먼저 잡은 프로세스만 읽고(True), 다른 프로세스는 읽기가 끝날 때까지 기다렸다가 건너뜀(False)
+@contextlib.contextmanager
+def _host_lock(path: str):
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+    name = f"ttm-prewarm-{zlib.crc32(os.path.abspath(path).encode('utf-8')):08x}.lock"
+    with open(os.path.join(tempfile.gettempdir(), name), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            owner = True
+        except OSError:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            owner = False
+        try:
+            yield owner
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+# ✅ 백그라운드 프리웜 대기열 (스레드 하나: 디스크 순차 대역폭을 파일 하나에 몰아줌)
+class ModelPrewarmer:
+    def __init__(self):
+        self.entries: Dict[str, dict] = {}
+        self.done: Dict[str, threading.Event] = {}
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.budget_left: Optional[int] = None
+
+    def submit(self, paths: Iterable[str]):
+        with self.lock:
+            if self.budget_left is None:
+                self.budget_left = _budget_bytes()
+            for path in paths:
+                if path in self.entries or not os.path.exists(path):
+                    continue
+                size = os.path.getsize(path)
+                if self.budget_left is not None and size > self.budget_left:
+                    self.entries[path] = {"path": path, "state": "skipped_budget", "mb": round(size / 1024 / 1024, 1)}
+                    continue
+                if self.budget_left is not None:
+                    self.budget_left -= size
+                self.entries[path] = {"path": path, "state": "queued"}
+                self.done[path] = threading.Event()
+                self.pending.append(path)
+            if self.pending and (self.thread is None or not self.thread.is_alive()):
+                self.thread = threading.Thread(target=self._run, name="ttm-prewarm", daemon=True)
+                self.thread.start()
+
+    def _take(self, path: Optional[str] = None) -> Optional[str]:
+        with self.lock:
+            if path is None:
+                path = self.pending.popleft() if self.pending else None
+            elif path in self.pending:
+                self.pending.remove(path)
+            else:
+                return None
+            if path is not None:
+                self.entries[path]["state"] = "reading"
+            return path
+
+    def _warm(self, path: str):
+        verify = os.getenv("TTM_PREWARM_VERIFY", "0") == "1"
+        try:
+            with _host_lock(path) as owner:
+                stats = prewarm_file(path, verify=verify) if owner else {"path": path}
+            if not owner:
+                stats["state"] = "warmed_by_peer"
+                logger.info(f"🔥 모델 프리웜 생략 (같은 호스트의 다른 프로세스가 읽음): {os.path.basename(path)}")
+            else:
+                stats["state"] = "done"
+                if stats.get("truncated"):
+                    logger.error(f"❌ 모델 파일이 잘렸습니다 (다시 다운로드 필요): {path}")
+                if stats.get("verified") is False:
+                    logger.error(f"❌ 모델 sha256 불일치: {path} ({stats['sha256']})")
+                logger.info(f"🔥 모델 프리웜: {os.path.basename(path)} {stats['mb']:.0f}MB, {stats['seconds']:.1f}s "
+                            f"({stats['mb_per_s'] or 0:.0f}MB/s), sha256={stats.get('verified', '-')}")
+        except Exception as e:
+            logger.exception(f"❌ 모델 프리웜 실패: {path}")
+            stats = {"path": path, "state": "error", "error": str(e)}
+        with self.lock:
+            stats.update({k: v for k, v in self.entries.get(path, {}).items() if k == "load_seconds"})
+            self.entries[path] = stats
+        self.done[path].set()
+
+    def _run(self):
+        while True:
+            path = self._take()
+            if path is None:
+                return
+            self._warm(path)
+
+    # ✅ 로딩 직전 호출: 대기열에 있으면 호출 스레드에서 바로 읽고, 읽는 중이면 끝날 때까지 대기
+    def ensure(self, path: str, timeout: Optional[float] = None):
+        event = self.done.get(path)
+        if event is None or event.is_set():
+            return
+        if self._take(path) is not None:
+            self._warm(path)
+            return
+        event.wait(timeout)
+
+    def record_load(self, path: str, seconds: float):
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and "load_seconds" not in entry:
+                entry["load_seconds"] = round(seconds, 2)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"pending": len(self.pending), "files": [dict(e) for e in self.entries.values()]}
+
+prewarmer = ModelPrewarmer()
+
+def _prewarm_stages(order: list) -> list:
+    value = os.getenv("TTM_PREWARM_STAGES", "2").strip()
+    return order if value == "all" else order[:max(0, int(value))]
+
+# ✅ 모델 경로 확정 직후 호출 (main.prepare_models) — 대화에서 먼저 쓰이는 단계만
+def start_prewarm(paths: Dict[str, str]):
+    if os.getenv("TTM_PREWARM", "1") == "0":
+        return
+    from llm.shared_weights import MAPPED
+    order = sorted(paths, key=lambda s: STAGE_ORDER.index(s) if s in STAGE_ORDER else len(STAGE_ORDER))
+    # preload → fork 워커: 마스터가 fork 전에 매핑해 둔 파일은 다시 읽지 않음
+    prewarmer.submit(paths[s] for s in _prewarm_stages(order) if paths[s] not in MAPPED)
+
+# ✅ 단계 모델 로딩 감싸기: 프리웜 완료 대기 → 로딩 → 첫 로딩 시간(time-to-load) 기록
+@contextlib.contextmanager
+def cold_load(model_path: str):
+    prewarmer.ensure(model_path, timeout=float(os.getenv("TTM_PREWARM_WAIT", 600)))
+    start = time.perf_counter()
+    yield
+    prewarmer.record_load(model_path, time.perf_counter() - start)
@@ -0,0 +1,123 @@
+# 📁 llm/ngram.py
+# 세션별 n-gram 색인 + llama.cpp logits processor.
+# 이전 상담자 응답과 이번 사용자 입력의 토큰 n-gram을 색인해 두고, 디코딩 중 직전 (n-1)개 토큰이
+# 색인된 문맥과 같으면 그 뒤에 왔던 토큰의 logit을 낮춰 이미 한 말(또는 사용자 말)을 그대로 잇지 않게 합니다.
+# 생성 뒤 difflib으로 비교해 문장을 덧붙이던 방식과 달리, 스트리밍된 텍스트가 그대로 trailer의 response가 됩니다.
+# processor를 붙일 수 없는 백엔드(offload, transformers)는 repetition_params가 {}를 돌려주며, 에이전트가 기존 사후 검사를 그대로 씁니다.
+#   TTM_NGRAM=0         : 비활성화
+#   TTM_NGRAM_N         : n (기본 4 → 직전 3토큰 문맥)
+#   TTM_NGRAM_PENALTY   : logit 감점 (기본 4.0)
+import os, threading, zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+MAX_SESSIONS = 2000
+
+class NgramIndex:
+    __slots__ = ("n", "table")
+
+    def __init__(self, n: int):
+        self.n = n
+        self.table: Dict[Tuple[int, ...], Set[int]] = {}
+
+    def add(self, tokens: List[int]):
+        k = self.n - 1
+        for i in range(len(tokens) - k):
+            self.table.setdefault(tuple(tokens[i:i + k]), set()).add(tokens[i + k])
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+# ✅ 디코딩 스텝마다 호출: (input_ids, scores) → scores (llama_cpp.LogitsProcessor 규약)
+class NgramRepetitionProcessor:
+    def __init__(self, indexes: Iterable[NgramIndex], n: int, penalty: float):
+        self.tables = [index.table for index in indexes if len(index)]
+        self.k = n - 1
+        self.penalty = penalty
+        self.hits = 0
+
+    def __call__(self, input_ids, scores):
+        if len(input_ids) < self.k:
+            return scores
+        context = tuple(int(t) for t in input_ids[-self.k:])
+        for table in self.tables:
+            for token in tuple(table.get(context, ())):
+                scores[token] -= self.penalty
+                self.hits += 1
+        return scores
+
+# ✅ 세션별 상담자 응답 색인 (새로 추가된 응답만 토큰화해 이어 붙임)
+class _SessionEntry:
+    __slots__ = ("index", "indexed", "last_digest", "lock")
+
+    def __init__(self, n: int):
+        self.index = NgramIndex(n)
+        self.indexed = 0
+        self.last_digest = 0
+        self.lock = threading.Lock()  # 같은 세션의 동시 요청이 색인을 두 번 붙이지 않게 (토큰화는 _LOCK 밖)
+
+_SESSIONS: "OrderedDict[tuple, _SessionEntry]" = OrderedDict()
+_LOCK = threading.Lock()
+
+def _digest(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+def reply_index(key: tuple, replies: List[str], tokenize, n: int) -> NgramIndex:
+    with _LOCK:
+        entry = _SESSIONS.get(key)
+        # 기록이 줄었거나(리셋) 마지막으로 색인한 응답이 바뀌었으면 처음부터 다시 색인
+        if entry is None or entry.index.n != n or len(replies) < entry.indexed or (
+            entry.indexed and _digest(replies[entry.indexed - 1]) != entry.last_digest
+        ):
+            entry = _SessionEntry(n)
+        _SESSIONS[key] = entry
+        _SESSIONS.move_to_end(key)
+        while len(_SESSIONS) > MAX_SESSIONS:
+            _SESSIONS.popitem(last=False)
+    with entry.lock:
+        # 대기하는 동안 다른 요청이 먼저 색인했으면 그만큼 건너뜀
+        for reply in replies[entry.indexed:]:
+            entry.index.add(tokenize(reply))
+        if len(replies) > entry.indexed:
+            entry.indexed, entry.last_digest = len(replies), _digest(replies[-1])
+    return entry.index
+
+def _llama_handle(backend):
+    from llm.backend import LlamaCppBackend
+    if not isinstance(backend, LlamaCppBackend):
+        return None
+    try:
+        from llama_cpp import Llama
+    except ImportError:
+        return None
+    llm = backend.load()
+    llm = getattr(getattr(llm, "base", None), "llm", None) or llm  # LoRA 단계 핸들 → 베이스 Llama
+    # 모델 호스트(offload)는 프로세스 밖에서 디코딩하므로 콜백을 넘길 수 없음
+    return llm if isinstance(llm, Llama) else None
+
+# ✅ backend.stream_chat(messages, **repetition_params(...))로 넘길 추가 인자
+def repetition_params(backend, session_id: Optional[str], history: List[str], user_input: str) -> dict:
+    if os.getenv("TTM_NGRAM", "1") == "0":
+        return {}
+    llm = _llama_handle(backend)
+    if llm is None:
+        return {}
+    from llama_cpp import LogitsProcessorList
+    n = int(os.getenv("TTM_NGRAM_N", 4))
+    penalty = float(os.getenv("TTM_NGRAM_PENALTY", 4.0))
+
+    def tokenize(text: str) -> List[int]:
+        return llm.tokenize(text.encode("utf-8"), add_bos=False, special=False)
+
+    replies = [h for h in history[1::2] if isinstance(h, str)]  # [사용자, 상담자, 사용자, 상담자, ...]
+    if session_id:
+        indexes = [reply_index((session_id, backend.model_path), replies, tokenize, n)]
+    else:
+        indexes = [NgramIndex(n)]
+        for reply in replies:
+            indexes[0].add(tokenize(reply))
+    if user_input:
+        echo = NgramIndex(n)
+        echo.add(tokenize(user_input))
+        indexes.append(echo)
+    return {"logits_processor": LogitsProcessorList([NgramRepetitionProcessor(indexes, n, penalty)])}
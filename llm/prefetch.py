@@ -0,0 +1,159 @@
+# 📁 llm/prefetch.py
+# 다음 단계 모델 예측 프리페치.
+# 단계 전이는 턴 카운터로 결정되므로, trailer(next_stage, turn, history)를 보고 곧 필요해질 모델과
+# 시스템 프롬프트 KV 캐시를 백그라운드에서 미리 준비합니다.
+import os, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from shared.logger import logger
+
+NEXT_STAGE = {"empathy": "mi", "mi": "cbt1", "cbt1": "cbt2", "cbt2": "cbt3"}
+MAX_TRACKED_SESSIONS = 10000
+
+# ✅ 다음 요청(stage, turn, history)을 처리한 뒤 전이가 일어날지 판단 (각 에이전트의 전이 규칙과 동일)
+def will_transition(stage: str, turn: int, history_len: int) -> bool:
+    if stage == "empathy":
+        return turn >= 2
+    if stage == "mi":
+        return history_len // 2 + 1 >= 5
+    if stage in ("cbt1", "cbt2"):
+        return turn + 1 >= 5
+    return False
+
+def upcoming_stages(next_stage: str, turn: int, history_len: int) -> List[str]:
+    if next_stage not in NEXT_STAGE and next_stage != "cbt3":
+        return []
+    stages = [next_stage]
+    if next_stage in NEXT_STAGE and will_transition(next_stage, turn, history_len):
+        stages.append(NEXT_STAGE[next_stage])
+    return stages
+
+def available_memory_bytes() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class StagePrefetcher:
+    def __init__(self, budget_mb: Optional[float] = None):
+        if budget_mb is None and os.getenv("TTM_PREFETCH_BUDGET_MB"):
+            budget_mb = float(os.getenv("TTM_PREFETCH_BUDGET_MB"))
+        self.budget_bytes = int(budget_mb * 1024 * 1024) if budget_mb is not None else None
+        self.enabled = os.getenv("TTM_PREFETCH", "1") != "0"
+        self.resident: Dict[str, int] = {}  # stage -> GGUF 파일 크기
+        self.prefetched = set()             # 프리페치됐지만 아직 요청이 오지 않은 단계
+        self.pending = set()
+        self.sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "prefetches": 0, "prefetch_used": 0, "skipped_budget": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ttm-prefetch")
+
+    # ✅ 요청 시작 시 호출: 모델이 이미 올라와 있으면 hit
+    #    (resident는 실제로 로딩된 단계만 — 이번 요청의 로딩이 실패하거나 대체 모델이 쓰여도 프리페치가 막히지 않게)
+    def record_use(self, stage: str, model_path: str):
+        from agents.registry import STAGE_LOADERS, is_stage_loaded
+        if stage not in STAGE_LOADERS:
+            return
+        with self._lock:
+            loaded = stage in self.resident or is_stage_loaded(stage, model_path)
+            self.stats["hits" if loaded else "misses"] += 1
+            if stage in self.prefetched:
+                self.prefetched.discard(stage)
+                self.stats["prefetch_used"] += 1
+            if loaded:
+                self.resident.setdefault(stage, _file_size(model_path))
+
+    # ✅ 에이전트 trailer 관찰 → 다음에 필요한 단계 모델 프리페치 예약
+    def observe(self, session_id: str, trailer: dict, model_paths: dict):
+        if not self.enabled or not trailer:
+            return
+        next_stage = trailer.get("next_stage")
+        turn = int(trailer.get("turn") or 0)
+        history_len = len(trailer.get("history") or [])
+        with self._lock:
+            self.sessions[session_id] = (next_stage, turn)
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > MAX_TRACKED_SESSIONS:
+                self.sessions.popitem(last=False)
+        for stage in upcoming_stages(next_stage, turn, history_len):
+            if stage in model_paths:
+                self.schedule(stage, model_paths[stage])
+
+    def schedule(self, stage: str, model_path: str):
+        from agents.registry import is_stage_loaded
+        with self._lock:
+            if stage in self.pending or stage in self.resident or is_stage_loaded(stage, model_path):
+                return
+            if not self._fits(model_path):
+                self.stats["skipped_budget"] += 1
+                logger.info(f"⏭️ 메모리 예산 초과로 프리페치 생략: {stage}")
+                return
+            self.pending.add(stage)
+        self._executor.submit(self._prefetch, stage, model_path)
+
+    def _fits(self, model_path: str) -> bool:
+        size = _file_size(model_path)
+        if self.budget_bytes is not None:
+            return sum(self.resident.values()) + size <= self.budget_bytes
+        available = available_memory_bytes()
+        return available is None or size < available * 0.9
+
+    def _prefetch(self, stage: str, model_path: str):
+        from agents.registry import get_load_lock, get_stage_prompt, load_stage_model
+        from llm.backend import generation_key, generation_lock
+        from llm.lora import LoraStageModel
+        try:
+            logger.info(f"🔮 다음 단계 모델 프리페치: {stage}")
+            with get_load_lock(stage):
+                llm = load_stage_model(stage, model_path)
+                if hasattr(llm, "load"):
+                    llm.load()  # offload 모드: 모델 호스트에 로딩 요청
+            if not hasattr(llm, "load") and not isinstance(llm, LoraStageModel):
+                # 시스템 프롬프트 prefill → 첫 요청에서 공통 접두사 KV 재사용
+                # (LoRA 베이스는 단계가 바뀔 때마다 KV를 초기화하므로 prefill 생략 — 로딩만)
+                # 로딩 잠금을 놓은 뒤 생성 잠금을 잡음: 생성 잠금을 쥔 실시간 턴이 로딩 잠금을 기다릴 수 있음
+                with generation_lock(generation_key(stage, model_path)):
+                    llm.create_chat_completion(
+                        messages=[{"role": "system", "content": get_stage_prompt(stage)}], max_tokens=1
+                    )
+            with self._lock:
+                self.resident[stage] = _file_size(model_path)
+                self.prefetched.add(stage)
+                self.stats["prefetches"] += 1
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            logger.exception(f"❌ 프리페치 실패: {stage}")
+        finally:
+            with self._lock:
+                self.pending.discard(stage)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "resident": sorted(self.resident),
+                "pending": sorted(self.pending),
+                "tracked_sessions": len(self.sessions),
+            }
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+# ✅ 프로세스 전역 프리페처
+_PREFETCHER = None
+
+def get_prefetcher() -> StagePrefetcher:
+    global _PREFETCHER
+    if _PREFETCHER is None:
+        _PREFETCHER = StagePrefetcher()
+    return _PREFETCHER
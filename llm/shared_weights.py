@@ -0,0 +1,88 @@
+# 📁 llm/shared_weights.py
+# preload → fork 멀티 워커 모드 (gunicorn.conf.py에서 사용): fork 전에 페이지 캐시를 데워 두는 것까지만 합니다.
+# 마스터는 모델 상태(Llama 객체)를 만들지 않고, GGUF 파일을 읽기 전용 MAP_SHARED로 매핑해 페이지를 채워 둘 뿐입니다.
+# 가중치가 한 벌만 상주하는 것은 워커마다 만드는 Llama(use_mmap=True)가 같은 파일을 매핑해 커널 페이지 캐시를 공유하기 때문이며
+# (fork 상속 덕분이 아님), 마스터의 매핑은 그 페이지가 첫 요청 전에 이미 올라와 있고 밀려나지 않게 붙잡아 두는 역할입니다.
+# llama.cpp 컨텍스트/KV 캐시와 스레드풀은 fork를 넘겨받을 수 없으므로 반드시 fork 이후 워커에서 만듭니다.
+import mmap, os, time
+from typing import Dict, Optional
+
+from shared.logger import logger
+
+MODEL_PATHS_ENV = "TTM_MODEL_PATHS"   # "empathy=/models/...gguf,mi=/models/...gguf,..."
+WORKER_PRELOAD_ENV = "TTM_WORKER_PRELOAD"  # 워커 시작 시 컨텍스트를 미리 만들 단계 ("all" 또는 "cbt1,mi")
+MADV_POPULATE_READ = getattr(mmap, "MADV_POPULATE_READ", 22)  # Linux 5.14+
+
+# ✅ 마스터가 잡고 있는 매핑 (프로세스가 끝날 때까지 유지 → 워커에도 그대로 상속)
+MAPPED: Dict[str, mmap.mmap] = {}
+
+def parse_model_paths(value: Optional[str]) -> Dict[str, str]:
+    paths = {}
+    for item in (value or "").split(","):
+        stage, _, path = item.strip().partition("=")
+        if stage and path:
+            paths[stage] = path
+    return paths
+
+def preloaded_model_paths() -> Dict[str, str]:
+    return parse_model_paths(os.getenv(MODEL_PATHS_ENV))
+
+def _populate(mm: mmap.mmap, size: int):
+    try:
+        mm.madvise(MADV_POPULATE_READ)
+        return
+    except (OSError, ValueError):
+        pass
+    # 구버전 커널: WILLNEED 후 페이지마다 한 바이트씩 읽어 페이지 캐시에 올림
+    mm.madvise(mmap.MADV_WILLNEED)
+    page = mmap.PAGESIZE
+    for offset in range(0, size, page):
+        mm[offset]
+
+# ✅ 마스터에서 호출: 모델 파일을 매핑하고 모든 페이지를 읽어 둠 (페이지 캐시 워밍, 모델 로딩 아님)
+def map_models(paths: Dict[str, str]) -> dict:
+    from llm.model_io import prewarm_file
+    stats = {}
+    for stage, path in paths.items():
+        if path in MAPPED or not os.path.exists(path):
+            continue
+        start = time.perf_counter()
+        # 페이지 폴트 대신 큰 청크 순차 읽기로 먼저 페이지 캐시를 채움 → 아래 populate는 캐시 적중
+        warm = prewarm_file(path, verify=os.getenv("TTM_PREWARM_VERIFY", "0") == "1")
+        if warm.get("verified") is False:
+            logger.error(f"❌ {stage} 모델 sha256 불일치: {path}")
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            mm = mmap.mmap(f.fileno(), size, flags=mmap.MAP_SHARED, prot=mmap.PROT_READ)
+        _populate(mm, size)
+        MAPPED[path] = mm
+        elapsed = time.perf_counter() - start
+        stats[stage] = {
+            "path": path, "mb": round(size / 1024 / 1024, 1), "seconds": round(elapsed, 2),
+            "read_mb_per_s": warm["mb_per_s"], "verified": warm.get("verified"),
+        }
+        logger.info(f"🧷 {stage} 가중치 매핑: {size / 1024 / 1024:.0f}MB, {elapsed:.1f}s (순차 읽기 {warm['mb_per_s'] or 0:.0f}MB/s)")
+    return stats
+
+def worker_preload_stages(paths: Dict[str, str]) -> list:
+    value = os.getenv(WORKER_PRELOAD_ENV, "")
+    if value.strip() == "all":
+        return [s for s in paths if s != "detect"]
+    return [s.strip() for s in value.split(",") if s.strip() in paths]
+
+# ✅ fork 이후 워커에서 호출: 단계 모델 컨텍스트 생성 (가중치는 마스터가 올린 페이지를 그대로 사용)
+def init_worker_contexts(paths: Dict[str, str]) -> list:
+    from agents.registry import STAGE_LOADERS, load_stage_model
+    loaded = []
+    for stage in worker_preload_stages(paths):
+        if stage not in STAGE_LOADERS:
+            continue
+        start = time.perf_counter()
+        try:
+            load_stage_model(stage, paths[stage])
+        except Exception:
+            logger.exception(f"❌ 워커 {os.getpid()} {stage} 컨텍스트 생성 실패")
+            continue
+        loaded.append(stage)
+        logger.info(f"🧵 워커 {os.getpid()} {stage} 컨텍스트 생성: {time.perf_counter() - start:.1f}s")
+    return loaded
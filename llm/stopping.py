@@ -0,0 +1,105 @@
+# 📁 llm/stopping.py
+# 스트리밍 중단 조건: 단계가 실제로 사용하는 단위(첫 문장, 첫 질문)가 완성되면 즉시 디코딩을 멈춥니다.
+import asyncio
+from contextvars import ContextVar
+from typing import Iterable, Iterator, Optional
+
+# ✅ 한국어/전각 문장 부호 포함
+SENTENCE_ENDS = ".?!。？！"
+QUESTION_ENDS = "?？"
+PERIOD_ENDS = ".。"
+
+class StreamStopper:
+    def __init__(self):
+        self.text = ""  # 유지되는(클라이언트에 전송된) 텍스트
+        self.done = False
+
+    def feed(self, token: str) -> str:
+        raise NotImplementedError
+
+    def finish(self) -> str:
+        return ""
+
+# ✅ CBT2: 첫 문장 부호 직전까지만 유지 (re.split(r"[.?!]", ...)[0]과 동일)
+class FirstSentenceStopper(StreamStopper):
+    def __init__(self, delimiters: str = SENTENCE_ENDS):
+        super().__init__()
+        self.delimiters = delimiters
+
+    def feed(self, token: str) -> str:
+        if self.done:
+            return ""
+        for i, ch in enumerate(token):
+            if ch in self.delimiters:
+                self.done = True
+                piece = token[:i]
+                self.text += piece
+                return piece
+        self.text += token
+        return token
+
+# ✅ CBT3: 첫 물음표까지 유지. 물음표 없이 끝나면 첫 마침표 앞 문장만 유지
+#    (첫 마침표 이후 텍스트는 물음표가 나올 때까지 전송을 보류)
+class QuestionStopper(StreamStopper):
+    def __init__(self):
+        super().__init__()
+        self.pending = ""
+        self.seen_period = False
+
+    def feed(self, token: str) -> str:
+        if self.done:
+            return ""
+        emitted = ""
+        for ch in token:
+            if ch in QUESTION_ENDS:
+                self.done = True
+                emitted += self.pending + ch
+                self.pending = ""
+                break
+            if self.seen_period:
+                self.pending += ch
+            elif ch in PERIOD_ENDS:
+                self.seen_period = True
+                self.pending += ch
+            else:
+                emitted += ch
+        self.text += emitted
+        return emitted
+
+    def finish(self) -> str:
+        # 물음표가 나오지 않았다면 보류된 텍스트는 버림
+        self.pending = ""
+        return ""
+
+STAGE_STOPPERS = {
+    "cbt2": FirstSentenceStopper,
+    "cbt3": QuestionStopper,
+}
+
+def get_stage_stopper(stage: str) -> Optional[StreamStopper]:
+    stopper_cls = STAGE_STOPPERS.get(stage)
+    return stopper_cls() if stopper_cls else None
+
+# ✅ 토큰 스트림에 중단 조건 적용: 조건이 충족되면 원본 스트림을 닫아 디코딩 중단
+def stream_until(stream: Iterable[str], stopper: StreamStopper) -> Iterator[str]:
+    try:
+        for token in stream:
+            piece = stopper.feed(token)
+            if piece:
+                yield piece
+            if stopper.done:
+                break
+        tail = stopper.finish()
+        if tail:
+            yield tail
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+# ✅ 클라이언트 타이핑 효과용 토큰 간 지연 — 배치 실행(jobs.batch)은 STREAM_PACING=False로 생략
+STREAM_PACING: ContextVar[bool] = ContextVar("ttm_stream_pacing", default=True)
+
+async def pace(seconds: float):
+    if STREAM_PACING.get():
+        await asyncio.sleep(seconds)
@@ -1,34 +1,56 @@
-from fastapi import FastAPI, Request, Response
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Literal, List, Optional, Tuple
-from huggingface_hub import snapshot_download
 from functools import partial
+from contextlib import aclosing
 import json, os, asyncio, time, re, logging
-import tqdm.std
 import threading
-
-# ✅ tqdm 병렬 패치
-if not hasattr(tqdm.std.tqdm, "_lock"):
-    tqdm.std.tqdm._lock = threading.RLock()
-if not hasattr(tqdm.std.tqdm, "_instances"):
-    tqdm.std.tqdm._instances = set()
-
-# ✅ 로깅 설정
-logging.basicConfig(level=logging.INFO)
+from typing import Optional
+
+# ✅ tqdm 병렬 패치 (huggingface_hub 다운로드 직전에만 적용 → 임포트 시간 단축)
+def patch_tqdm():
+    import tqdm.std
+    if not hasattr(tqdm.std.tqdm, "_lock"):
+        tqdm.std.tqdm._lock = threading.RLock()
+    if not hasattr(tqdm.std.tqdm, "_instances"):
+        tqdm.std.tqdm._instances = set()
+
+# ✅ 로깅 설정 (큐 기반 비동기 출력/샘플링은 shared.logger에서 구성)
+from shared.logger import elapsed_ms, slog
 logger = logging.getLogger("ttmchatbot")
 
 # ✅ 에이전트 임포트
-from agents.empathy_agent import stream_empathy_reply
-from agents.mi_agent import stream_mi_reply
-from agents.cbt1_agent import stream_cbt1_reply
-from agents.cbt2_agent import stream_cbt2_reply
-from agents.cbt3_agent import stream_cbt3_reply
-from agents.user_state_agent import run_user_state_agent, run_detect
+from agents.user_state_agent import run_user_state_agent
+from drift.detector import analyze_turn_reply, get_precomputed_analysis, run_detect
+from shared.event_log import close_event_log, get_event_log, log_event
+from agents.registry import STAGE_LOADERS, TRAILER_MARKER, parse_trailer, stream_stage
+from llm.prefetch import get_prefetcher
+from shared.state import AgentState  # ✅ 세션 상태 단일 정의
+from shared.stream_cache import get_stream_cache, turn_key
+from llm.backend import generation_key, hold_generation
+from llm.degrade import canned_reply, get_degradation_policy
+from llm.model_io import prewarmer, start_prewarm
+from shared.profiling import Capture, list_profiles, profile_path, profile_window, profiled_stream, run_in_thread, should_profile
 
 app = FastAPI()
 
+# ✅ 모델 준비 상태 (다운로드는 백그라운드에서 진행되므로 서버는 즉시 응답 가능)
+model_ready = False
+model_paths = {}
+
+# ✅ 라우터(router.py)가 참고하는 부하/드레인 상태
+inflight_requests = 0
+draining = False
+
+prefetcher = get_prefetcher()
+stream_cache = get_stream_cache()  # ✅ 턴 단위 멱등/재개 가능 스트림 (TTM_STREAM_CACHE=0이면 비활성화)
+degradation = get_degradation_policy()  # ✅ 과부하 시 품질 단계 조정 (TTM_DEGRADE=1)
+
+# ✅ 관리자 엔드포인트(/admin/*, /jobs*, X-Profile): TTM_ADMIN_TOKEN이 없으면 모두 거부
+def check_admin(request: Request) -> bool:
+    token = os.getenv("TTM_ADMIN_TOKEN")
+    return bool(token) and request.headers.get("x-admin-token") == token
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -37,28 +59,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class AgentState(BaseModel):
-    session_id: str
-    stage: Literal["empathy", "mi", "cbt1", "cbt2", "cbt3", "end"]
-    question: Optional[str] = None
-    response: Optional[str] = None
-    history: List[str] = Field(default_factory=list)
-    turn: int = 0
-    preset_questions: List[str] = Field(default_factory=list)
-    drift_trace: List[Tuple[str, bool]] = Field(default_factory=list)
-    reset_triggered: bool = False
-    intro_shown: bool = False
-    retry_count: int = 0
-    pending_response: Optional[str] = None
-    awaiting_s_turn_decision: bool = False
-    awaiting_preparation_decision: bool = False
-    user_profile: Optional[dict] = None
-    user_type: Optional[str] = None
-    last_active_time: Optional[str] = None
-
 @app.on_event("startup")
 async def startup_tasks():
+    # ✅ 다운로드/평가를 기다리지 않고 바로 리슨 시작 (`/`, `/status`는 즉시 응답)
+    asyncio.create_task(prepare_models())
+    asyncio.create_task(dummy_loop())
+
+async def prepare_models():
     global model_ready, model_paths
+    # ✅ preload → fork 모드 (gunicorn.conf.py): 마스터가 이미 경로를 확정하고 가중치를 올려 둠
+    from llm.shared_weights import preloaded_model_paths
+    preloaded = preloaded_model_paths()
+    if preloaded:
+        model_paths = preloaded
+        model_ready = all(os.path.exists(p) for p in model_paths.values())
+        logger.info(f"🧷 공유 가중치 사용 (워커 {os.getpid()}): {', '.join(model_paths)}")
+        return
     try:
         logger.info("🚀 모델 다운로드 시작")
         loop = asyncio.get_event_loop()
@@ -68,7 +84,12 @@ async def startup_tasks():
             model_ready = False
             return
 
-        async def dl(repo_id: str, local_dir: str):
+        patch_tqdm()
+        from huggingface_hub import snapshot_download
+        from llm.model_files import MODEL_FILES, STAGE_MODELS, model_file
+
+        async def dl(stage: str):
+            repo_id, local_dir, _ = MODEL_FILES[stage]
             logger.info(f"📥 {repo_id} 다운로드 시작 → {local_dir}")
             path = await loop.run_in_executor(None, partial(
                 snapshot_download,
@@ -79,37 +100,28 @@ async def startup_tasks():
                 token=token,
             ))
             logger.info(f"✅ {repo_id} 다운로드 완료 → {path}")
-            return repo_id, path
-
-        results = await asyncio.gather(
-            dl("youngbongbong/empathymodel", "/models/empathy"),
-            dl("youngbongbong/mimodel", "/models/mi"),
-            dl("hieupt/TinyLlama-1.1B-Chat-v1.0-Q4_K_M-GGUF", "/models/detect"),
-            dl("youngbongbong/cbt1model", "/models/cbt1"),
-            dl("youngbongbong/cbt2model", "/models/cbt2"),
-            dl("youngbongbong/cbt3model", "/models/cbt3"),
-            return_exceptions=True
-        )
+            return stage, model_file(stage, path)
+
+        # ✅ LoRA 모드에서는 병합 모델 대신 베이스 + 단계별 어댑터 사용
+        from llm.lora import lora_model_paths
+        lora_paths = lora_model_paths()
+        stages = ["detect"] + ([] if lora_paths else list(STAGE_MODELS))
+        results = await asyncio.gather(*(dl(stage) for stage in stages), return_exceptions=True)
 
         paths = {}
         for result in results:
             if isinstance(result, Exception):
                 model_ready = False
                 return
-            repo_id, path = result
-            if "empathymodel" in repo_id:
-                paths["empathy"] = os.path.join(path, "merged-empathy-8.0B-chat-Q4_K_M.gguf")
-            elif "mimodel" in repo_id:
-                paths["mi"] = os.path.join(path, "merged-mi-chat-q4_k_m.gguf")
-            elif "cbt1model" in repo_id:
-                paths["cbt1"] = os.path.join(path, "merged-first-8.0B-chat-Q4_K_M.gguf")
-            elif "cbt2model" in repo_id:
-                paths["cbt2"] = os.path.join(path, "merged-mid-8.0B-chat-Q4_K_M.gguf")
-            elif "cbt3model" in repo_id:
-                paths["cbt3"] = os.path.join(path, "merged-cbt3-8.0B-chat-Q4_K_M.gguf")
-            elif "TinyLlama" in repo_id:
-                paths["detect"] = os.path.join(path, "tinyllama-1.1b-chat-v1.0-q4_k_m.gguf")
-
+            stage, path = result
+            paths[stage] = path
+
+        # ✅ 호스트에 맞는 양자화 변형 선택 (측정 결과는 디스크에 캐시 → 다음 기동부터 측정 생략)
+        from llm.calibration import calibrate_model_paths
+        paths = await asyncio.to_thread(calibrate_model_paths, paths)
+        # ✅ 경로 확정 즉시 백그라운드 순차 읽기로 페이지 캐시 채움 (첫 로딩의 랜덤 페이지 폴트 제거)
+        start_prewarm(paths)
+        paths.update(lora_paths)
         model_paths = paths
         model_ready = all(os.path.exists(p) for p in model_paths.values())
 
@@ -122,10 +134,13 @@ async def startup_tasks():
                 logger.info(f"{k}: {v}")
 
     except Exception:
-        logger.exception("❌ startup_tasks() 전체 실패")
+        logger.exception("❌ prepare_models() 전체 실패")
         model_ready = False
 
-    asyncio.create_task(dummy_loop())
+
+@app.on_event("shutdown")
+async def shutdown_tasks():
+    close_event_log()  # ✅ 남은 이벤트 기록 후 fsync
 
 
 @app.get("/")
@@ -138,17 +153,202 @@ def root_head():
 
 @app.get("/status")
 def check_model_status():
-    return {"ready": model_ready}
+    event_log = get_event_log()
+    return {
+        "ready": model_ready, "inflight": inflight_requests, "draining": draining, "prefetch": prefetcher.snapshot(),
+        "streams": stream_cache.snapshot() if stream_cache else None,
+        "degrade": degradation.snapshot(),
+        "prewarm": prewarmer.snapshot(),
+        "event_log": event_log.snapshot() if event_log else None,
+    }
+
+# ✅ 드레인: 라우터가 새 세션을 보내지 않도록 표시 (진행 중인 스트림은 끝까지 처리)
+@app.post("/admin/drain")
+def drain(request: Request, enable: bool = True):
+    global draining
+    if not check_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    draining = enable
+    return {"draining": draining, "inflight": inflight_requests}
+
+# ✅ 배치 대화 작업: JSONL 본문(줄마다 {"id", "turns", "state"})을 받아 백그라운드 실행
+@app.post("/jobs")
+async def create_job(request: Request, concurrency: int = 32):
+    if not check_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    if not model_ready:
+        return JSONResponse({"error": "모델이 아직 준비되지 않았습니다."}, status_code=503)
+    from jobs.manager import MAX_RUNNING_JOBS, running_jobs, submit_job
+    if running_jobs() >= MAX_RUNNING_JOBS:
+        return JSONResponse({"error": "이미 실행 중인 작업이 있습니다."}, status_code=429)
+    job = submit_job(await request.body(), model_paths, concurrency)
+    return job.to_dict()
+
+# ✅ 시간 구간 프로파일: seconds 동안 프로세스 전체 스택 샘플링 후 collapsed 스택 저장
+@app.post("/admin/profile")
+async def profile(request: Request, seconds: float = 10.0, stage: str = None):
+    if not check_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    capture = await profile_window(min(max(seconds, 0.1), 300.0), stage=stage)
+    return capture.to_dict()
+
+@app.get("/admin/profiles")
+def profiles(request: Request, limit: int = 50):
+    if not check_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    return list_profiles(limit=limit)
+
+# ✅ flamegraph.pl / speedscope에서 바로 열 수 있는 collapsed 스택
+@app.get("/admin/profiles/{profile_id}")
+def profile_artifact(request: Request, profile_id: str):
+    if not check_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    path = profile_path(profile_id)
+    if path is None:
+        return JSONResponse({"error": "unknown profile"}, status_code=404)
+    return FileResponse(path, media_type="text/plain")
+
+@app.get("/jobs/{job_id}")
+def job_status(request: Request, job_id: str):
+    if not check_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    from jobs.manager import get_job
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    return job.to_dict()
+
+# ✅ 결과 JSONL (실행 중이면 지금까지 끝난 턴까지)
+@app.get("/jobs/{job_id}/results")
+def job_results(request: Request, job_id: str):
+    if not check_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    from jobs.manager import get_job
+    job = get_job(job_id)
+    if job is None or not os.path.exists(job.output_path):
+        return JSONResponse({"error": "no results"}, status_code=404)
+    return FileResponse(job.output_path, media_type="application/x-ndjson")
+
+# ✅ 턴 하나 생성 (/chat/stream, /chat/ws 공용) — 진행 중 요청 수 집계 포함
+async def counted_turn(state: AgentState):
+    global inflight_requests
+    inflight_requests += 1
+    try:
+        async with aclosing(generate_turn(state)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+    finally:
+        inflight_requests -= 1
+
+async def generate_turn(state: AgentState):
+    if not model_ready:
+        yield R"⚠️ 모델이 아직 준비되지 않았습니다.\n"
+        return
+
+    if state.stage in model_paths:
+        prefetcher.record_use(state.stage, model_paths[state.stage])
+    drift_result = await detect_with_warmup(state)
+
+    if drift_result.get("drift"):
+        log_event("drift", session_id=state.session_id, stage=state.stage, turn=state.turn,
+                  score=drift_result.get("score"), reasons=drift_result.get("reasons", []))
+
+    # ✅ 오직 reset_triggered 기준만으로 리셋 응답 출력
+    if drift_result.get("reset_triggered"):
+        log_event("reset_triggered", session_id=state.session_id, stage=state.stage,
+                  next_stage=drift_result.get("next_stage"), turn=state.turn)
+        yield drift_result["response"].encode("utf-8")
+        yield b"\n---END_STAGE---\n" + json.dumps({
+            "next_stage": drift_result.get("next_stage", state.stage),
+            "response": drift_result.get("response", ""),
+            "turn": drift_result.get("turn", 0),
+            "history": drift_result.get("history", []),
+            "preset_questions": drift_result.get("preset_questions", []),
+            "drift_trace": drift_result.get("drift_trace", []),
+            "user_profile": drift_result.get("user_profile", {}),
+            "reset_triggered": False,  # ✅ 다음 턴으로 넘기지 않음
+            "intro_shown": drift_result.get("intro_shown", False)
+        }, ensure_ascii=False).encode("utf-8")
+        return
+
+    if state.stage not in STAGE_LOADERS:
+        yield R"모든 세션이 종료되었습니다. 감사합니다.\n"
+        return
+
+    # ✅ 큐 깊이/첫 토큰 지연에 따라 토큰 예산 축소 → 작은 모델 → 고정 질문 순으로 품질 조정
+    decision = degradation.decide(state.stage, inflight_requests, model_paths)
+    if decision.level:
+        log_event("degrade", session_id=state.session_id, stage=state.stage, turn=state.turn, **decision.to_dict())
+    if decision.action == "canned":
+        state.response = canned_reply(state.stage)
+        yield state.response.encode("utf-8")
+        yield b"\n---END_STAGE---\n" + json.dumps({
+            "next_stage": state.stage,
+            "response": state.response,
+            "turn": state.turn,
+            "history": state.history,
+            "preset_questions": state.preset_questions,
+            "drift_trace": state.drift_trace.to_list(),
+            "user_profile": state.user_profile or {},
+            "reset_triggered": False,
+            "intro_shown": state.intro_shown,
+            "degraded": decision.to_dict()
+        }, ensure_ascii=False).encode("utf-8")
+        return
+    decision.apply()
+
+    started, ttft_ms = time.perf_counter(), None
+    # ✅ 같은 모델 컨텍스트를 쓰는 다른 턴/프리페치와 디코딩이 섞이지 않도록 생성 잠금
+    # ✅ 클라이언트 연결 종료/취소 시 에이전트 스트림을 즉시 닫아 디코딩 중단
+    async with hold_generation(generation_key(state.stage, model_paths[state.stage])), \
+            aclosing(stream_stage(state.stage, state, model_paths[state.stage])) as agent_gen:
+        async for chunk in agent_gen:
+            trailer = parse_trailer(chunk)
+            if trailer is not None:
+                # ✅ 다음 단계 모델을 미리 준비 (턴 카운터 기반 예측)
+                prefetcher.observe(state.session_id, trailer, model_paths)
+            elif ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+            yield chunk
+    if ttft_ms is not None:
+        degradation.observe(state.stage, ttft_ms)
+
+    # ✅ 방금 생성한 응답의 드리프트를 한 번만 계산해 trailer로 전달
+    drift_analysis = None
+    if state.response:
+        drift_analysis = await run_in_thread(
+            analyze_turn_reply, state.stage, state.response, (state.question or "").strip()
+        )
+
+    slog("turn", "✅ 턴 완료", stage=state.stage, session=state.session_id, turn=state.turn,
+         ttft_ms=ttft_ms, total_ms=elapsed_ms(started), drift_score=drift_analysis and drift_analysis["score"])
+
+    # ✅ 대화 기록은 큐에 넣기만 하고 백그라운드에서 일괄 기록
+    log_event("turn", session_id=state.session_id, stage=state.stage, turn=state.turn,
+              question=state.question, response=state.response,
+              drift_score=drift_analysis and drift_analysis["score"],
+              drift=bool(drift_analysis and drift_analysis["drift"]))
+
+    yield b"\n---END_STAGE---\n" + json.dumps({
+        "next_stage": state.stage,
+        "response": state.response or "",
+        "turn": state.turn,
+        "history": state.history,
+        "preset_questions": state.preset_questions,
+        "drift_trace": state.drift_trace.to_list(),
+        "user_profile": state.user_profile or {},
+        "reset_triggered": False,
+        "intro_shown": state.intro_shown,
+        "drift": drift_analysis,
+        "degraded": decision.to_dict()
+    }, ensure_ascii=False).encode("utf-8")
 
 @app.post("/chat/stream")
 async def chat_stream(request: Request):
     try:
         body = await request.body()
         data = json.loads(body.decode())
-        incoming_state = data.get("state", {})
-        incoming_state.setdefault("preset_questions", [])
-        incoming_state.setdefault("drift_trace", [])
-        state = AgentState(**incoming_state)
+        state = AgentState.from_payload(data.get("state", {}))
     except Exception:
         return StreamingResponse(iter([
             R"\n⚠️ 입력 상태를 파싱하는 중 오류가 발생했습니다.\n",
@@ -163,64 +363,167 @@ async def chat_stream(request: Request):
                 "reset_triggered": False,
                 "intro_shown": False
             }, ensure_ascii=False).encode("utf-8")
-        ]), media_type="text/plain")
-
-    async def async_gen():
-        if not model_ready:
-            yield R"⚠️ 모델이 아직 준비되지 않았습니다.\n"
+        ]), media_type="text/plain", status_code=400)
+
+    # ✅ 요청 단위 프로파일 (X-Profile: 1 + 관리자 토큰, 또는 TTM_PROFILE_SAMPLE_RATE) — 이 요청의 스택만 단계/세션 태그로 저장
+    producer, headers = partial(counted_turn, state), {}
+    if should_profile(request.headers, partial(check_admin, request)):
+        capture = Capture({"stage": state.stage, "session": state.session_id, "turn": state.turn})
+        producer = partial(profiled_stream, producer, capture)
+        headers["x-profile-id"] = capture.id
+
+    # ✅ 같은 턴의 재시도는 진행 중인 생성에 붙고, 재연결은 버퍼를 오프셋부터 재생 (새 디코딩 없음)
+    key = turn_key(state, request.headers.get("idempotency-key"))
+    if stream_cache is None or key is None or not model_ready:
+        return StreamingResponse(producer(), media_type="text/plain", headers=headers)
+    try:
+        offset = int(request.headers.get("x-resume-offset") or request.query_params.get("offset") or 0)
+    except ValueError:
+        offset = 0
+    before = (state.stage, state.turn, state.history_len)
+    entry, started = stream_cache.get_or_start(key, producer, keep=partial(turn_advanced, before))
+    if not started:
+        headers.pop("x-profile-id", None)  # 기존 생성에 붙은 요청은 새로 프로파일하지 않음
+    return StreamingResponse(
+        stream_cache.subscribe(entry, offset),
+        media_type="text/plain",
+        headers={**headers, "x-stream-attached": "0" if started else "1"},
+    )
+
+# ✅ 다음 상태로 넘어간 턴만 캐시에 남김: 오류/대체 응답과 고정 질문(canned)은 turn/history가 그대로라
+#    같은 질문을 다시 보내면 같은 키가 되므로, 캐시해 두면 TTL 동안 실패 응답이 재생됨
+def turn_advanced(before: tuple, output: bytes) -> bool:
+    trailers = [parse_trailer(TRAILER_MARKER + part) for part in output.split(TRAILER_MARKER)[1:]]
+    trailers = [t for t in trailers if t]
+    if not trailers or any((t.get("degraded") or {}).get("action") == "canned" for t in trailers):
+        return False
+    agent = trailers[0]
+    return (agent.get("next_stage"), agent.get("turn"), len(agent.get("history") or [])) != before
+
+# ✅ 대화 하나당 WebSocket 연결 하나: 상태는 연결이 유지되는 동안 서버에 두고, 토큰은 프레임으로 전송
+# 클라이언트 → {"type": "start", "state": {...}} / {"type": "turn", "question": "..."} / {"type": "cancel"} / {"type": "state"}
+# 서버 → {"type": "ready"} / {"type": "token", "text": "..."} / {"type": "end", "trailer": {...}} / {"type": "cancelled"} / {"type": "error"}
+@app.websocket("/chat/ws")
+async def chat_ws(websocket: WebSocket):
+    await websocket.accept()
+    state: Optional[AgentState] = None
+    task: Optional[asyncio.Task] = None
+
+    async def send(message: dict):
+        await websocket.send_text(json.dumps(message, ensure_ascii=False))
+
+    # 상태는 인자로 받음: 생성 중 연결의 state가 바뀌어도 이 턴의 trailer는 이 턴의 세션에만 반영
+    async def run(state: AgentState, question: str):
+        state.question = question
+        trailers, started = [], False
+        try:
+            async with aclosing(counted_turn(state)) as chunks:
+                async for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode("utf-8")
+                    trailer = parse_trailer(chunk)
+                    if trailer is not None:
+                        trailers.append(trailer)
+                        continue
+                    if chunk == b"\n" and not started:
+                        continue  # HTTP 스트림의 첫 토큰 표시
+                    started = True
+                    await send({"type": "token", "text": chunk.decode("utf-8", errors="ignore")})
+        except asyncio.CancelledError:
+            # ✅ 에이전트 스트림이 닫히면서 디코딩도 중단됨 — 세션 상태는 이번 턴 이전 그대로 유지
+            log_event("cancelled", session_id=state.session_id, stage=state.stage, turn=state.turn)
+            try:
+                await send({"type": "cancelled"})
+            except Exception:
+                pass  # 연결 종료로 인한 취소
             return
-
-        drift_result = run_detect(state)
-
-        # ✅ 오직 reset_triggered 기준만으로 리셋 응답 출력
-        if drift_result.get("reset_triggered"):
-            yield drift_result["response"].encode("utf-8")
-            yield b"\n---END_STAGE---\n" + json.dumps({
-                "next_stage": drift_result.get("next_stage", state.stage),
-                "response": drift_result.get("response", ""),
-                "turn": drift_result.get("turn", 0),
-                "history": drift_result.get("history", []),
-                "preset_questions": drift_result.get("preset_questions", []),
-                "drift_trace": drift_result.get("drift_trace", []),
-                "user_profile": drift_result.get("user_profile", {}),
-                "reset_triggered": False,  # ✅ 다음 턴으로 넘기지 않음
-                "intro_shown": drift_result.get("intro_shown", False)
-            }, ensure_ascii=False).encode("utf-8")
+        except Exception as e:
+            logger.exception(f"❌ WebSocket 턴 생성 실패: {state.session_id}")
+            await send({"type": "error", "error": f"응답 생성 중 오류가 발생했습니다: {e}"})
             return
-
-        async def collect_stream(generator):
-            async for chunk in generator:
-                yield chunk
-
-        agent_streams = {
-            "empathy": lambda: stream_empathy_reply((state.question or "").strip(), model_paths["empathy"], state.turn, state),
-            "mi": lambda: stream_mi_reply(state, model_paths["mi"]),
-            "cbt1": lambda: stream_cbt1_reply(state, model_paths["cbt1"]),
-            "cbt2": lambda: stream_cbt2_reply(state, model_paths["cbt2"]),
-            "cbt3": lambda: stream_cbt3_reply(state, model_paths["cbt3"]),
-        }
-
-        if state.stage not in agent_streams:
-            yield R"모든 세션이 종료되었습니다. 감사합니다.\n"
+        if not trailers:
+            if state.stage not in STAGE_LOADERS and model_ready:
+                # 마지막 단계 이후: 안내 문구만 전송되고 trailer 없음 → 세션 종료 표시
+                await send({"type": "end", "trailer": None, "finished": True})
+            else:
+                await send({"type": "error", "error": "모델이 아직 준비되지 않았습니다."})
             return
+        # 에이전트 trailer가 다음 상태를 정하고, 서버 trailer는 드리프트/품질 조정 정보를 더함
+        final = dict(trailers[0])
+        for extra in trailers[1:]:
+            final.update({k: extra[k] for k in ("drift", "degraded") if k in extra})
+        state.apply_trailer(final)
+        await send({"type": "end", "trailer": final})
 
-        agent_gen = collect_stream(agent_streams[state.stage]())
-        async for chunk in agent_gen:
-            yield chunk
-
-        yield b"\n---END_STAGE---\n" + json.dumps({
-            "next_stage": state.stage,
-            "response": state.response or "",
-            "turn": state.turn,
-            "history": state.history,
-            "preset_questions": state.preset_questions,
-            "drift_trace": state.drift_trace,
-            "user_profile": state.user_profile or {},
-            "reset_triggered": False,
-            "intro_shown": state.intro_shown
-        }, ensure_ascii=False).encode("utf-8")
-
-    return StreamingResponse(async_gen(), media_type="text/plain")
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            try:
+                message = json.loads(frame.get("text") or (frame.get("bytes") or b"").decode("utf-8"))
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                await send({"type": "error", "error": "JSON 객체 메시지만 받을 수 있습니다."})
+                continue
+            kind = message.get("type")
+            if kind == "start":
+                if task is not None and not task.done():
+                    await send({"type": "error", "error": "턴을 생성하는 중에는 세션을 새로 시작할 수 없습니다. cancel 후 다시 보내 주세요."})
+                    continue
+                try:
+                    state = AgentState.from_payload(message.get("state", {}))
+                except Exception as e:
+                    await send({"type": "error", "error": f"입력 상태가 잘못되었습니다: {e}"})
+                    continue
+                await send({"type": "ready", "session_id": state.session_id, "stage": state.stage, "turn": state.turn})
+            elif state is None:
+                await send({"type": "error", "error": "먼저 start 메시지로 세션을 시작해 주세요."})
+            elif kind == "turn":
+                if task is not None and not task.done():
+                    await send({"type": "error", "error": "이전 턴을 생성하는 중입니다. cancel 후 다시 보내 주세요."})
+                    continue
+                task = asyncio.create_task(run(state, str(message.get("question") or "")))
+            elif kind == "cancel":
+                if task is not None and not task.done():
+                    task.cancel()
+            elif kind == "state":
+                await send({"type": "state", "state": state.to_payload()})
+            else:
+                await send({"type": "error", "error": f"알 수 없는 메시지: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # ✅ 연결이 끊기면 진행 중인 생성도 바로 중단해 연산 반환
+        if task is not None and not task.done():
+            task.cancel()
+
+# ✅ 단계 모델 준비 (로딩은 스레드에서 → 이벤트 루프를 막지 않음)
+async def warm_stage_model(stage: str):
+    if stage not in model_paths:
+        return
+    from agents.registry import load_stage_model
+    try:
+        await run_in_thread(load_stage_model, stage, model_paths[stage])
+    except Exception:
+        logger.exception(f"❌ {stage} 모델 사전 준비 실패")  # 에이전트가 자체 fallback 응답 처리
+
+# ✅ 이전 턴에서 계산된 드리프트 결과가 있으면 점수 계산만 재사용, 없으면 모델 준비와 동시에 분석
+#    (어느 쪽이든 run_detect가 drift_trace 기록과 최근 3턴 리셋 판단을 수행)
+async def detect_with_warmup(state: AgentState) -> dict:
+    if not state.response:
+        await warm_stage_model(state.stage)
+        return {}
+    precomputed = get_precomputed_analysis(state)
+    if precomputed is not None:
+        await warm_stage_model(state.stage)
+        return run_detect(state, precomputed)
+    drift_result, _ = await asyncio.gather(
+        run_in_thread(run_detect, state),
+        warm_stage_model(state.stage),
+    )
+    return drift_result
 
 async def dummy_loop():
     while True:
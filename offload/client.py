@@ -0,0 +1,71 @@
+# 📁 offload/client.py
+# API 워커에서 사용하는 경량 클라이언트. llama_cpp.Llama의 create_chat_completion과 같은 모양으로 토큰을 돌려줍니다.
+import socket
+
+from offload.protocol import get_socket_path, encode_frame, decode_frame
+
+class RemoteLlama:
+    def __init__(self, socket_path: str, stage: str, model_path: str, timeout: float = 300.0):
+        self.socket_path = socket_path
+        self.stage = stage
+        self.model_path = model_path
+        self.timeout = timeout
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _request(self, payload: dict):
+        sock = self._connect()
+        try:
+            sock.sendall(encode_frame(payload))
+            reader = sock.makefile("rb")
+            for line in reader:
+                frame = decode_frame(line)
+                if "error" in frame:
+                    raise RuntimeError(f"모델 호스트 오류: {frame['error']}")
+                yield frame
+                if frame.get("done") or frame.get("ok"):
+                    return
+        finally:
+            sock.close()
+
+    def load(self):
+        for _ in self._request({"op": "load", "stage": self.stage, "model_path": self.model_path}):
+            pass
+        return self
+
+    def _stream_chat(self, messages, params):
+        payload = {
+            "op": "chat",
+            "stage": self.stage,
+            "model_path": self.model_path,
+            "messages": messages,
+            "params": params,
+        }
+        for frame in self._request(payload):
+            if "delta" in frame:
+                yield {"choices": [{"index": 0, "delta": {"content": frame["delta"]}, "finish_reason": None}]}
+            elif frame.get("done"):
+                yield {"choices": [{"index": 0, "delta": {}, "finish_reason": frame.get("finish_reason")}]}
+
+    def create_chat_completion(self, messages, stream: bool = False, **params):
+        chunks = self._stream_chat(messages, params)
+        if stream:
+            return chunks
+        content = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks)
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+
+# ✅ 단계별 원격 모델 핸들 캐시
+REMOTE_INSTANCE = {}
+
+def get_remote_model(stage: str, model_path: str):
+    socket_path = get_socket_path()
+    if not socket_path:
+        return None
+    key = (socket_path, stage, model_path)
+    if key not in REMOTE_INSTANCE:
+        REMOTE_INSTANCE[key] = RemoteLlama(socket_path, stage, model_path)
+    return REMOTE_INSTANCE[key]
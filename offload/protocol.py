@@ -0,0 +1,15 @@
+# 📁 offload/protocol.py
+# 모델 호스트 ↔ API 워커 간 통신 규약: 유닉스 소켓 위에서 줄 단위 JSON 프레임을 주고받습니다.
+import json, os
+
+SOCKET_ENV = "TTM_OFFLOAD_SOCKET"
+DEFAULT_SOCKET_PATH = "/tmp/ttm-offload.sock"
+
+def get_socket_path():
+    return os.getenv(SOCKET_ENV) or None
+
+def encode_frame(payload: dict) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+def decode_frame(line: bytes) -> dict:
+    return json.loads(line.decode("utf-8"))
@@ -0,0 +1,112 @@
+# 📁 offload/server.py
+# 모든 Llama 인스턴스를 소유하는 모델 호스트 프로세스.
+# 실행: python -m offload.server --socket /tmp/ttm-offload.sock --model cbt1=/models/cbt1/xxx.gguf ...
+import argparse, os, socketserver, threading
+
+from offload.protocol import SOCKET_ENV, DEFAULT_SOCKET_PATH, encode_frame, decode_frame
+from shared.logger import logger
+
+# ✅ 모델별 잠금 (Llama 인스턴스는 스레드 안전하지 않음)
+MODEL_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+def get_model_lock(key) -> threading.Lock:
+    with _LOCKS_GUARD:
+        if key not in MODEL_LOCKS:
+            MODEL_LOCKS[key] = threading.Lock()
+        return MODEL_LOCKS[key]
+
+# ✅ 모델 로딩 자체도 단계별로 직렬화 (동시 요청이 같은 GGUF를 두 번 올리지 않도록)
+def load_local_model(stage: str, model_path: str):
+    from agents.registry import load_stage_model
+    with get_model_lock(("load", stage, model_path)):
+        return load_stage_model(stage, model_path)
+
+class OffloadHandler(socketserver.StreamRequestHandler):
+    def send(self, payload: dict):
+        self.wfile.write(encode_frame(payload))
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = decode_frame(line)
+            op = request.get("op", "chat")
+            if op == "ping":
+                self.send({"ok": True, "models": [":".join(map(str, key)) for key in MODEL_LOCKS if key[0] != "load"]})
+            elif op == "load":
+                load_local_model(request["stage"], request["model_path"])
+                self.send({"ok": True})
+            elif op == "chat":
+                self.handle_chat(request)
+            else:
+                self.send({"error": f"알 수 없는 요청: {op}"})
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("🔌 클라이언트 연결 종료 → 생성 중단")
+        except Exception as e:
+            logger.exception("❌ 오프로드 요청 처리 실패")
+            try:
+                self.send({"error": str(e)})
+            except OSError:
+                pass
+
+    def handle_chat(self, request: dict):
+        stage, model_path = request["stage"], request["model_path"]
+        params = request.get("params") or {}
+        llm = load_local_model(stage, model_path)
+        # ✅ LoRA 모드에서는 여러 단계가 같은 베이스 모델을 공유하므로 베이스 기준으로 잠금
+        with get_model_lock(getattr(llm, "lock_key", (stage, model_path))):
+            stream = llm.create_chat_completion(messages=request["messages"], stream=True, **params)
+            try:
+                for chunk in stream:
+                    choice = chunk["choices"][0]
+                    token = choice.get("delta", {}).get("content", "")
+                    if token:
+                        self.send({"delta": token})
+                    if choice.get("finish_reason"):
+                        self.send({"done": True, "finish_reason": choice["finish_reason"]})
+                        return
+            finally:
+                # ✅ 클라이언트가 끊기면 제너레이터를 닫아 디코딩을 멈춤
+                stream.close()
+            self.send({"done": True, "finish_reason": None})
+
+class OffloadServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def serve(socket_path: str, preload: dict = None):
+    # ✅ 호스트 프로세스 자신은 로컬 모델을 사용해야 하므로 클라이언트 모드 해제
+    os.environ.pop(SOCKET_ENV, None)
+
+    for stage, model_path in (preload or {}).items():
+        logger.info(f"📦 모델 사전 로딩: {stage} → {model_path}")
+        load_local_model(stage, model_path)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with OffloadServer(socket_path, OffloadHandler) as server:
+        os.chmod(socket_path, 0o660)
+        logger.info(f"🚀 모델 호스트 대기 중: {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="TTM 모델 호스트 (Llama 인스턴스 공유)")
+    parser.add_argument("--socket", default=os.getenv(SOCKET_ENV, DEFAULT_SOCKET_PATH))
+    parser.add_argument("--model", action="append", default=[], metavar="STAGE=PATH",
+                        help="시작 시 미리 로딩할 모델 (여러 번 지정 가능)")
+    args = parser.parse_args()
+
+    preload = {}
+    for item in args.model:
+        stage, _, path = item.partition("=")
+        preload[stage] = path
+    serve(args.socket, preload)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# 📁 router.py
+# 멀티 노드용 세션 고정 라우터 (별도 ASGI 앱).
+# session_id를 일관 해싱으로 백엔드에 고정하고, 각 백엔드의 /status(ready, inflight, draining)를 보고 라우팅합니다.
+# 실행: TTM_ROUTER_BACKENDS=http://127.0.0.1:8081,http://127.0.0.1:8082 uvicorn router:app --port 8080
+# /chat/stream은 요청마다, /chat/ws는 연결 단위로(첫 start 메시지의 session_id 기준) 백엔드에 고정해 중계합니다.
+import asyncio, bisect, contextlib, hashlib, json, os, time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from shared.logger import logger
+
+VIRTUAL_NODES = int(os.getenv("TTM_ROUTER_VNODES", 64))
+HEALTH_INTERVAL = float(os.getenv("TTM_ROUTER_HEALTH_INTERVAL", 2.0))
+MAX_INFLIGHT = int(os.getenv("TTM_ROUTER_MAX_INFLIGHT", 4))
+MAX_PINNED_SESSIONS = int(os.getenv("TTM_ROUTER_MAX_SESSIONS", 100000))
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = False
+        self.ready = False
+        self.draining = False         # 백엔드가 /status로 보고한 값
+        self.drain_requested = False  # 라우터에서 드레인 요청한 값
+        self.inflight = 0  # 백엔드가 보고한 값
+        self.routed = 0    # 라우터가 보낸 진행 중 요청 수 (헬스 체크 사이 보정용)
+        self.last_seen = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and not (self.draining or self.drain_requested)
+
+    @property
+    def load(self) -> int:
+        return max(self.inflight, self.routed)
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url, "healthy": self.healthy, "ready": self.ready,
+            "draining": self.draining or self.drain_requested, "inflight": self.inflight, "routed": self.routed,
+            "last_seen": self.last_seen,
+        }
+
+class HashRing:
+    def __init__(self, backends: List[Backend], vnodes: int = VIRTUAL_NODES):
+        points = sorted((_hash(f"{b.url}#{i}"), b) for b in backends for i in range(vnodes))
+        self.keys = [h for h, _ in points]
+        self.nodes = [b for _, b in points]
+
+    # ✅ 링 위에서 시계 방향으로 중복 없이 후보 백엔드 나열
+    def candidates(self, key: str):
+        if not self.nodes:
+            return
+        start = bisect.bisect(self.keys, _hash(key)) % len(self.nodes)
+        seen = set()
+        for i in range(len(self.nodes)):
+            node = self.nodes[(start + i) % len(self.nodes)]
+            if node.url not in seen:
+                seen.add(node.url)
+                yield node
+
+class SessionRouter:
+    def __init__(self, urls: List[str]):
+        self.backends: Dict[str, Backend] = {u.rstrip("/"): Backend(u) for u in urls}
+        self.ring = HashRing(list(self.backends.values()))
+        self.pinned: "OrderedDict[str, str]" = OrderedDict()
+        self.stats = {"routed": 0, "pinned_hits": 0, "migrations": 0, "overflow": 0}
+
+    def _pin(self, session_id: str, backend: Backend):
+        self.pinned[session_id] = backend.url
+        self.pinned.move_to_end(session_id)
+        while len(self.pinned) > MAX_PINNED_SESSIONS:
+            self.pinned.popitem(last=False)
+
+    def pick(self, session_id: str) -> Optional[Backend]:
+        self.stats["routed"] += 1
+        pinned_url = self.pinned.get(session_id)
+        if pinned_url:
+            backend = self.backends.get(pinned_url)
+            if backend is not None and backend.available:
+                self.stats["pinned_hits"] += 1
+                self.pinned.move_to_end(session_id)
+                return backend
+
+        # ✅ 링 순서대로 가용 + 여유 있는 백엔드 선택 (모두 포화면 링 상 첫 가용 백엔드)
+        first_available = None
+        for backend in self.ring.candidates(session_id):
+            if not backend.available:
+                continue
+            if first_available is None:
+                first_available = backend
+            if backend.load < MAX_INFLIGHT:
+                chosen = backend
+                break
+        else:
+            chosen = first_available
+        if chosen is None:
+            return None
+        if chosen is not first_available:
+            self.stats["overflow"] += 1
+        if pinned_url and pinned_url != chosen.url:
+            self.stats["migrations"] += 1
+            logger.info(f"🔀 세션 이동: {session_id} {pinned_url} → {chosen.url}")
+        self._pin(session_id, chosen)
+        return chosen
+
+    async def poll_health(self, client: httpx.AsyncClient):
+        async def check(backend: Backend):
+            try:
+                resp = await client.get(f"{backend.url}/status", timeout=1.0)
+                data = resp.json()
+                backend.healthy = resp.status_code == 200 and bool(data.get("ready", False))
+                backend.ready = bool(data.get("ready", False))
+                backend.draining = bool(data.get("draining", False))
+                backend.inflight = int(data.get("inflight", 0))
+                backend.last_seen = time.time()
+            except Exception:
+                backend.healthy = False
+        await asyncio.gather(*(check(b) for b in self.backends.values()))
+
+def _backend_urls() -> List[str]:
+    return [u.strip() for u in os.getenv("TTM_ROUTER_BACKENDS", "").split(",") if u.strip()]
+
+app = FastAPI()
+router = SessionRouter(_backend_urls())
+client: Optional[httpx.AsyncClient] = None
+
+async def health_loop():
+    while True:
+        await router.poll_health(client)
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+@app.on_event("startup")
+async def startup_tasks():
+    global client
+    client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=2.0))
+    await router.poll_health(client)
+    asyncio.create_task(health_loop())
+
+@app.on_event("shutdown")
+async def shutdown_tasks():
+    if client is not None:
+        await client.aclose()
+
+@app.get("/")
+def root():
+    return JSONResponse({"message": "✅ TTM 세션 라우터 실행 중"})
+
+@app.get("/status")
+def status():
+    return {
+        "ready": any(b.available for b in router.backends.values()),
+        "backends": [b.to_dict() for b in router.backends.values()],
+        "sessions": len(router.pinned),
+        **router.stats,
+    }
+
+# ✅ 관리자 엔드포인트 인증 (main.check_admin과 동일: TTM_ADMIN_TOKEN이 없으면 모두 거부)
+def check_admin(request: Request) -> bool:
+    token = os.getenv("TTM_ADMIN_TOKEN")
+    return bool(token) and request.headers.get("x-admin-token") == token
+
+# ✅ 노드 드레인: 새 세션/이동 세션을 다른 노드로 보내고, 백엔드에도 드레인 표시
+@app.post("/admin/drain")
+async def drain(request: Request, backend: str, enable: bool = True):
+    if not check_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    target = router.backends.get(backend.rstrip("/"))
+    if target is None:
+        return JSONResponse({"error": f"unknown backend: {backend}"}, status_code=404)
+    target.drain_requested = enable
+    try:
+        headers = {"x-admin-token": os.getenv("TTM_ADMIN_TOKEN", "")}
+        await client.post(f"{target.url}/admin/drain", params={"enable": enable}, headers=headers, timeout=2.0)
+    except Exception:
+        logger.warning(f"⚠️ 백엔드 드레인 요청 실패: {target.url}")
+    return target.to_dict()
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    body = await request.body()
+    try:
+        session_id = str(json.loads(body.decode()).get("state", {}).get("session_id", ""))
+    except Exception:
+        session_id = ""
+
+    backend = router.pick(session_id)
+    if backend is None:
+        return JSONResponse({"error": "사용 가능한 백엔드가 없습니다."}, status_code=503)
+
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+    backend.routed += 1
+    try:
+        upstream_req = client.build_request("POST", f"{backend.url}/chat/stream", content=body, headers=headers)
+        upstream = await client.send(upstream_req, stream=True)
+    except Exception:
+        backend.routed -= 1
+        backend.healthy = False
+        logger.exception(f"❌ 백엔드 연결 실패: {backend.url}")
+        return JSONResponse({"error": "백엔드 연결 실패"}, status_code=502)
+
+    released = False
+
+    # ✅ 응답이 끝나면(정상 종료/클라이언트 끊김) BackgroundTask로 정리 — 제너레이터가 끝까지 돌지 않아도 실행됨
+    async def release():
+        nonlocal released
+        if released:
+            return
+        released = True
+        backend.routed -= 1
+        await upstream.aclose()
+
+    async def relay():
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await release()  # BackgroundTask가 생략되는 경로(전송 중 OSError) 대비, 중복 호출은 무시
+
+    return StreamingResponse(
+        relay(),
+        status_code=upstream.status_code,
+        media_type=upstream.headers.get("content-type", "text/plain"),
+        headers={"x-ttm-backend": backend.url},
+        background=BackgroundTask(release),
+    )
+
+def _ws_url(url: str) -> str:
+    return "ws" + url[len("http"):] if url.startswith("http") else url
+
+# ✅ WebSocket 중계: 세션 상태가 백엔드 연결에 있으므로 연결이 끝날 때까지 처음 고른 백엔드에 고정
+@app.websocket("/chat/ws")
+async def chat_ws(websocket: WebSocket):
+    import websockets
+    await websocket.accept()
+    try:
+        first = await websocket.receive_text()
+    except WebSocketDisconnect:
+        return
+    try:
+        session_id = str(json.loads(first).get("state", {}).get("session_id", ""))
+    except Exception:
+        session_id = ""
+
+    backend = router.pick(session_id)
+    if backend is None:
+        await websocket.send_text(json.dumps({"type": "error", "error": "사용 가능한 백엔드가 없습니다."}, ensure_ascii=False))
+        await websocket.close(code=1013)
+        return
+
+    backend.routed += 1
+    try:
+        try:
+            upstream = await websockets.connect(f"{_ws_url(backend.url)}/chat/ws", open_timeout=2.0, max_size=None)
+        except Exception:
+            backend.healthy = False
+            logger.exception(f"❌ 백엔드 WebSocket 연결 실패: {backend.url}")
+            await websocket.send_text(json.dumps({"type": "error", "error": "백엔드 연결 실패"}, ensure_ascii=False))
+            await websocket.close(code=1011)
+            return
+
+        async def to_client():
+            async for message in upstream:
+                if isinstance(message, bytes):
+                    await websocket.send_bytes(message)
+                else:
+                    await websocket.send_text(message)
+
+        async def to_backend():
+            while True:
+                frame = await websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    return
+                if frame.get("text") is not None:
+                    await upstream.send(frame["text"])
+                elif frame.get("bytes") is not None:
+                    await upstream.send(frame["bytes"])
+
+        async with upstream:
+            await upstream.send(first)
+            tasks = [asyncio.create_task(to_client()), asyncio.create_task(to_backend())]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        # 클라이언트가 끊었으면 upstream을 닫는 것으로 백엔드의 생성도 중단됨, 백엔드가 끊었으면 클라이언트도 닫음
+        with contextlib.suppress(Exception):
+            await websocket.close()
+    finally:
+        backend.routed -= 1
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("router:app", host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
@@ -0,0 +1,167 @@
+# 📁 shared/event_log.py
+# 대화 기록 / 드리프트 이벤트의 append-only 로그 (write-behind).
+# 요청 경로에서는 큐에 넣기만 하고, 백그라운드 스레드가 묶어서 쓰고 크기/주기 기준으로 fsync 합니다.
+# 큐는 TTM_EVENT_LOG_QUEUE(기본 100000)개로 제한: 디스크가 밀려 가득 차면 요청을 막지 않고 이벤트를 버리고 overflow로 셉니다.
+import glob, json, os, queue, threading, time
+from typing import Iterator, Optional
+
+from shared.logger import logger
+
+EVENT_LOG_ENV = "TTM_EVENT_LOG_DIR"
+
+_STOP = object()
+
+class EventLog:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        batch_size: int = 256,
+        fsync_bytes: int = 1024 * 1024,
+        fsync_interval: float = 1.0,
+        max_queue: Optional[int] = None,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.fsync_bytes = fsync_bytes
+        self.fsync_interval = fsync_interval
+        self.max_queue = max_queue or int(os.getenv("TTM_EVENT_LOG_QUEUE", 100000))
+        self.queue = queue.Queue(maxsize=self.max_queue)
+        self.dropped = 0   # 기록 실패로 버린 이벤트
+        self.overflow = 0  # 큐가 가득 차 버린 이벤트
+        self.written = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._seq = 0
+        self._file = None
+        self._segment_size = 0
+        self._unsynced = 0
+        self._sync_deadline: Optional[float] = None  # 첫 미동기화 쓰기 + fsync_interval
+        self._thread = threading.Thread(target=self._run, name="ttm-event-log", daemon=True)
+        self._thread.start()
+
+    # ✅ 요청 경로: 직렬화/IO 없이 큐에 넣기만 함 (가득 차면 기다리지 않고 버림)
+    def append(self, record: dict):
+        record.setdefault("ts", time.time())
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.overflow += 1
+            if self.overflow == 1 or self.overflow % 10000 == 0:
+                logger.warning(f"⚠️ 이벤트 로그 큐가 가득 차 이벤트를 버립니다 (누적 {self.overflow}개)")
+
+    def close(self, timeout: float = 5.0):
+        try:
+            self.queue.put(_STOP, timeout=timeout)  # 남은 이벤트를 쓰는 동안 자리가 날 때까지 대기
+        except queue.Full:
+            logger.warning("⚠️ 이벤트 로그 종료 대기 시간 초과")
+            return
+        self._thread.join(timeout)
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": self.queue.qsize(), "max_queue": self.max_queue,
+            "written": self.written, "dropped": self.dropped, "overflow": self.overflow,
+        }
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        self._seq += 1
+        name = f"events-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._seq:04d}.jsonl"
+        self._file = open(os.path.join(self.directory, name), "ab", buffering=1024 * 1024)
+        self._segment_size = 0
+
+    def _sync(self):
+        if self._file is None or not self._unsynced:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._sync_deadline = None
+
+    def _write_batch(self, batch: list):
+        if self._file is None or self._segment_size >= self.segment_bytes:
+            self._open_segment()
+        data = b"".join(
+            json.dumps(r, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+            for r in batch
+        )
+        self._file.write(data)
+        self._segment_size += len(data)
+        if not self._unsynced:
+            self._sync_deadline = time.monotonic() + self.fsync_interval
+        self._unsynced += len(data)
+        self.written += len(batch)
+
+    def _run(self):
+        running = True
+        while running:
+            batch = []
+            # 기록할 게 없으면 다음 이벤트까지 대기 (주기적으로 깨어나지 않음), 있으면 fsync 기한까지만 대기
+            timeout = None if self._sync_deadline is None else max(0.0, self._sync_deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+                while True:
+                    if item is _STOP:
+                        running = False
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+                if (
+                    self._unsynced >= self.fsync_bytes
+                    or (self._sync_deadline is not None and time.monotonic() >= self._sync_deadline)
+                    or not running
+                ):
+                    self._sync()
+            except Exception:
+                self.dropped += len(batch)
+                logger.exception("❌ 이벤트 로그 기록 실패")
+
+        if self._file is not None:
+            self._file.close()
+
+# ✅ 프로세스 전역 로그 (TTM_EVENT_LOG_DIR이 없으면 비활성화)
+_EVENT_LOG = None
+_EVENT_LOG_LOCK = threading.Lock()
+
+def get_event_log() -> Optional[EventLog]:
+    global _EVENT_LOG
+    directory = os.getenv(EVENT_LOG_ENV)
+    if not directory:
+        return None
+    if _EVENT_LOG is None:
+        with _EVENT_LOG_LOCK:
+            if _EVENT_LOG is None:
+                _EVENT_LOG = EventLog(directory)
+    return _EVENT_LOG
+
+def log_event(event_type: str, **fields):
+    event_log = get_event_log()
+    if event_log is not None:
+        fields["type"] = event_type
+        event_log.append(fields)
+
+def close_event_log():
+    global _EVENT_LOG
+    if _EVENT_LOG is not None:
+        _EVENT_LOG.close()
+        _EVENT_LOG = None
+
+# ✅ 오프라인 도구용: 세그먼트 파일을 순서대로 한 줄씩 스트리밍
+def iter_events(directory: str) -> Iterator[dict]:
+    for path in sorted(glob.glob(os.path.join(directory, "events-*.jsonl"))):
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -1,8 +1,119 @@
-import logging
+import atexit, logging, logging.handlers, os, queue, random, threading, time
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="[%(asctime)s] %(levelname)s - %(message)s"
-)
+# ✅ 요청 경로의 로그는 큐에 넣기만 하고, 포맷/출력은 백그라운드 스레드(QueueListener)에서 처리
+# TTM_LOG_ASYNC=0 : 기존처럼 호출 스레드에서 바로 출력
+# TTM_LOG_SAMPLE  : 카테고리별 샘플링 비율 (예: "drift=0.1,agent=0.05,turn=1") — WARNING 이상은 항상 기록
+# TTM_LOG_FORMAT  : text(기본) 또는 json
+LOG_FORMAT = "[%(asctime)s] %(levelname)s - %(message)s"
+BASE_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
 
-logger = logging.getLogger(__name__)
\ No newline at end of file
+def parse_sample_rates(value: str) -> dict:
+    rates = {}
+    for item in (value or "").split(","):
+        name, _, rate = item.strip().partition("=")
+        if name and rate:
+            rates[name] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+SAMPLE_RATES = parse_sample_rates(os.getenv("TTM_LOG_SAMPLE", ""))
+
+# ✅ extra로 넘긴 구조화 필드(stage, session, ms 등)를 메시지 뒤에 key=value로 붙임
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json: bool = False):
+        super().__init__(LOG_FORMAT)
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {k: v for k, v in vars(record).items() if k not in BASE_RECORD_FIELDS}
+        if self.as_json:
+            import json
+            payload = {"ts": record.created, "level": record.levelname, "msg": record.getMessage(), **fields}
+            if record.exc_info:
+                payload["exc"] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+        text = super().format(record)
+        if fields:
+            text += " | " + " ".join(
+                f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in fields.items()
+            )
+        return text
+
+# ✅ 기본 QueueHandler는 넣기 전에 전체 줄을 포맷하므로, 메시지만 확정하고 줄 포맷(시간, 필드, 예외)은 리스너 스레드로 미룸
+# target을 주면 리스너를 첫 레코드에서 시작하고, fork된 자식에서는 큐/리스너를 새로 만듦
+# (fork는 리스너 스레드를 넘겨받지 못하므로 부모의 큐에 넣으면 출력되지 않고 쌓이기만 함)
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue, target: logging.Handler = None):
+        super().__init__(log_queue)
+        self.target = target
+        self.listener = None
+        self._start_lock = threading.Lock()
+
+    # %-인자는 호출 시점에 문자열로 확정 (큐에 있는 동안 인자로 넘긴 객체가 바뀌어도 기록된 내용은 그대로)
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.listener is None and self.target is not None:
+            self._start_listener()
+        self.queue.put_nowait(record)
+
+    def _start_listener(self):
+        with self._start_lock:
+            if self.listener is None:
+                listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+                listener.start()
+                self.listener = listener
+
+    def _after_fork(self):
+        # 자식 프로세스: 부모 스레드가 잡고 있던 잠금/큐는 버리고 다음 레코드에서 리스너를 새로 시작
+        self._start_lock = threading.Lock()
+        self.queue = queue.SimpleQueue()
+        self.listener = None
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()  # 남은 로그 출력 후 종료
+            self.listener = None
+
+# ✅ 루트 로거에 이 모듈의 핸들러 설치 (다시 임포트되면 이전에 설치한 것만 교체, 다른 핸들러는 그대로 둠)
+def _setup():
+    stream = logging.StreamHandler()
+    stream.setFormatter(StructuredFormatter(os.getenv("TTM_LOG_FORMAT", "text") == "json"))
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    for installed in [h for h in root.handlers if getattr(h, "_ttm_installed", False)]:
+        root.removeHandler(installed)
+        if isinstance(installed, LazyQueueHandler):
+            installed.stop()
+    if os.getenv("TTM_LOG_ASYNC", "1") == "0":
+        stream._ttm_installed = True
+        root.addHandler(stream)
+        return None
+    handler = LazyQueueHandler(queue.SimpleQueue(), stream)
+    handler._ttm_installed = True
+    root.addHandler(handler)
+    os.register_at_fork(after_in_child=handler._after_fork)
+    atexit.register(handler.stop)  # 종료 시 남은 로그 출력 (fork된 워커도 자기 리스너 기준)
+    return handler
+
+queue_handler = _setup()
+
+logger = logging.getLogger(__name__)
+
+# ✅ 핫패스용 구조화 로그: 샘플링에서 빠지면 레코드도 만들지 않음 (%-인자는 기록될 때만 문자열로 만듦)
+def slog(category: str, msg: str, *args, level: int = logging.INFO, **fields):
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING:
+        rate = SAMPLE_RATES.get(category, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return
+    fields["category"] = category
+    # findCaller(스택 탐색)를 건너뛰고 레코드를 직접 만듦 — 출력 형식에 파일/줄 번호를 쓰지 않음
+    logger.handle(logger.makeRecord(logger.name, level, "(slog)", 0, msg, args, None, extra=fields))
+
+# ✅ 구간 시간 측정 (ms) — 구조화 필드로 넘기기 위한 보조 함수
+def elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
@@ -0,0 +1,237 @@
+# 📁 shared/profiling.py
+# 요청 단위/시간 구간 샘플링 프로파일러.
+# 프로파일 중인 캡처가 있을 때만 샘플러 스레드 하나가 `sys._current_frames()`로 모든 스레드의 스택을 주기적으로 읽고,
+# collapsed-stack 형식(`프레임;프레임;... 횟수`)으로 집계합니다. flamegraph.pl, speedscope, inferno에서 바로 열 수 있습니다.
+# 캡처가 없으면 스레드도 없으므로 요청 경로의 비용은 헤더 확인 한 번뿐입니다.
+#
+# 켜는 방법:
+#   * 요청 헤더 `X-Profile: 1` + `X-Admin-Token` (TTM_ADMIN_TOKEN이 없는 서버에서는 무시)
+#   * `TTM_PROFILE_SAMPLE_RATE=0.01` → 전체 `/chat/stream` 요청의 1%를 자동 프로파일
+#   * `POST /admin/profile?seconds=10` → 지정한 시간 동안 프로세스 전체를 프로파일
+# 요청 캡처(scope=request)는 그 요청의 스택만 담습니다: 이벤트 루프 스레드에서는 요청 태스크가 실행 중일 때의 스택,
+# 그 밖에는 요청이 run_in_thread로 넘긴 작업을 실행 중인 스레드. 시간 구간 캡처(scope=process)는 모든 스레드를 담습니다.
+# 결과는 TTM_PROFILE_DIR(기본 /tmp/ttm-profiles)에 `<id>.collapsed` + `<id>.json`(단계/세션/시간 태그)으로 저장됩니다.
+import asyncio, json, os, random, sys, threading, time, uuid, weakref
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from shared.logger import logger
+
+PROFILE_DIR = os.getenv("TTM_PROFILE_DIR", "/tmp/ttm-profiles")
+SAMPLE_RATE = float(os.getenv("TTM_PROFILE_SAMPLE_RATE", 0))
+INTERVAL = float(os.getenv("TTM_PROFILE_INTERVAL_MS", 5)) / 1000
+MAX_DEPTH = 128
+
+# ✅ 대기 중인 스레드(이벤트 루프 select, 스레드풀 대기 등)는 집계에서 제외
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("base_events.py", "_run_once"),
+}
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def collapse_stack(frame) -> Optional[str]:
+    leaf = frame.f_code
+    if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+        return None
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+class Capture:
+    def __init__(self, tags: dict, scope: str = "request"):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.tags = dict(tags)
+        self.scope = scope
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        # 요청 캡처의 소유 범위: 이벤트 루프 + 스트림을 돌리는 태스크, run_in_thread 작업 중인 스레드
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread: Optional[int] = None
+        self.tasks = weakref.WeakSet()
+        self.threads = set()
+
+    # ✅ 샘플러 스레드에서 호출: 이번 샘플에서 이 캡처에 속하는 스레드
+    def owned_threads(self) -> Optional[set]:
+        if self.scope == "process":
+            return None
+        owned = set(self.threads)
+        if self.loop is not None:
+            try:
+                running = asyncio.current_task(self.loop)
+            except RuntimeError:
+                running = None
+            if running is not None and running in self.tasks:
+                owned.add(self.loop_thread)
+        return owned
+
+    def collapsed(self) -> str:
+        root = ";".join(f"{k}={v}" for k, v in self.tags.items() if v is not None)
+        prefix = root + ";" if root else ""
+        return "".join(f"{prefix}{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "tags": self.tags, "scope": self.scope, "samples": self.samples, "unique_stacks": len(self.stacks),
+            "started": self.started, "finished": self.finished,
+            "duration_s": round((self.finished or time.time()) - self.started, 3),
+        }
+
+# ✅ 활성 캡처가 있는 동안만 도는 공용 샘플러 (캡처가 여러 개여도 스택은 한 번만 읽음)
+class Sampler:
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.captures: Dict[str, Capture] = {}
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self, capture: Capture):
+        with self.lock:
+            capture.started = time.time()
+            self.captures[capture.id] = capture
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="ttm-profiler", daemon=True)
+                self.thread.start()
+
+    def stop(self, capture: Capture) -> Capture:
+        with self.lock:
+            self.captures.pop(capture.id, None)
+        capture.finished = time.time()
+        return capture
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while True:
+            with self.lock:
+                active = list(self.captures.values())
+                if not active:
+                    self.thread = None
+                    return
+            stacks = {}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = collapse_stack(frame)
+                if stack is not None:
+                    stacks[ident] = f"{names.get(ident, ident)};{stack}"
+            for capture in active:
+                owned = capture.owned_threads()
+                capture.samples += 1
+                capture.stacks.update(s for ident, s in stacks.items() if owned is None or ident in owned)
+            time.sleep(self.interval)
+
+_sampler = Sampler()
+
+# ✅ 요청 경로에서 호출: 꺼져 있으면 헤더 확인 한 번으로 끝 (관리자 확인은 헤더가 있을 때만)
+def should_profile(headers, is_admin) -> bool:
+    if headers.get("x-profile") == "1":
+        return is_admin()
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+# ✅ 프로파일 중인 요청의 캡처 (요청 태스크의 컨텍스트 → asyncio.to_thread가 작업 스레드로 복사)
+ACTIVE_CAPTURE: ContextVar[Optional[Capture]] = ContextVar("ttm_active_capture", default=None)
+
+def start_capture(scope: str = "process", **tags) -> Capture:
+    capture = Capture(tags, scope)
+    _sampler.start(capture)
+    return capture
+
+# ✅ 파일 저장 포함 — 이벤트 루프에서는 스레드로 넘겨 호출
+def finish_capture(capture: Capture) -> Capture:
+    _sampler.stop(capture)
+    _save(capture)
+    return capture
+
+def _save(capture: Capture):
+    try:
+        save_capture(capture)
+    except Exception:
+        logger.exception(f"❌ 프로파일 저장 실패: {capture.id}")
+
+def _attributed(func, *args):
+    capture = ACTIVE_CAPTURE.get()
+    if capture is None:
+        return func(*args)
+    ident = threading.get_ident()
+    capture.threads.add(ident)
+    try:
+        return func(*args)
+    finally:
+        capture.threads.discard(ident)
+
+# ✅ 요청 경로의 asyncio.to_thread 대신 사용: 프로파일 중인 요청이면 작업 스레드의 스택도 그 요청 캡처에 포함
+async def run_in_thread(func, *args):
+    return await asyncio.to_thread(_attributed, func, *args)
+
+def save_capture(capture: Capture, directory: str = None):
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{capture.id}.collapsed"), "w", encoding="utf-8") as f:
+        f.write(capture.collapsed())
+    with open(os.path.join(directory, f"{capture.id}.json"), "w", encoding="utf-8") as f:
+        json.dump(capture.to_dict(), f, ensure_ascii=False)
+    logger.info(f"🔥 프로파일 저장: {capture.id} ({capture.samples} 샘플, {capture.tags})")
+
+# ✅ 비동기 스트림 하나를 감싸 처음부터 끝까지(취소 포함) 프로파일 — 스트림을 돌리는 태스크의 스택만 수집
+async def profiled_stream(gen_factory, capture: Capture):
+    loop = asyncio.get_running_loop()
+    capture.loop, capture.loop_thread = loop, threading.get_ident()
+    capture.tasks.add(asyncio.current_task())
+    token = ACTIVE_CAPTURE.set(capture)
+    _sampler.start(capture)
+    try:
+        async for chunk in gen_factory():
+            yield chunk
+            capture.tasks.add(asyncio.current_task())  # 재개한 태스크가 바뀌어도 계속 수집
+    finally:
+        _sampler.stop(capture)
+        loop.run_in_executor(None, _save, capture)  # 취소 중에도 기다리지 않도록 저장은 스레드에서
+        try:
+            ACTIVE_CAPTURE.reset(token)
+        except ValueError:
+            pass  # 다른 컨텍스트에서 정리되는 경우 (비동기 제너레이터 finalizer)
+
+# ✅ 시간 구간 프로파일 (요청과 관계없이 프로세스 전체)
+async def profile_window(seconds: float, **tags) -> Capture:
+    capture = start_capture("process", window=f"{seconds:g}s", **tags)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(finish_capture, capture)
+    return capture
+
+def list_profiles(directory: str = None, limit: int = 50) -> list:
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    results = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    results.append(json.load(f))
+            except Exception:
+                continue
+            if len(results) >= limit:
+                break
+    return results
+
+def profile_path(profile_id: str, directory: str = None) -> Optional[str]:
+    if not profile_id.replace("-", "").isalnum():
+        return None  # 경로 조작 방지
+    path = os.path.join(directory or PROFILE_DIR, f"{profile_id}.collapsed")
+    return path if os.path.exists(path) else None
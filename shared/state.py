@@ -1,12 +1,260 @@
-from typing import TypedDict, Literal, List
-
-class AgentState(TypedDict):
-    stage: Literal["empathy", "mi", "s_turn", "cbt", "action", "end"]
-    question: str
-    response: str
-    history: List[str]
-    turn: int
-    intro_shown: bool
-    awaiting_s_turn_decision: bool
-    awaiting_preparation_decision: bool
-    awaiting_end_decision: bool
+# 📁 shared/state.py
+# 세션 상태의 단일 정의. main과 모든 에이전트가 이 클래스를 사용합니다.
+# HTTP 경계의 평탄한 history 리스트는 변환 없이 그대로 보관하고, 턴 레코드는 처음 필요할 때 한 번만 만듭니다.
+# drift_trace는 고정 길이 링 버퍼로 보관합니다.
+from collections import deque
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+STAGES = ("empathy", "mi", "cbt1", "cbt2", "cbt3", "end")
+DRIFT_TRACE_LEN = 5  # 가장 긴 읽기 창: 에이전트의 강화 프롬프트 판단 recent(5) (드리프트 리셋은 recent(3))
+
+# ✅ 완료된 한 턴 (사용자 발화, 상담자 응답) — 인스턴스 dict 없는 tuple 레코드
+class Turn(NamedTuple):
+    user: str
+    assistant: str
+
+# ✅ 드리프트 기록 링 버퍼: (단계, 드리프트 여부)
+class DriftTrace:
+    __slots__ = ("_items",)
+
+    def __init__(self, items: Iterable = (), maxlen: int = DRIFT_TRACE_LEN):
+        if isinstance(items, list):
+            items = items[-maxlen:]  # 버려질 항목은 복사하지 않음
+        self._items = deque(((stage, bool(drifted)) for stage, drifted in items or ()), maxlen=maxlen)
+
+    def append(self, item: Tuple[str, bool]):
+        stage, drifted = item
+        self._items.append((stage, bool(drifted)))
+
+    def clear(self):
+        self._items.clear()
+
+    def recent(self, n: int) -> list:
+        if n >= len(self._items):
+            return list(self._items)
+        return list(self._items)[-n:] if n > 0 else []
+
+    def last(self) -> Optional[tuple]:
+        return self._items[-1] if self._items else None
+
+    def to_list(self) -> list:
+        return list(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+# ✅ from_payload 필드 검사 (None은 기본값으로 취급)
+def _optional(data: dict, name: str, kind: type):
+    value = data.get(name)
+    if value is not None and not isinstance(value, kind):
+        raise ValueError(f"{name}의 타입이 잘못되었습니다: {type(value).__name__}")
+    return value
+
+def _int(data: dict, name: str) -> int:
+    value = data.get(name)
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{name}는 정수여야 합니다")
+    return value
+
+def _bool(data: dict, name: str) -> bool:
+    return bool(_optional(data, name, bool))
+
+def _str_list(data: dict, name: str) -> Optional[list]:
+    value = _optional(data, name, list)
+    if value is not None and not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{name}는 문자열 리스트여야 합니다")
+    return value
+
+def _is_trace_entry(entry) -> bool:
+    return (
+        isinstance(entry, (list, tuple)) and len(entry) == 2
+        and entry[0] in STAGES and isinstance(entry[1], bool)
+    )
+
+class SessionState:
+    __slots__ = (
+        "session_id", "stage", "question", "response", "_history", "_turns", "turn", "preset_questions",
+        "_drift_trace", "reset_triggered", "intro_shown", "retry_count", "pending_response", "user_profile", "drift",
+        "awaiting_s_turn_decision", "awaiting_preparation_decision", "user_type", "last_active_time",
+    )
+
+    def __init__(
+        self,
+        session_id: str = "",
+        stage: str = "empathy",
+        question: Optional[str] = None,
+        response: Optional[str] = None,
+        history: Optional[List[str]] = None,
+        turn: int = 0,
+        preset_questions: Optional[List[str]] = None,
+        drift_trace: Iterable = (),
+        reset_triggered: bool = False,
+        intro_shown: bool = False,
+        retry_count: int = 0,
+        pending_response: Optional[str] = None,
+        user_profile: Optional[dict] = None,
+        drift: Optional[dict] = None,
+        awaiting_s_turn_decision: bool = False,
+        awaiting_preparation_decision: bool = False,
+        user_type: Optional[str] = None,
+        last_active_time: Optional[str] = None,
+        **_ignored,
+    ):
+        self.session_id = session_id
+        self.stage = stage
+        self.question = question
+        self.response = response
+        self._history = history if history is not None else []
+        self._turns = None
+        self.turn = turn
+        self.preset_questions = preset_questions if preset_questions is not None else []
+        self._drift_trace = drift_trace if isinstance(drift_trace, DriftTrace) else DriftTrace(drift_trace)
+        self.reset_triggered = reset_triggered
+        self.intro_shown = intro_shown
+        self.retry_count = retry_count
+        self.pending_response = pending_response
+        self.user_profile = user_profile
+        self.drift = drift  # 이전 턴 trailer에서 받은 드리프트 분석 결과
+        # 기존 클라이언트 상태 필드: 서버는 쓰지 않지만 받은 값을 그대로 돌려줌
+        self.awaiting_s_turn_decision = awaiting_s_turn_decision
+        self.awaiting_preparation_decision = awaiting_preparation_decision
+        self.user_type = user_type
+        self.last_active_time = last_active_time
+
+    # ✅ HTTP 요청 본문의 state → 세션 상태 (경계에서 타입 검사 → 잘못되면 ValueError, 리스트는 복사하지 않음)
+    @classmethod
+    def from_payload(cls, data: dict) -> "SessionState":
+        if not isinstance(data, dict):
+            raise ValueError("state는 객체여야 합니다")
+        session_id = data.get("session_id")
+        if not session_id or not isinstance(session_id, (str, int)) or isinstance(session_id, bool):
+            raise ValueError("session_id가 필요합니다")
+        stage = data.get("stage", "empathy")
+        if stage not in STAGES:
+            raise ValueError(f"알 수 없는 단계: {stage}")
+        history = _str_list(data, "history") or []
+        drift_trace = data.get("drift_trace") or ()
+        if not isinstance(drift_trace, (list, tuple)) or not all(_is_trace_entry(e) for e in drift_trace):
+            raise ValueError("drift_trace는 [단계, 드리프트 여부] 쌍의 리스트여야 합니다")
+        return cls(
+            session_id=str(session_id),
+            stage=stage,
+            question=_optional(data, "question", str),
+            response=_optional(data, "response", str),
+            history=history,
+            turn=_int(data, "turn"),
+            preset_questions=_str_list(data, "preset_questions"),
+            drift_trace=drift_trace,
+            reset_triggered=_bool(data, "reset_triggered"),
+            intro_shown=_bool(data, "intro_shown"),
+            retry_count=_int(data, "retry_count"),
+            pending_response=_optional(data, "pending_response", str),
+            user_profile=_optional(data, "user_profile", dict),
+            drift=_optional(data, "drift", dict),
+            awaiting_s_turn_decision=_bool(data, "awaiting_s_turn_decision"),
+            awaiting_preparation_decision=_bool(data, "awaiting_preparation_decision"),
+            user_type=_optional(data, "user_type", str),
+            last_active_time=_optional(data, "last_active_time", str),
+        )
+
+    def to_payload(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "stage": self.stage,
+            "question": self.question,
+            "response": self.response,
+            "history": self._history,
+            "turn": self.turn,
+            "preset_questions": self.preset_questions,
+            "drift_trace": self._drift_trace.to_list(),
+            "reset_triggered": self.reset_triggered,
+            "intro_shown": self.intro_shown,
+            "retry_count": self.retry_count,
+            "pending_response": self.pending_response,
+            "user_profile": self.user_profile,
+            "drift": self.drift,
+            "awaiting_s_turn_decision": self.awaiting_s_turn_decision,
+            "awaiting_preparation_decision": self.awaiting_preparation_decision,
+            "user_type": self.user_type,
+            "last_active_time": self.last_active_time,
+        }
+
+    # ✅ 평탄한 history 형식 (trailer/기존 코드 호환용)
+    @property
+    def history(self) -> List[str]:
+        return self._history
+
+    @history.setter
+    def history(self, value: List[str]):
+        self._history = list(value or [])
+        self._turns = None
+
+    @property
+    def history_len(self) -> int:
+        return len(self._history)
+
+    # ✅ 완료된 턴 레코드 (짝이 없는 마지막 발화는 제외)
+    @property
+    def turns(self) -> List[Turn]:
+        h = self._history
+        if self._turns is None or len(self._turns) != len(h) // 2:
+            self._turns = list(map(Turn._make, zip(h[0::2], h[1::2])))
+        return self._turns
+
+    @property
+    def drift_trace(self) -> DriftTrace:
+        return self._drift_trace
+
+    @drift_trace.setter
+    def drift_trace(self, value: Iterable):
+        self._drift_trace = value if isinstance(value, DriftTrace) else DriftTrace(value)
+
+    def recent_turns(self, last: Optional[int] = None) -> List[Turn]:
+        turns = self.turns
+        if last is None:
+            return turns
+        return turns[-last:] if last > 0 else []
+
+    # ✅ 시스템 프롬프트 + (최근) 완료된 턴 + 현재 질문으로 채팅 메시지 구성
+    def chat_messages(self, system_prompt: str, question: Optional[str] = None, last: Optional[int] = None) -> List[dict]:
+        h = self._history
+        pairs = len(h) // 2
+        start = 0 if last is None else max(0, pairs - last) * 2
+        messages = [{"role": "system", "content": system_prompt}]
+        # 턴 레코드를 만들지 않고 평탄한 history에서 바로 구성
+        for user, assistant in zip(h[start:pairs * 2:2], h[start + 1:pairs * 2:2]):
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": self.question if question is None else question})
+        return messages
+
+    def history_with(self, user: str, reply: str) -> List[str]:
+        return self._history + [user, reply]
+
+    # ✅ 턴 trailer를 다음 턴 상태에 반영 (클라이언트가 하던 일을 서버 측 세션에서 수행)
+    def apply_trailer(self, trailer: dict):
+        self.stage = trailer.get("next_stage", self.stage)
+        self.turn = trailer.get("turn", self.turn)
+        self.history = trailer.get("history", self._history)
+        self.drift_trace = trailer.get("drift_trace", self._drift_trace)
+        self.intro_shown = trailer.get("intro_shown", self.intro_shown)
+        self.response = trailer.get("response", self.response)
+        self.preset_questions = trailer.get("preset_questions", self.preset_questions)
+        self.user_profile = trailer.get("user_profile", self.user_profile)
+        self.reset_triggered = trailer.get("reset_triggered", self.reset_triggered)
+        if "drift" in trailer:
+            self.drift = trailer["drift"]
+
+    def __repr__(self):
+        return f"SessionState(session_id={self.session_id!r}, stage={self.stage!r}, turn={self.turn}, history={len(self._history)})"
+
+# ✅ 기존 이름 호환
+AgentState = SessionState
@@ -0,0 +1,171 @@
+# 📁 shared/stream_cache.py
+# 턴 단위 멱등 스트림: 같은 키로 들어온 중복 요청은 진행 중인 생성에 붙고,
+# 재연결 요청은 버퍼에 쌓인 출력을 지정한 바이트 오프셋부터 다시 받습니다. 완료된 턴은 TTL 동안 보관합니다.
+# 받는 요청이 하나도 없는 채로 TTM_STREAM_CACHE_GRACE초(기본 10)가 지나면 생성을 취소합니다 (버려진 턴이 끝까지 디코딩하지 않게).
+import asyncio, os, time, zlib
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Optional
+
+from shared.logger import logger
+
+class StreamEntry:
+    def __init__(self, key: str):
+        self.key = key
+        self.buffer = bytearray()
+        self.done = False
+        self.created = time.monotonic()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.changed = asyncio.Condition()
+        self.subscribers = 0
+        self.abandon_handle: Optional[asyncio.TimerHandle] = None
+
+    async def append(self, chunk: bytes):
+        async with self.changed:
+            self.buffer += chunk
+            self.changed.notify_all()
+
+    async def finish(self):
+        async with self.changed:
+            self.done = True
+            self.finished = time.monotonic()
+            self.changed.notify_all()
+
+    # ✅ 오프셋부터 버퍼 재생 후, 생성이 끝날 때까지 새 출력을 이어서 전달
+    async def read_from(self, offset: int = 0) -> AsyncIterator[bytes]:
+        pos = max(0, offset)
+        while True:
+            async with self.changed:
+                while pos >= len(self.buffer) and not self.done:
+                    await self.changed.wait()
+                chunk = bytes(self.buffer[pos:])
+                done = self.done
+            if chunk:
+                pos += len(chunk)
+                yield chunk
+            elif done:
+                return
+
+class StreamCache:
+    def __init__(self, ttl: float = None, max_entries: int = None, grace: float = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("TTM_STREAM_CACHE_TTL", 120))
+        self.max_entries = max_entries or int(os.getenv("TTM_STREAM_CACHE_MAX", 1000))
+        self.grace = grace if grace is not None else float(os.getenv("TTM_STREAM_CACHE_GRACE", 10))
+        self.entries: "OrderedDict[str, StreamEntry]" = OrderedDict()
+        self.stats = {
+            "started": 0, "attached": 0, "resumed": 0, "replayed_bytes": 0, "expired": 0, "uncached": 0, "abandoned": 0,
+        }
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [k for k, e in self.entries.items() if e.done and now - e.finished > self.ttl]:
+            del self.entries[key]
+            self.stats["expired"] += 1
+        # 진행 중인 생성은 보존하고 오래된 완료 항목부터 제거
+        while len(self.entries) > self.max_entries:
+            key = next((k for k, e in self.entries.items() if e.done), None)
+            if key is None:
+                break
+            del self.entries[key]
+            self.stats["expired"] += 1
+
+    def get(self, key: str) -> Optional[StreamEntry]:
+        self._purge()
+        return self.entries.get(key)
+
+    # ✅ 키에 해당하는 생성이 없으면 백그라운드 태스크로 시작 (클라이언트 연결이 끊겨도 계속 진행)
+    # keep(전체 출력) → False면 완료 즉시 캐시에서 제거 (붙어 있는 요청은 끝까지 받고, 같은 키의 다음 요청은 새로 생성)
+    def get_or_start(self, key: str, factory: Callable[[], AsyncIterator[bytes]],
+                     keep: Optional[Callable[[bytes], bool]] = None):
+        entry = self.get(key)
+        if entry is not None:
+            self.stats["attached"] += 1
+            return entry, False
+        entry = StreamEntry(key)
+        entry.task = asyncio.create_task(self._produce(entry, factory, keep))
+        self.entries[key] = entry
+        self.stats["started"] += 1
+        self._schedule_abandon(entry)  # 응답이 구독을 시작하기 전에 연결이 끊긴 경우 대비
+        return entry, True
+
+    # ✅ 구독자가 없는 상태가 grace 동안 이어지면 생성 취소 (그 사이 재연결하면 취소하지 않음)
+    def _schedule_abandon(self, entry: StreamEntry):
+        if self.grace <= 0 or entry.done:
+            return
+        if entry.abandon_handle is not None:
+            entry.abandon_handle.cancel()
+        entry.abandon_handle = asyncio.get_running_loop().call_later(self.grace, self._abandon, entry)
+
+    def _abandon(self, entry: StreamEntry):
+        entry.abandon_handle = None
+        if entry.subscribers or entry.done or entry.task is None:
+            return
+        self.stats["abandoned"] += 1
+        logger.info(f"🛑 구독자 없는 스트림 생성 취소: {entry.key}")
+        entry.task.cancel()
+
+    async def _produce(self, entry: StreamEntry, factory, keep=None):
+        failed = True
+        try:
+            async for chunk in factory():
+                if chunk:
+                    await entry.append(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8"))
+            failed = False
+        except Exception:
+            logger.exception(f"❌ 스트림 생성 실패: {entry.key}")
+        finally:
+            if entry.abandon_handle is not None:
+                entry.abandon_handle.cancel()
+                entry.abandon_handle = None
+            await entry.finish()
+            if failed or (keep is not None and not keep(bytes(entry.buffer))):
+                if self.entries.get(entry.key) is entry:
+                    del self.entries[entry.key]
+                self.stats["uncached"] += 1
+
+    def subscribe(self, entry: StreamEntry, offset: int = 0) -> AsyncIterator[bytes]:
+        if offset:
+            self.stats["resumed"] += 1
+        self.stats["replayed_bytes"] += max(0, len(entry.buffer) - max(0, offset))
+        return self._read(entry, offset)
+
+    async def _read(self, entry: StreamEntry, offset: int) -> AsyncIterator[bytes]:
+        entry.subscribers += 1
+        if entry.abandon_handle is not None:
+            entry.abandon_handle.cancel()
+            entry.abandon_handle = None
+        try:
+            async for chunk in entry.read_from(offset):
+                yield chunk
+        finally:
+            entry.subscribers -= 1
+            if not entry.subscribers:
+                self._schedule_abandon(entry)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "inflight": sum(1 for e in self.entries.values() if not e.done),
+        }
+
+# ✅ 턴 키: 클라이언트 Idempotency-Key 우선, 없으면 session_id + 단계 + 턴 + 기록 길이 +
+#    출력에 영향을 주는 상태(질문, 이전 응답, drift_trace, 마지막 턴) 해시 — 드리프트/리셋 판단이 다른 요청은 다른 키
+def turn_key(state, client_key: Optional[str] = None) -> Optional[str]:
+    if client_key:
+        return f"{state.session_id}:key:{client_key}"
+    if not state.session_id:
+        return None
+    parts = [(state.question or "").strip(), state.response or "", repr(state.drift_trace.to_list()), *state.history[-2:]]
+    digest = zlib.crc32("\x00".join(parts).encode("utf-8"))
+    return f"{state.session_id}:{state.stage}:{state.turn}:{state.history_len}:{digest:08x}"
+
+_STREAM_CACHE = None
+
+def get_stream_cache() -> Optional[StreamCache]:
+    global _STREAM_CACHE
+    if os.getenv("TTM_STREAM_CACHE", "1") == "0":
+        return None
+    if _STREAM_CACHE is None:
+        _STREAM_CACHE = StreamCache()
+    return _STREAM_CACHE
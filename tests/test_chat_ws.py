@@ -0,0 +1,90 @@
+# 📁 tests/test_chat_ws.py
+# /chat/ws 세션에서 드리프트가 3턴 연속이면 MI로 리셋되는지 확인 (모델 없이 단계 스트림을 대체)
+import asyncio, json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+import main
+from agents.registry import TRAILER_MARKER
+
+DRIFTED = "네 네 네 네 네 네 네 네"
+
+class FakeWebSocket:
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent: asyncio.Queue = asyncio.Queue()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        await self.sent.put(json.loads(text))
+
+    async def receive(self) -> dict:
+        return await self.incoming.get()
+
+    def push(self, message: dict):
+        self.incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(message, ensure_ascii=False)})
+
+    def disconnect(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+    async def frames_until_end(self) -> list:
+        frames = []
+        while not frames or frames[-1]["type"] not in ("end", "error"):
+            frames.append(await asyncio.wait_for(self.sent.get(), 5))
+        return frames
+
+# 에이전트 대신: 같은 단계에 머무르며 매 턴 드리프트가 나는 응답을 생성
+async def drifting_stream(stage, state, model_path):
+    state.response = DRIFTED
+    history = state.history_with(state.question, DRIFTED)
+    yield DRIFTED.encode("utf-8")
+    yield TRAILER_MARKER + json.dumps({
+        "next_stage": stage, "turn": state.turn + 1, "response": DRIFTED, "question": "", "history": history,
+    }, ensure_ascii=False).encode("utf-8")
+
+async def noop_warm(stage):
+    pass
+
+@pytest.fixture
+def ws_server(monkeypatch):
+    monkeypatch.setattr(main, "model_ready", True)
+    monkeypatch.setattr(main, "model_paths", {s: f"/models/{s}.gguf" for s in main.STAGE_LOADERS})
+    monkeypatch.setattr(main, "stream_stage", drifting_stream)
+    monkeypatch.setattr(main, "warm_stage_model", noop_warm)
+    monkeypatch.setattr(main, "prefetcher", SimpleNamespace(record_use=lambda *a: None, observe=lambda *a: None))
+
+def test_ws_drift_reset(ws_server):
+    async def scenario():
+        ws = FakeWebSocket()
+        server = asyncio.create_task(main.chat_ws(ws))
+        ws.push({"type": "start", "state": {"session_id": "ws-1", "stage": "cbt1"}})
+        assert (await ws.sent.get())["type"] == "ready"
+
+        # 1턴: 이전 응답 없음 → 감지 생략, 2~3턴: trailer의 drift를 재사용해 drift_trace 누적
+        for i in range(3):
+            ws.push({"type": "turn", "question": f"질문 {i}"})
+            end = (await ws.frames_until_end())[-1]
+            assert end["type"] == "end" and end["trailer"]["next_stage"] == "cbt1"
+            assert end["trailer"]["drift"]["drift"]
+
+        # 4턴: 최근 3턴 모두 드리프트 → MI 리셋 (단계 모델은 호출되지 않음)
+        ws.push({"type": "turn", "question": "질문 3"})
+        frames = await ws.frames_until_end()
+        end = frames[-1]
+        assert end["type"] == "end"
+        assert end["trailer"]["next_stage"] == "mi" and end["trailer"]["turn"] == 0
+        assert end["trailer"]["drift_trace"] == [] and end["trailer"]["history"] == []
+        assert "".join(f["text"] for f in frames if f["type"] == "token").startswith("지금 상담을 다시 시작해볼게요.")
+
+        ws.push({"type": "state"})
+        state = (await ws.sent.get())["state"]
+        assert state["stage"] == "mi" and state["drift_trace"] == []
+
+        ws.disconnect()
+        await asyncio.wait_for(server, 5)
+
+    asyncio.run(scenario())
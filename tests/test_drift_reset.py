@@ -0,0 +1,49 @@
+# 📁 tests/test_drift_reset.py
+# 이전 턴 trailer의 드리프트 분석(state.drift)을 재사용해도 drift_trace 기록과 최근 3턴 리셋이 그대로 동작하는지 확인
+import drift.detector as detector
+from drift.detector import analyze_turn_reply, get_precomputed_analysis, run_detect
+from shared.state import AgentState
+
+QUESTION = "요즘 잠을 잘 못 자요"
+DRIFTED = "네 네 네 네 네 네 네 네"
+
+def drifted_state(turn: int, drift_trace=()) -> AgentState:
+    # 클라이언트가 이전 턴 trailer를 그대로 돌려보낸 상태 (response + drift)
+    return AgentState(
+        session_id="s1", stage="cbt1", question="다음 질문", response=DRIFTED,
+        history=[QUESTION, DRIFTED], turn=turn, drift_trace=drift_trace,
+        drift=analyze_turn_reply("cbt1", DRIFTED, QUESTION),
+    )
+
+def test_precomputed_analysis_matches_reply_digest():
+    state = drifted_state(1)
+    assert get_precomputed_analysis(state) is state.drift
+    state.response = "다른 응답"
+    assert get_precomputed_analysis(state) is None
+
+def test_precomputed_turns_still_trigger_reset(monkeypatch):
+    def recompute(state):
+        raise AssertionError("precomputed analysis should be reused")
+    monkeypatch.setattr(detector, "pure_run_detect", recompute)
+
+    trace = []
+    for turn in (1, 2):
+        state = drifted_state(turn, trace)
+        result = run_detect(state, get_precomputed_analysis(state))
+        assert result["drift"] and not result["reset_triggered"]
+        assert result["response"].endswith("천천히 침착하게 다시 생각해서 대답해볼까요?")
+        trace = result["drift_trace"]
+    assert trace == [("cbt1", True), ("cbt1", True)]
+
+    state = drifted_state(3, trace)
+    result = run_detect(state, get_precomputed_analysis(state))
+    assert result["reset_triggered"]
+    assert result["next_stage"] == "mi" and result["turn"] == 0
+    assert result["history"] == [] and result["drift_trace"] == []
+
+def test_run_detect_without_precomputed_analysis():
+    state = drifted_state(1)
+    state.drift = None
+    result = run_detect(state)
+    assert result["drift"]
+    assert state.drift_trace.to_list() == [("cbt1", True)]
@@ -0,0 +1,45 @@
+# 📁 tests/test_state.py
+# HTTP/WebSocket 경계의 state 검사: 타입이 잘못된 필드는 거부하고, 기존 클라이언트 필드는 그대로 돌려줌
+import pytest
+
+from shared.state import DRIFT_TRACE_LEN, AgentState
+
+def payload(**fields) -> dict:
+    return {"session_id": "s1", "stage": "cbt1", **fields}
+
+@pytest.mark.parametrize("fields", [
+    {"session_id": ""},
+    {"stage": "cbt9"},
+    {"history": "질문"},
+    {"history": ["질문", None]},
+    {"turn": "3"},
+    {"turn": True},
+    {"question": 3},
+    {"intro_shown": "false"},
+    {"preset_questions": [1, 2]},
+    {"user_profile": []},
+    {"drift_trace": [["cbt1"]]},
+    {"drift_trace": [["cbt1", "yes"]]},
+    {"drift_trace": [["unknown", True]]},
+    {"drift_trace": {"cbt1": True}},
+])
+def test_from_payload_rejects_bad_types(fields):
+    with pytest.raises(ValueError):
+        AgentState.from_payload(payload(**fields))
+
+def test_from_payload_round_trips_client_fields():
+    data = payload(
+        history=["질문", "응답"], turn=2, drift_trace=[["cbt1", True], ("mi", False)],
+        awaiting_s_turn_decision=True, awaiting_preparation_decision=True,
+        user_type="student", last_active_time="2026-10-19T06:00:00",
+    )
+    out = AgentState.from_payload(data).to_payload()
+    assert out["awaiting_s_turn_decision"] and out["awaiting_preparation_decision"]
+    assert out["user_type"] == "student" and out["last_active_time"] == "2026-10-19T06:00:00"
+    assert out["drift_trace"] == [("cbt1", True), ("mi", False)]
+    assert out["history"] == ["질문", "응답"] and out["turn"] == 2
+
+def test_drift_trace_keeps_the_longest_read_window():
+    state = AgentState.from_payload(payload(drift_trace=[["cbt1", i % 2 == 0] for i in range(12)]))
+    assert len(state.drift_trace) == DRIFT_TRACE_LEN
+    assert len(state.drift_trace.recent(5)) == 5
@@ -0,0 +1,59 @@
+# 📁 tests/test_stream_cache.py
+# 구독자 없는 생성 취소(grace)와 상태를 반영한 턴 키
+import asyncio
+
+from shared.state import AgentState
+from shared.stream_cache import StreamCache, turn_key
+
+def test_abandoned_stream_is_cancelled_after_grace():
+    async def scenario():
+        cache = StreamCache(grace=0.05)
+        produced = []
+
+        async def slow():
+            for i in range(100):
+                produced.append(i)
+                yield b"x"
+                await asyncio.sleep(0.01)
+
+        entry, started = cache.get_or_start("k", slow)
+        assert started
+        reader = cache.subscribe(entry)
+        assert await reader.__anext__() == b"x"
+        await reader.aclose()  # 클라이언트 연결 끊김
+        await asyncio.wait([entry.task], timeout=1)
+        assert entry.task.cancelled()
+        assert entry.done and len(produced) < 100
+        assert cache.stats["abandoned"] == 1 and cache.get("k") is None
+
+    asyncio.run(scenario())
+
+def test_reconnect_within_grace_keeps_generating():
+    async def scenario():
+        cache = StreamCache(grace=0.2)
+
+        async def short():
+            for _ in range(5):
+                yield b"y"
+                await asyncio.sleep(0.02)
+
+        entry, _ = cache.get_or_start("k", short)
+        reader = cache.subscribe(entry)
+        await reader.__anext__()
+        await reader.aclose()
+        await asyncio.sleep(0.05)
+        chunks = [c async for c in cache.subscribe(entry, 1)]
+        assert b"".join(chunks) == b"yyyy"
+        assert cache.stats["abandoned"] == 0
+
+    asyncio.run(scenario())
+
+def test_turn_key_includes_drift_state():
+    base = dict(session_id="s1", stage="cbt1", question="질문", response="응답", history=["q", "응답"], turn=2)
+    calm = AgentState(**base, drift_trace=[("cbt1", False)])
+    drifting = AgentState(**base, drift_trace=[("cbt1", True)])
+    other_reply = AgentState(**{**base, "response": "다른 응답"}, drift_trace=[("cbt1", False)])
+    assert turn_key(calm) == turn_key(AgentState(**base, drift_trace=[("cbt1", False)]))
+    assert turn_key(calm) != turn_key(drifting)
+    assert turn_key(calm) != turn_key(other_reply)
+    assert turn_key(calm, "abc") == "s1:key:abc"